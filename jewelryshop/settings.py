@@ -57,9 +57,11 @@ UNFOLD = {
 # Middleware
 # ------------------------
 MIDDLEWARE = [
+    "store.middleware.RequestMetricsMiddleware",  # first, so its total covers the rest
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # must be after SecurityMiddleware
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "store.middleware.ReplicaRoutingMiddleware",  # must be after SessionMiddleware
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -78,7 +80,8 @@ WSGI_APPLICATION = "jewelryshop.wsgi.application"
 # ------------------------
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django's backend plus render timing for RequestMetricsMiddleware
+        "BACKEND": "store.instrumentation.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -97,10 +100,116 @@ TEMPLATES = [
 # ------------------------
 # Database (SQLite for demo)
 # ------------------------
+# Tuned for several gunicorn workers writing carts and orders at once:
+# - WAL lets readers run while one connection writes, and with
+#   synchronous=NORMAL a commit no longer waits for an fsync. WAL is a
+#   setting of the database file, not of a connection, so it is switched on
+#   once with `manage.py enable_wal` after migrate when deploying; the
+#   pragmas below only hold for the connection that runs them.
+# - Every transaction starts as BEGIN IMMEDIATE, so it queues for the write
+#   lock up front. A deferred transaction that reads first and writes later
+#   fails with "database is locked" without waiting.
+# - "timeout" is the busy timeout: how long a writer waits for the lock.
+# Whatever still fails is retried by store.db.retry_on_locked.
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -20000,  # KiB, i.e. 20 MB of page cache per connection
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # DATABASE_PATH points benchmarks at a scratch database,
+        # see `manage.py generate_dataset`.
+        "NAME": os.environ.get("DATABASE_PATH", BASE_DIR / "db.sqlite3"),
+        # Persistent connections only pay off under gunicorn; runserver
+        # opens a new thread, hence a new connection, for every request.
+        "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", "0" if DEBUG else "600")),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", "20")),
+            "init_command": "; ".join(
+                f"PRAGMA {name} = {value}" for name, value in SQLITE_PRAGMAS.items()
+            ),
+        },
+    }
+}
+
+# ------------------------
+# Read replica (see store/routers.py)
+# ------------------------
+# Catalog and analytics reads go to the "replica" alias when one is
+# configured. Locally that is a read-only copy of db.sqlite3 refreshed by
+# `manage.py sync_replica`; point it at a Postgres replica in production.
+# Replica connections are not kept open, so each request sees the latest copy.
+DATABASE_ROUTERS = ["store.routers.CatalogReplicaRouter"]
+
+REPLICA_PATH = os.environ.get("REPLICA_PATH")
+if REPLICA_PATH:
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": f"file:{Path(REPLICA_PATH).resolve()}?mode=ro",
+        "CONN_MAX_AGE": 0,
+        "OPTIONS": {
+            "uri": True,
+            "init_command": "; ".join(
+                f"PRAGMA {name} = {value}"
+                for name, value in SQLITE_PRAGMAS.items()
+                if name in ("cache_size", "mmap_size", "temp_store")
+            ),
+        },
+        "TEST": {"MIRROR": "default"},
+    }
+
+# After a write, the user reads from the primary for this many seconds.
+# Keep it above the replica lag (the sync_replica interval locally).
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "60"))
+
+# ------------------------
+# Cache (catalog cache, see store/cache.py)
+# ------------------------
+# File based so every gunicorn worker sees the same catalog version;
+# set CACHE_BACKEND to a Redis/Memcached backend when one is available.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", str(BASE_DIR / "cache")),
+    }
+}
+# The file and local memory caches cull a third of their entries past
+# MAX_ENTRIES; the default of 300 is soon reached by the catalog, page and
+# cart count entries. (Redis and Memcached pass OPTIONS to their client.)
+if CACHES["default"]["BACKEND"].endswith(("FileBasedCache", "LocMemCache")):
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 20000}
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Anonymous catalog pages (store/page_cache.py) are kept this long and
+# revalidated by the catalog version; browsers and the CDN may show their
+# copy for PAGE_STALE_WHILE_REVALIDATE seconds while revalidating.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+PAGE_STALE_WHILE_REVALIDATE = 30
+# Identifies the deployed code and templates (e.g. the git commit). It is
+# part of the page version and ETag, so a deploy re-renders stored pages.
+PAGE_CACHE_RELEASE = os.environ.get("RELEASE", "")
+
+# ------------------------
+# Background tasks (store/task_queue.py, run with `manage.py run_task_worker`)
+# ------------------------
+TASKS = {
+    "default": {
+        "BACKEND": "store.task_queue.DatabaseBackend",
+        "QUEUES": ["default", "email", "images"],
+        "OPTIONS": {
+            "MAX_ATTEMPTS": 3,
+            "RETRY_BACKOFF": 10,
+            "LEASE": 600,
+        },
     }
 }
 
@@ -143,6 +252,9 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Processes used by `manage.py build_image_derivatives` (store/images.py)
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get("IMAGE_DERIVATIVE_WORKERS", "2"))
+
 # ------------------------
 # Default primary key field type
 # ------------------------
@@ -153,6 +265,44 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ------------------------
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+# ------------------------
+# Logging
+# ------------------------
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "store": {
+            "handlers": ["console"],
+            "level": os.environ.get("STORE_LOG_LEVEL", "WARNING"),
+        },
+    },
+}
+
+# ------------------------
+# Request metrics (see store/middleware.py RequestMetricsMiddleware)
+# ------------------------
+# Share of requests (0-1) that get a Server-Timing header and a log line
+# with their query count, database, template and context processor time.
+REQUEST_METRICS_SAMPLE_RATE = float(
+    os.environ.get("REQUEST_METRICS_SAMPLE_RATE", "1" if DEBUG else "0")
+)
+# The same SQL this many times in one request is logged as a likely N+1.
+REQUEST_METRICS_REPEATED_QUERIES = 3
+
+# ------------------------
+# Prometheus metrics (see store/metrics.py, scraped at /metrics)
+# ------------------------
+# Every process keeps its counters in a file here and /metrics adds them
+# up, so all gunicorn workers are counted. Off unless set: point it at a
+# writable directory local to the host (e.g. /tmp/jewelryshop-metrics).
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+# Bearer token scrapers must send; without one only localhost may scrape.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 # ------------------------
 # Security for proxy headers (Render)
 # ------------------------
@@ -0,0 +1,97 @@
+$(function () {
+
+    /* ===============================================================
+         CART API
+         Quantity, remove and add-to-cart clicks go through the JSON
+         cart API and patch the page in place; without JS the links and
+         forms still fall back to the full-page views.
+      =============================================================== */
+    // Cached catalog pages carry no token and set no cookie of their own:
+    // use the cookie or the page's form token, else ask the token endpoint.
+    var csrfCookie = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    var csrfToken = csrfCookie ? decodeURIComponent(csrfCookie[1])
+        : $('[name=csrfmiddlewaretoken]').first().val();
+
+    function withToken(tokenUrl) {
+        if (csrfToken || !tokenUrl) {
+            return $.Deferred().resolve(csrfToken).promise();
+        }
+        return $.getJSON(tokenUrl).then(function (response) {
+            csrfToken = response.token;
+            return csrfToken;
+        });
+    }
+
+    function cartRequest(url, data, tokenUrl) {
+        return withToken(tokenUrl).then(function (token) {
+            return $.ajax({
+                url: url,
+                method: 'POST',
+                data: data || {},
+                headers: { 'X-CSRFToken': token }
+            });
+        });
+    }
+
+    function money(value) {
+        return '$' + Number(value).toLocaleString(undefined, {
+            minimumFractionDigits: 2,
+            maximumFractionDigits: 2
+        });
+    }
+
+    function renderTotals(cart) {
+        $('#cart-count').text('(' + cart.count + ')');
+        $('[data-cart-amount]').text(money(cart.amount));
+        $('[data-cart-total]').text(money(cart.total));
+        if (cart.count === 0 && $('[data-cart-line]').length) {
+            window.location.reload();
+        }
+    }
+
+    function renderLine(row, line) {
+        if (!line) {
+            row.remove();
+            return;
+        }
+        row.find('[data-cart-quantity]').val(line.quantity);
+        row.find('[data-cart-line-total]').text(money(line.line_total));
+    }
+
+    // cart.html: plus / minus / remove
+    $('[data-cart-line]').on('click', '[data-cart-delta], [data-cart-remove]', function (event) {
+        event.preventDefault();
+        var link = $(this);
+        var row = link.closest('[data-cart-line]');
+        var request = link.is('[data-cart-remove]')
+            ? cartRequest(row.data('remove-url'))
+            : cartRequest(row.data('quantity-url'), { delta: link.data('cart-delta') });
+
+        request.done(function (response) {
+            renderLine(row, link.is('[data-cart-remove]') ? null : response.line);
+            renderTotals(response.cart);
+        }).fail(function () {
+            window.location.href = link.attr('href');
+        });
+    });
+
+    // detail.html and listings: add to cart without leaving the page
+    $('form[data-cart-add]').on('submit', function (event) {
+        event.preventDefault();
+        var form = $(this);
+        var quantity = parseInt($('input[name=quantity]').val(), 10) || 1;
+
+        cartRequest(form.data('cart-add'), {
+            product_id: form.find('[name=prod_id]').val(),
+            quantity: quantity
+        }, form.data('cart-token')).done(function (response) {
+            renderTotals(response.cart);
+            form.find('button[type=submit]').text('Added to Cart');
+        }).fail(function (xhr) {
+            if (xhr.status === 401) {
+                form.off('submit').trigger('submit');
+            }
+        });
+    });
+
+});
@@ -1,11 +1,67 @@
+from datetime import date, timedelta
+
 from django.contrib import admin
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from django.utils import timezone
 from django.urls import path
 from django.shortcuts import redirect
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
 from django.contrib import messages
-from .models import Address, Category, Product, Cart, Order
+from django.contrib.auth.models import User
+from django.db.models import Prefetch, Q
+
+from .models import (
+    STATUS_CHOICES, Address, Category, Product, Cart, Order, OrderItem, OrderStatusChange, SalesDashboard,
+)
+from .catalog_io import FORMATS, export_lines, guess_format
+from .images import derivative_url
+from .order_export import FORMATS as ORDER_EXPORT_FORMATS, export_orders, order_lines
+from .order_states import InvalidTransition, transition
+from .pagination import EstimatedCountPaginator
+from .sales_rollups import sales_report
+from .search import get_search_backend
+from .tasks import import_catalog
+
+
+def indexed_search(queryset, search_term, product_condition):
+    """
+    Changelist search for the large order/cart tables without LIKE '%term%'
+    scans: '#123' or '123' is a primary key lookup, usernames match by prefix
+    on the unique username index (a range, not LIKE, so case-sensitive),
+    emails match exactly, and product titles go through the full-text index
+    as a subquery. The big table is then only probed through its indexed
+    foreign keys.
+    """
+    term = search_term.strip()
+    if term.lstrip('#').isdigit():
+        return queryset.filter(pk=int(term.lstrip('#')))
+    users = User.objects.filter(
+        Q(username__gte=term, username__lt=term + '\uffff') | Q(email__iexact=term)
+    ).values('id')
+    products = get_search_backend().match_ids(term)
+    return queryset.filter(Q(user__in=users) | product_condition(products))
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings shared by the order and cart admins."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    search_help_text = 'Order number, username prefix, exact email or product title.'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return indexed_search(queryset, search_term, self.product_condition), False
+
+    def product_condition(self, products):
+        """Q for the rows of any of products (ids or a subquery of ids)."""
+        return Q(product__in=products)
+
 
 @admin.register(Address)
 class AddressAdmin(admin.ModelAdmin):
@@ -28,22 +84,103 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('category', 'is_active', 'is_featured')
     search_fields = ('title', 'sku', 'short_description')
     prepopulated_fields = {'slug': ('title',)}
+    actions = ['export_csv', 'export_jsonl']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of LIKE '%term%' over three columns.
+        # Inactive products are not indexed, so fall back to LIKE for them.
+        if not search_term or request.GET.get('is_active__exact') == '0':
+            return super().get_search_results(request, queryset, search_term)
+        return get_search_backend().filter_queryset(queryset, search_term), False
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='product-import'),
+            path('export/', self.admin_site.admin_view(self.export_view), name='product-export'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        # the import itself runs in a task worker (store.tasks.import_catalog)
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        upload = request.FILES.get('catalog')
+        if request.method == 'POST' and upload:
+            fmt = request.POST.get('format') or guess_format(upload.name)
+            name = default_storage.save(f'imports/{upload.name}', upload)
+            import_catalog.enqueue(name, fmt)
+            messages.success(request, f'{upload.name} queued for import as {fmt.upper()}.')
+            return redirect('admin:store_product_changelist')
+        return TemplateResponse(request, 'admin/store/product/import.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Import products',
+            'opts': self.model._meta,
+            'formats': FORMATS,
+        })
+
+    def export_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        return self.export_response(Product.objects.all(), request.GET.get('format', 'csv'))
+
+    def export_response(self, queryset, fmt):
+        if fmt not in FORMATS:
+            fmt = 'csv'
+        response = StreamingHttpResponse(
+            export_lines(fmt, queryset),
+            content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
+    def export_csv(self, request, queryset):
+        return self.export_response(queryset, 'csv')
+    export_csv.short_description = 'Export selected products as CSV'
+
+    def export_jsonl(self, request, queryset):
+        return self.export_response(queryset, 'jsonl')
+    export_jsonl.short_description = 'Export selected products as JSONL'
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     list_display = ('user', 'product', 'quantity', 'total_price', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('user__username', 'product__title')
+    search_help_text = 'Username prefix, exact email or product title.'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'product')
+
+
+class OrderStatusChangeInline(admin.TabularInline):
+    model = OrderStatusChange
+    fields = ('from_status', 'to_status', 'changed_by', 'changed_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    fields = ('product', 'quantity', 'unit_price', 'line_total')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = (
         'order_id_display', 
         'user', 
         'product_name',
-        'quantity', 
+        'quantity_display', 
         'total_amount_display', 
         'payment_method',
         'payment_proof_thumbnail',
@@ -64,14 +201,13 @@ class OrderAdmin(admin.ModelAdmin):
         'id',
         'user__username',
         'user__email',
-        'product__title'
+        'items__product__title'
     )
     
     readonly_fields = (
         'user', 
         'address', 
-        'product', 
-        'quantity', 
+        'total_amount', 
         'payment_method',
         'ordered_date',
         'payment_proof_image',
@@ -83,7 +219,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('order_summary',)
         }),
         ('Order Information', {
-            'fields': ('user', 'address', 'product', 'quantity', 'ordered_date')
+            'fields': ('user', 'address', 'total_amount', 'ordered_date')
         }),
         ('Payment Information', {
             'fields': (
@@ -100,6 +236,8 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
+    inlines = [OrderItemInline, OrderStatusChangeInline]
+
     actions = [
         'verify_payment', 
         'reject_payment',
@@ -107,9 +245,40 @@ class OrderAdmin(admin.ModelAdmin):
         'mark_as_packed',
         'mark_as_shipped',
         'mark_as_delivered',
-        'cancel_order'
+        'cancel_order',
+        'export_csv',
     ]
     
+    def get_queryset(self, request):
+        # one extra query loads every visible order's lines with the product
+        # titles, so the page costs the same number of queries at any size
+        return super().get_queryset(request).select_related('user').prefetch_related(
+            Prefetch(
+                'items',
+                queryset=OrderItem.objects.select_related('product').only(
+                    'order_id', 'quantity', 'unit_price', 'product__title'
+                ),
+            )
+        )
+
+    def product_condition(self, products):
+        return Q(id__in=OrderItem.objects.filter(product__in=products).values('order_id'))
+
+    def save_model(self, request, obj, form, change):
+        # status edits on the change form go through the state machine too
+        if not change or 'status' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+        new_status, obj.status = obj.status, form.initial['status']
+        super().save_model(request, obj, form, change)
+        if transition(Order.objects.filter(pk=obj.pk), new_status, request.user):
+            obj.status = new_status
+        else:
+            self.message_user(
+                request,
+                f'Status not changed: {obj.status} orders cannot move to {new_status}.',
+                level=messages.ERROR
+            )
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -117,36 +286,72 @@ class OrderAdmin(admin.ModelAdmin):
             path('<int:order_id>/reject-payment/', self.admin_site.admin_view(self.reject_payment_view), name='order-reject-payment'),
             path('<int:order_id>/accept-order/', self.admin_site.admin_view(self.accept_order_view), name='order-accept'),
             path('<int:order_id>/update-status/<str:new_status>/', self.admin_site.admin_view(self.update_status_view), name='order-update-status'),
+            path('export/', self.admin_site.admin_view(self.export_view), name='order-export'),
         ]
         return custom_urls + urls
+
+    def export_view(self, request):
+        # without a format, show the filter form; with one, stream the file
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        fmt = request.GET.get('format')
+        errors = []
+        dates = {}
+        for name in ('since', 'until'):
+            value = request.GET.get(name)
+            try:
+                dates[name] = date.fromisoformat(value) if value else None
+            except ValueError:
+                errors.append(f'Invalid {name} date: {value}')
+        statuses = request.GET.getlist('status')
+        if fmt in ORDER_EXPORT_FORMATS and not errors:
+            lines = order_lines(dates['since'], dates['until'], statuses)
+            return self.export_response(lines, fmt)
+        return TemplateResponse(request, 'admin/store/order/export.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Export orders',
+            'opts': self.model._meta,
+            'errors': errors,
+            'formats': ORDER_EXPORT_FORMATS,
+            'statuses': [value for value, label in STATUS_CHOICES],
+            'selected_statuses': statuses,
+            'since': request.GET.get('since', ''),
+            'until': request.GET.get('until', ''),
+        })
+
+    def export_response(self, lines, fmt):
+        response = StreamingHttpResponse(
+            export_orders(fmt, lines),
+            content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+        return response
     
     def verify_payment_view(self, request, order_id):
-        order = Order.objects.get(pk=order_id)
-        order.payment_status = 'Verified'
-        order.payment_verified_at = timezone.now()
-        order.save()
+        Order.objects.filter(pk=order_id).update(
+            payment_status='Verified',
+            payment_verified_at=timezone.now()
+        )
         messages.success(request, f'Payment for Order #{order_id} has been verified. ✓')
         return redirect('admin:store_order_changelist')
     
     def reject_payment_view(self, request, order_id):
-        order = Order.objects.get(pk=order_id)
-        order.payment_status = 'Rejected'
-        order.save()
+        Order.objects.filter(pk=order_id).update(payment_status='Rejected')
         messages.warning(request, f'Payment for Order #{order_id} has been rejected. ✗')
         return redirect('admin:store_order_changelist')
     
     def accept_order_view(self, request, order_id):
-        order = Order.objects.get(pk=order_id)
-        order.status = 'Accepted'
-        order.save()
-        messages.success(request, f'Order #{order_id} has been accepted. ✓')
-        return redirect('admin:store_order_changelist')
+        return self.update_status_view(request, order_id, 'Accepted')
     
     def update_status_view(self, request, order_id, new_status):
-        order = Order.objects.get(pk=order_id)
-        order.status = new_status
-        order.save()
-        messages.success(request, f'Order #{order_id} status updated to {new_status}. ✓')
+        try:
+            moved = transition(Order.objects.filter(pk=order_id), new_status, request.user)
+        except InvalidTransition:
+            moved = 0
+        if moved:
+            messages.success(request, f'Order #{order_id} status updated to {new_status}. ✓')
+        else:
+            messages.error(request, f'Order #{order_id} cannot be moved to {new_status} from its current status.')
         return redirect('admin:store_order_changelist')
     
     # Custom display methods
@@ -156,9 +361,12 @@ class OrderAdmin(admin.ModelAdmin):
     order_id_display.admin_order_field = 'id'
     
     def product_name(self, obj):
-        return obj.product.title
-    product_name.short_description = 'Product'
-    product_name.admin_order_field = 'product__title'
+        return ', '.join(item.product.title for item in obj.items.all())
+    product_name.short_description = 'Products'
+
+    def quantity_display(self, obj):
+        return obj.total_quantity
+    quantity_display.short_description = 'Quantity'
     
     def total_amount_display(self, obj):
         return format_html('<strong>${}</strong>', obj.total_amount)
@@ -214,11 +422,14 @@ class OrderAdmin(admin.ModelAdmin):
     
     def payment_proof_thumbnail(self, obj):
         if obj.payment_proof:
+            # 120px derivative (store.images) instead of the full screenshot;
+            # falls back to the original until the derivative has been built
             return format_html(
                 '<a href="{}" target="_blank" title="Click to view full size">'
-                '<img src="{}" style="width: 60px; height: 60px; object-fit: cover; border: 2px solid #007bff; border-radius: 4px; cursor: pointer;"/>'
+                '<img src="{}" loading="lazy" onerror="this.onerror=null; this.src=\'{}\';" style="width: 60px; height: 60px; object-fit: cover; border: 2px solid #007bff; border-radius: 4px; cursor: pointer;"/>'
                 '</a>',
                 obj.payment_proof.url,
+                derivative_url(obj.payment_proof, 'thumb'),
                 obj.payment_proof.url
             )
         return format_html('<span style="color: {};">{}</span>', '#999', '—')
@@ -283,29 +494,38 @@ class OrderAdmin(admin.ModelAdmin):
     payment_proof_image.short_description = 'Payment Proof Screenshot'
     
     def order_summary(self, obj):
+        items_html = format_html_join(
+            '',
+            '<tr><td style="padding: 8px;">{}</td><td style="padding: 8px;">{}</td>'
+            '<td style="padding: 8px;">${}</td><td style="padding: 8px;">${}</td></tr>',
+            (
+                (item.product.title, item.quantity, item.unit_price, item.line_total)
+                for item in obj.items.all()
+            ),
+        )
         return format_html(
             '<div style="background: #f8f9fa; padding: 20px; border-radius: 8px; border-left: 4px solid #007bff;">'
             '<h3 style="margin-top: 0; color: #007bff;">Order #{}</h3>'
             '<table style="width: 100%; border-collapse: collapse;">'
             '<tr><td style="padding: 8px; font-weight: bold; width: 150px;">Customer:</td><td style="padding: 8px;">{}</td></tr>'
             '<tr><td style="padding: 8px; font-weight: bold;">Email:</td><td style="padding: 8px;">{}</td></tr>'
-            '<tr><td style="padding: 8px; font-weight: bold;">Product:</td><td style="padding: 8px;">{}</td></tr>'
-            '<tr><td style="padding: 8px; font-weight: bold;">Quantity:</td><td style="padding: 8px;">{}</td></tr>'
-            '<tr><td style="padding: 8px; font-weight: bold;">Unit Price:</td><td style="padding: 8px;">${}</td></tr>'
             '<tr><td style="padding: 8px; font-weight: bold;">Total Amount:</td><td style="padding: 8px; font-size: 18px; color: #28a745;"><strong>${}</strong></td></tr>'
             '<tr><td style="padding: 8px; font-weight: bold;">Shipping Address:</td><td style="padding: 8px;">{}, {}, {}</td></tr>'
             '</table>'
+            '<table style="width: 100%; border-collapse: collapse; margin-top: 10px;">'
+            '<tr><th style="padding: 8px; text-align: left;">Product</th><th style="padding: 8px; text-align: left;">Quantity</th>'
+            '<th style="padding: 8px; text-align: left;">Unit Price</th><th style="padding: 8px; text-align: left;">Line Total</th></tr>'
+            '{}'
+            '</table>'
             '</div>',
             obj.id,
             obj.user.get_full_name() or obj.user.username,
             obj.user.email,
-            obj.product.title,
-            obj.quantity,
-            obj.product.price,
             obj.total_amount,
             obj.address.locality,
             obj.address.city,
-            obj.address.state
+            obj.address.state,
+            items_html,
         )
     order_summary.short_description = 'Order Details'
     
@@ -333,28 +553,79 @@ class OrderAdmin(admin.ModelAdmin):
         )
     reject_payment.short_description = '✗ Reject Payment'
     
-    # Order status actions
+    # Order status actions, validated and audited by store.order_states
+    def apply_transition(self, request, queryset, new_status, message, level=messages.SUCCESS):
+        selected = queryset.count()
+        updated = transition(queryset, new_status, request.user)
+        self.message_user(request, message.format(updated), level=level)
+        if updated < selected:
+            self.message_user(
+                request,
+                f'{selected - updated} order(s) skipped: not allowed from their current status.',
+                level=messages.WARNING
+            )
+
     def accept_order(self, request, queryset):
-        updated = queryset.filter(status='Pending').update(status='Accepted')
-        self.message_user(request, f'{updated} order(s) accepted. ✓', level=messages.SUCCESS)
+        self.apply_transition(request, queryset, 'Accepted', '{} order(s) accepted. ✓')
     accept_order.short_description = '✓ Accept Order'
     
     def mark_as_packed(self, request, queryset):
-        updated = queryset.update(status='Packed')
-        self.message_user(request, f'{updated} order(s) marked as packed. 📦', level=messages.SUCCESS)
+        self.apply_transition(request, queryset, 'Packed', '{} order(s) marked as packed. 📦')
     mark_as_packed.short_description = '📦 Mark as Packed'
     
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.update(status='On The Way')
-        self.message_user(request, f'{updated} order(s) marked as shipped. 🚚', level=messages.SUCCESS)
+        self.apply_transition(request, queryset, 'On The Way', '{} order(s) marked as shipped. 🚚')
     mark_as_shipped.short_description = '🚚 Mark as Shipped'
     
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.update(status='Delivered')
-        self.message_user(request, f'{updated} order(s) marked as delivered. ✓', level=messages.SUCCESS)
+        self.apply_transition(request, queryset, 'Delivered', '{} order(s) marked as delivered. ✓')
     mark_as_delivered.short_description = '✓ Mark as Delivered'
     
     def cancel_order(self, request, queryset):
-        updated = queryset.update(status='Cancelled')
-        self.message_user(request, f'{updated} order(s) cancelled. ✗', level=messages.WARNING)
-    cancel_order.short_description = '✗ Cancel Order'
\ No newline at end of file
+        self.apply_transition(request, queryset, 'Cancelled', '{} order(s) cancelled. ✗', messages.WARNING)
+    cancel_order.short_description = '✗ Cancel Order'
+
+    def export_csv(self, request, queryset):
+        return self.export_response(order_lines(orders=queryset), 'csv')
+    export_csv.short_description = '⬇ Export selected orders as CSV'
+
+
+@admin.register(SalesDashboard)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    """
+    Revenue by day, category, product and payment method/status. Reads only
+    the daily rollup tables (store.sales_rollups), so it costs the same at
+    any order volume.
+    """
+    PERIODS = (7, 30, 90, 365)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in self.PERIODS:
+            days = 30
+        until = timezone.localdate()
+        since = until - timedelta(days=days - 1)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales dashboard',
+            'opts': self.model._meta,
+            'periods': self.PERIODS,
+            'days': days,
+            'since': since,
+            'until': until,
+            'report': sales_report(since, until),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/store/sales_dashboard.html', context)
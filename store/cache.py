@@ -0,0 +1,142 @@
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .routers import use_primary
+
+# Every catalog cache key embeds the current catalog version. Product/Category
+# edits bump the version (see store.signals), which orphans all old entries at
+# once instead of having to know which keys an edit affects.
+CATALOG_VERSION_KEY = 'store:catalog:version'
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60 * 24)
+
+CART_COUNT_TIMEOUT = 60 * 60 * 24 * 7
+
+# Per-process hit/miss counters, see catalog_cache_stats().
+stats = Counter()
+
+# Process-local copies of small, hot catalog values (the navbar menu), tagged
+# with the catalog version they were built for.
+_local = {}
+
+_MISSING = object()
+
+
+def _new_version():
+    # Versions start from the clock, not 1: when the cache culls the version
+    # key, the next one must not repeat a version old entries were stored under.
+    return time.time_ns()
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # add() so two workers starting at once agree on the first version
+        seed = _new_version()
+        cache.add(CATALOG_VERSION_KEY, seed, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, seed)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # key was evicted or never set
+        version = _new_version()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def catalog_key(name, *parts):
+    suffix = ':'.join(str(part) for part in parts)
+    return f'store:catalog:v{get_catalog_version()}:{name}:{suffix}'
+
+
+def cached_catalog(name, builder, *parts, keep=None):
+    """
+    Return builder() from the catalog cache, building and storing it on a miss.
+    Querysets are evaluated to lists so the cached value never hits the DB.
+    Misses are built from the primary: the entry lives under the current
+    version for a day, so it must not be filled from a replica that lags.
+    None is not stored, so lookups by a client-chosen key (an unknown
+    category slug) cannot fill the cache and push out real entries; keep,
+    if given, decides instead which built values are stored.
+    """
+    key = catalog_key(name, *parts)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        stats['hits'] += 1
+        metrics.inc('store_catalog_cache_lookups_total', result='hit')
+        return value
+
+    stats['misses'] += 1
+    metrics.inc('store_catalog_cache_lookups_total', result='miss')
+    with use_primary():
+        value = builder()
+        if hasattr(value, '_fetch_all'):
+            value = list(value)
+    if (value is not None) if keep is None else keep(value):
+        cache.set(key, value, timeout=CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def local_catalog(name, builder):
+    """
+    Like cached_catalog() but memoized in this process, so a warm worker only
+    pays the version lookup. Use for small values needed on every page.
+    """
+    version = get_catalog_version()
+    entry = _local.get(name)
+    if entry is not None and entry[0] == version:
+        stats['hits'] += 1
+        metrics.inc('store_catalog_cache_lookups_total', result='hit')
+        return entry[1]
+    value = cached_catalog(name, builder)
+    _local[name] = (version, value)
+    return value
+
+
+# ---------- CART BADGE ----------
+# The Cart signals (store.signals) drop a user's count whenever a line is
+# saved or deleted, including admin edits and cascades from Product/User;
+# bulk writes, which send no signals, call clear_cart_count() themselves.
+
+def cart_count_key(user_id):
+    return f'store:cart-count:{user_id}'
+
+
+def get_cart_count(user, counter):
+    """
+    Number of cart lines for the navbar badge. counter() runs the COUNT query
+    and is only called when the denormalized value is missing.
+    """
+    key = cart_count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = counter()
+        cache.set(key, count, timeout=CART_COUNT_TIMEOUT)
+    return count
+
+
+def clear_cart_count(user_id):
+    cache.delete(cart_count_key(user_id))
+
+
+def set_cart_count(user, count):
+    cache.set(cart_count_key(user.pk), count, timeout=CART_COUNT_TIMEOUT)
+
+
+def catalog_cache_stats():
+    lookups = stats['hits'] + stats['misses']
+    return {
+        'pid': os.getpid(),
+        'version': get_catalog_version(),
+        'hits': stats['hits'],
+        'misses': stats['misses'],
+        'hit_rate': round(stats['hits'] / lookups, 4) if lookups else None,
+    }
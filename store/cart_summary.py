@@ -0,0 +1,60 @@
+import decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+from .models import Cart
+
+# Cart, checkout, the cart API and the navbar all read the cart through this
+# module: one joined query for the lines (line totals computed in SQL) and one
+# aggregate for the count and subtotal, whatever the size of the cart.
+SHIPPING_AMOUNT = decimal.Decimal('10.00')
+CENTS = decimal.Decimal('0.01')
+
+LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * F('product__price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+class CartSummary:
+
+    def __init__(self, lines, count, amount):
+        self.lines = lines
+        self.count = count
+        self.amount = decimal.Decimal(amount or 0).quantize(CENTS)
+        self.shipping = SHIPPING_AMOUNT
+        self.total = self.amount + self.shipping
+
+    def __bool__(self):
+        return bool(self.count)
+
+
+def cart_lines(user):
+    """The user's cart lines with their products and an SQL line_total."""
+    return (
+        Cart.objects.filter(user=user)
+        .select_related('product')
+        .annotate(line_total=LINE_TOTAL)
+        .order_by('id')
+    )
+
+
+def cart_totals(user):
+    """{'count': lines, 'amount': subtotal} in a single aggregate query."""
+    return Cart.objects.filter(user=user).aggregate(
+        count=Count('id'),
+        amount=Sum(LINE_TOTAL),
+    )
+
+
+def cart_summary(user):
+    lines = list(cart_lines(user))
+    totals = cart_totals(user)
+    return CartSummary(lines, totals['count'], totals['amount'])
+
+
+def session_cart_summary(session_cart):
+    """The same summary for an anonymous cookie cart (store.session_cart)."""
+    lines = session_cart.lines()
+    amount = sum((line.line_total for line in lines), decimal.Decimal(0))
+    return CartSummary(lines, len(lines), amount)
@@ -0,0 +1,274 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .cache import bump_catalog_version
+from .facets import rebuild_facet_counts
+from .models import Category, Product
+from .search import get_search_backend
+
+# Columns of the catalog CSV/JSONL files. Products are matched by sku and
+# category is the category slug. On import only sku is mandatory for an
+# existing product; the columns a file leaves out (or leaves empty) are not
+# touched.
+FIELDS = (
+    'sku', 'title', 'slug', 'category', 'price',
+    'short_description', 'detail_description', 'is_active', 'is_featured',
+)
+FORMATS = ('csv', 'jsonl')
+REQUIRED_FOR_CREATE = ('title', 'category_id', 'price')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+CENTS = Decimal('0.01')
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+# Product fields stored in the search index
+INDEXED_FIELDS = {'title', 'short_description', 'is_active'}
+# errors kept for the report, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class CatalogRowError(ValueError):
+    pass
+
+
+def guess_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in FORMATS else default
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a text stream, one row at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, CatalogRowError(f"invalid JSON: {exc}")
+                continue
+            if not isinstance(row, dict):
+                row = CatalogRowError("expected a JSON object")
+            yield line_number, row
+    else:
+        raise ValueError(f"Unknown catalog format: {fmt!r}")
+
+
+def parse_row(row, categories):
+    """(sku, {Product field: value}) for the columns present in row."""
+    if isinstance(row, CatalogRowError):
+        raise row
+    sku = str(row.get('sku') or '').strip()
+    if not sku:
+        raise CatalogRowError("missing sku")
+
+    values = {}
+    for name in FIELDS[1:]:
+        value = row.get(name)
+        if value is None or value == '':
+            continue
+        if name == 'category':
+            slug = str(value).strip()
+            if slug not in categories:
+                raise CatalogRowError(f"unknown category {slug!r}")
+            values['category_id'] = categories[slug]
+        elif name == 'price':
+            try:
+                price = Decimal(str(value).strip()).quantize(CENTS)
+            except InvalidOperation:
+                raise CatalogRowError(f"invalid price {value!r}")
+            if price < 0 or price >= 10 ** 6:
+                raise CatalogRowError(f"price out of range {value!r}")
+            values['price'] = price
+        elif name in ('is_active', 'is_featured'):
+            values[name] = value if isinstance(value, bool) else str(value).strip().lower() in TRUE_VALUES
+        else:
+            values[name] = str(value).strip()
+    return sku, values
+
+
+class CatalogImport:
+    """
+    Upserts products by sku from a stream of rows, batch_size rows per
+    transaction: one SELECT for the batch's existing products, then one
+    bulk_create and one executemany UPDATE. Categories are resolved from a
+    slug map loaded once. Memory stays bounded by the batch size.
+
+    The writes bypass CatalogQuerySet, which would bump the catalog version
+    and recount the facets after every batch; run() does both once at the
+    end, also when it stops on an error, as the earlier batches stay
+    committed. The search index is updated per batch.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        self.errors = []
+        self.started = None
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return self.stats['rows'] / elapsed if elapsed else 0
+
+    def error(self, line, message):
+        self.stats['failed'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def run(self, rows):
+        self.started = time.monotonic()
+        batch = {}
+        try:
+            for line, row in rows:
+                self.stats['rows'] += 1
+                try:
+                    sku, values = parse_row(row, self.categories)
+                except CatalogRowError as exc:
+                    self.error(line, str(exc))
+                    continue
+                # a sku repeated within the batch: the last row wins
+                batch[sku] = (line, values)
+                if len(batch) >= self.batch_size:
+                    self.write(batch)
+                    batch = {}
+            if batch:
+                self.write(batch)
+        finally:
+            if self.stats['created'] or self.stats['updated']:
+                bump_catalog_version()
+                rebuild_facet_counts()
+        return self.stats
+
+    def write(self, batch):
+        products = Product._base_manager
+        existing = products.filter(sku__in=list(batch)).in_bulk(field_name='sku')
+        now = timezone.now()
+        creates, updates, fields = [], [], {'updated_at'}
+        for sku, (line, values) in batch.items():
+            product = existing.get(sku)
+            if product is None:
+                missing = [name for name in REQUIRED_FOR_CREATE if name not in values]
+                if missing:
+                    self.error(line, f"new product {sku!r} needs {', '.join(missing)}")
+                    continue
+                values.setdefault('slug', slugify(f"{values['title']} {sku}")[:160])
+                values.setdefault('short_description', values['title'])
+                values.setdefault('is_active', True)
+                values.setdefault('is_featured', False)
+                creates.append((line, Product(sku=sku, **values)))
+                continue
+            changed = {name: value for name, value in values.items() if getattr(product, name) != value}
+            if not changed:
+                self.stats['unchanged'] += 1
+                continue
+            for name, value in changed.items():
+                setattr(product, name, value)
+            product.updated_at = now
+            fields.update(changed)
+            updates.append((line, product))
+
+        try:
+            self.save(creates, updates, fields)
+        except IntegrityError:
+            # e.g. a slug already used by another product: save row by row
+            # to find the culprits and keep the rest of the batch
+            for item in creates:
+                self.save_one([item], [], fields)
+            for item in updates:
+                self.save_one([], [item], fields)
+        else:
+            self.stats['created'] += len(creates)
+            self.stats['updated'] += len(updates)
+        if self.progress:
+            self.progress(self)
+
+    def save(self, creates, updates, fields):
+        with transaction.atomic():
+            created = Product._base_manager.bulk_create([product for line, product in creates])
+            if updates:
+                update_products([product for line, product in updates], sorted(fields))
+            if INDEXED_FIELDS.intersection(fields):
+                created += [product for line, product in updates]
+            get_search_backend().index_products(created)
+
+    def save_one(self, creates, updates, fields):
+        line, product = (creates or updates)[0]
+        try:
+            self.save(creates, updates, fields)
+        except IntegrityError as exc:
+            self.error(line, f"{product.sku!r}: {exc}")
+        else:
+            self.stats['created' if creates else 'updated'] += 1
+
+
+def update_products(products, fields):
+    """
+    Write fields of products with one executemany. bulk_update() would build
+    a CASE WHEN per row and field, which costs far more in Python than the
+    UPDATEs themselves cost in the database.
+    """
+    qn = connection.ops.quote_name
+    columns = [Product._meta.get_field(name) for name in fields]
+    assignments = ', '.join(f'{qn(field.column)} = %s' for field in columns)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {qn(Product._meta.db_table)} SET {assignments} WHERE id = %s",
+            [
+                [field.get_db_prep_save(getattr(product, field.attname), connection) for field in columns]
+                + [product.pk]
+                for product in products
+            ],
+        )
+
+
+class EchoBuffer:
+    # csv.writer target that hands each formatted line straight back
+    def write(self, value):
+        return value
+
+
+def export_lines(fmt, queryset=None):
+    """
+    Yield the products as CSV or JSONL text, a line at a time. The table is
+    walked by primary key in EXPORT_CHUNK_SIZE queries, so neither the rows
+    nor an open cursor are held while the consumer is slow.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    columns = (
+        'sku', 'title', 'slug', 'category__slug', 'price',
+        'short_description', 'detail_description', 'is_active', 'is_featured',
+    )
+    rows = queryset.order_by('pk').values_list('pk', *columns)
+    writer = csv.writer(EchoBuffer())
+    if fmt == 'csv':
+        yield writer.writerow(FIELDS)
+
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_id)[:EXPORT_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        for pk, *values in chunk:
+            row = dict(zip(FIELDS, values))
+            row['price'] = str(row['price'])
+            if fmt == 'csv':
+                row['is_active'] = int(row['is_active'])
+                row['is_featured'] = int(row['is_featured'])
+                yield writer.writerow([row[name] for name in FIELDS])
+            else:
+                yield json.dumps(row) + '\n'
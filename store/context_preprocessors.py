@@ -1,8 +1,16 @@
-from .models import Category, Cart
+from .cache import get_cart_count, local_catalog
+from .cart_summary import cart_totals
+from .models import Category
+from .page_cache import shown
+from .session_cart import SessionCart
 
 
 def store_menu(request):
-    categories = Category.objects.filter(is_active=True)
+    categories = local_catalog(
+        'menu-categories',
+        lambda: list(Category.objects.filter(is_active=True).values('id', 'title', 'slug', 'updated_at')),
+    )
+    shown(request, 'category', categories)
     context = {
         'categories_menu': categories,
     }
@@ -10,10 +18,12 @@ def store_menu(request):
 
 def cart_menu(request):
     if request.user.is_authenticated:
-        cart_items= Cart.objects.filter(user=request.user)
+        user = request.user
         context = {
-            'cart_items': cart_items,
+            'cart_count': get_cart_count(user, lambda: cart_totals(user)['count']),
         }
     else:
-        context = {}
-    return context
\ No newline at end of file
+        context = {
+            'cart_count': len(SessionCart(request)),
+        }
+    return context
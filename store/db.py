@@ -0,0 +1,54 @@
+import functools
+import logging
+import random
+import time
+from collections import Counter
+
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+# Attempts and first delay (seconds, doubled per attempt, with jitter) for
+# transactions that still find the database locked once SQLite's busy
+# timeout (DATABASES OPTIONS "timeout") has run out.
+LOCKED_ATTEMPTS = 3
+LOCKED_BACKOFF = 0.1
+
+# Per-process counts of 'retried' and 'failed' locked transactions.
+stats = Counter()
+
+
+def is_locked_error(exc):
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_locked(func=None, *, attempts=LOCKED_ATTEMPTS, backoff=LOCKED_BACKOFF):
+    """
+    Run func again when SQLite reports the database is locked. func must do
+    all of its writes in its own transaction.atomic(), so a failed attempt
+    has been rolled back completely. Inside an outer atomic block the error
+    is raised at once: only the outermost transaction can be retried.
+    """
+    if func is None:
+        return functools.partial(retry_on_locked, attempts=attempts, backoff=backoff)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if connection.in_atomic_block or not is_locked_error(exc):
+                    raise
+                if attempt == attempts:
+                    stats['failed'] += 1
+                    raise
+                stats['retried'] += 1
+                delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning(
+                    "%s: database locked, retry %d/%d in %.0fms",
+                    func.__qualname__, attempt, attempts - 1, delay * 1000,
+                )
+                time.sleep(delay)
+    return wrapper
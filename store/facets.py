@@ -0,0 +1,194 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, When
+
+# (lower bound inclusive, upper bound exclusive or None, label); the position
+# in this tuple is the price_band stored in ProductFacetCount.
+PRICE_BANDS = (
+    (Decimal('0'), Decimal('25'), 'Under $25'),
+    (Decimal('25'), Decimal('50'), '$25 - $50'),
+    (Decimal('50'), Decimal('100'), '$50 - $100'),
+    (Decimal('100'), Decimal('250'), '$100 - $250'),
+    (Decimal('250'), None, '$250 & above'),
+)
+
+
+def price_band(price):
+    price = Decimal(str(price))
+    for band, (low, high, label) in enumerate(PRICE_BANDS):
+        if high is None or price < high:
+            return band
+    return len(PRICE_BANDS) - 1
+
+
+def price_band_expression():
+    whens = [
+        When(price__lt=high, then=band)
+        for band, (low, high, label) in enumerate(PRICE_BANDS) if high is not None
+    ]
+    return Case(*whens, default=len(PRICE_BANDS) - 1, output_field=IntegerField())
+
+
+def facet_key(category_id, price, is_featured, is_active):
+    """The ProductFacetCount cell a product counts towards, None if inactive."""
+    if not is_active:
+        return None
+    return (category_id, price_band(price), bool(is_featured))
+
+
+def adjust_facet(key, delta):
+    from .models import ProductFacetCount
+
+    if key is None or not delta:
+        return
+    category_id, band, featured = key
+    cell = ProductFacetCount.objects.filter(
+        category_id=category_id, price_band=band, is_featured=featured
+    )
+    if cell.update(product_count=F('product_count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            ProductFacetCount.objects.create(
+                category_id=category_id, price_band=band,
+                is_featured=featured, product_count=delta,
+            )
+    except IntegrityError:
+        # another writer created the cell first
+        cell.update(product_count=F('product_count') + delta)
+
+
+def move_facet(old_key, new_key):
+    if old_key != new_key:
+        adjust_facet(old_key, -1)
+        adjust_facet(new_key, 1)
+
+
+def rebuild_facet_counts():
+    """Recompute every cell from Product; used after bulk writes."""
+    from .models import Product, ProductFacetCount
+
+    rows = (
+        Product.objects.filter(is_active=True)
+        .annotate(band=price_band_expression())
+        .values('category_id', 'band', 'is_featured')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        ProductFacetCount.objects.all().delete()
+        ProductFacetCount.objects.bulk_create([
+            ProductFacetCount(
+                category_id=row['category_id'], price_band=row['band'],
+                is_featured=row['is_featured'], product_count=row['n'],
+            )
+            for row in rows
+        ])
+
+
+def facet_cells():
+    """All non-empty cells, from the process-local catalog cache."""
+    from .cache import local_catalog
+    from .models import ProductFacetCount
+
+    return local_catalog(
+        'facet-cells',
+        lambda: list(
+            ProductFacetCount.objects.filter(product_count__gt=0)
+            .values_list('category_id', 'price_band', 'is_featured', 'product_count')
+        ),
+    )
+
+
+def facet_counts(selected, cells=None):
+    """
+    Counts for every facet value given the other selected facets, the usual
+    "drill sideways" behaviour: picking a category does not zero the other
+    categories' counts. selected holds 'category', 'price' and 'featured'
+    (None when not filtered).
+    """
+    if cells is None:
+        cells = facet_cells()
+    category, band, featured = selected['category'], selected['price'], selected['featured']
+
+    categories = defaultdict(int)
+    bands = defaultdict(int)
+    featured_count = 0
+    total = 0
+    for cell_category, cell_band, cell_featured, count in cells:
+        category_ok = category is None or cell_category == category
+        band_ok = band is None or cell_band == band
+        featured_ok = not featured or cell_featured
+        if band_ok and featured_ok:
+            categories[cell_category] += count
+        if category_ok and featured_ok:
+            bands[cell_band] += count
+        if category_ok and band_ok:
+            if cell_featured:
+                featured_count += count
+            if featured_ok:
+                total += count
+    return {
+        'categories': dict(categories),
+        'price_bands': dict(bands),
+        'featured': featured_count,
+        'total': total,
+    }
+
+
+def facet_filter(selected):
+    """Q object matching the products of the selected facets."""
+    q = Q(is_active=True)
+    if selected['category'] is not None:
+        q &= Q(category_id=selected['category'])
+    if selected['price'] is not None:
+        low, high, label = PRICE_BANDS[selected['price']]
+        q &= Q(price__gte=low)
+        if high is not None:
+            q &= Q(price__lt=high)
+    if selected['featured']:
+        q &= Q(is_featured=True)
+    return q
+
+
+def parse_facets(params):
+    """Read ?category=<id>&price=<band>&featured=1, ignoring bad values."""
+    def as_int(name):
+        try:
+            return int(params.get(name, ''))
+        except ValueError:
+            return None
+
+    band = as_int('price')
+    if band is not None and not 0 <= band < len(PRICE_BANDS):
+        band = None
+    return {
+        'category': as_int('category'),
+        'price': band,
+        'featured': params.get('featured') == '1',
+    }
+
+
+def browse_products(selected, after=''):
+    """
+    The shop listing in one call: a keyset page of the matching product rows
+    plus the facet counts for the same selection. First pages are cached
+    per catalog version (see cached_first_page) and the counts come from
+    the facet cells, so a warm request does not touch the product table.
+    """
+    from .models import Product
+    from .pagination import cached_first_page
+
+    page = cached_first_page(
+        'shop-products',
+        Product.objects.filter(facet_filter(selected)),
+        after,
+        selected['category'], selected['price'], int(selected['featured']),
+    )
+    return {
+        'object_list': page['object_list'],
+        'next_cursor': page['next_cursor'],
+        'facets': facet_counts(selected),
+    }
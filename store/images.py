@@ -0,0 +1,160 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, JpegImagePlugin
+
+# Resized copies of uploaded images, stored next to the original as
+# <dir>/derivatives/<name>.<original ext>-<width>.<ext>. The names only
+# depend on the original's name, so templates can build the URLs without a
+# lookup; the original's extension keeps ring.png and ring.jpg apart.
+SIZES = {
+    'thumb': 120,
+    'listing': 400,
+    'detail': 900,
+}
+FORMATS = {
+    'webp': 'WEBP',
+    'jpg': 'JPEG',
+}
+QUALITY = 80
+
+# Rendered width of each size in the page layout, for the sizes attribute.
+SIZES_ATTRIBUTE = {
+    'thumb': '120px',
+    'listing': '(min-width: 992px) 300px, 50vw',
+    'detail': '(min-width: 992px) 540px, 100vw',
+}
+
+IMAGE_WORKERS = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+
+
+def derivative_name(name, size, ext):
+    path = PurePosixPath(name)
+    return str(path.parent / 'derivatives' / f'{path.name}-{SIZES[size]}.{ext}')
+
+
+def derivative_url(image, size, ext='jpg'):
+    return default_storage.url(derivative_name(image.name, size, ext))
+
+
+def derivatives_ready(name):
+    # The largest JPEG is written last, so it marks a complete set.
+    return default_storage.exists(derivative_name(name, 'detail', 'jpg'))
+
+
+def _flatten(image):
+    """JPEG has no alpha channel: paint transparent images onto white."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _replace(name, content):
+    """
+    Store content as name. An existing file is only replaced once the new
+    one is fully written, so pages never link to a missing derivative.
+    """
+    if not default_storage.exists(name):
+        default_storage.save(name, content)
+        return
+    written = default_storage.save(name, content)  # an alternate name beside it
+    try:
+        os.replace(default_storage.path(written), default_storage.path(name))
+    except NotImplementedError:
+        # remote storage, no rename: swap the files as closely as it allows
+        default_storage.delete(name)
+        default_storage.save(name, content)
+        default_storage.delete(written)
+
+
+def build_derivatives(name):
+    """Write every size and format of one stored image. Runs in the pool."""
+    with default_storage.open(name, 'rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+
+    for size, width in SIZES.items():
+        resized = original.copy()
+        resized.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+        for ext, image_format in FORMATS.items():
+            if ext == 'webp' and resized.mode in ('RGB', 'RGBA'):
+                image = resized
+            else:
+                image = _flatten(resized)
+            buffer = BytesIO()
+            image.save(buffer, image_format, quality=QUALITY)
+            _replace(derivative_name(name, size, ext), ContentFile(buffer.getvalue()))
+    return name
+
+
+def strip_metadata(name):
+    """
+    Write an upright copy of a stored image without EXIF (camera, GPS, ...)
+    data, in its own format and, for JPEG, its own quantization, and return
+    the copy's name. The original is left for the caller to remove.
+    """
+    with default_storage.open(name, 'rb') as source:
+        original = Image.open(source)
+        image_format = original.format
+        options = {}
+        if image_format == 'JPEG':
+            options = {
+                'qtables': original.quantization,
+                'subsampling': JpegImagePlugin.get_sampling(original),
+            }
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    if image_format == 'JPEG':
+        image = _flatten(image)
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def normalize_payment_proof(name):
+    """
+    Uploaded screenshots: swap the order's proof for a stripped copy, then
+    build the derivatives. The original is only deleted once no order
+    points at it.
+    """
+    from .models import Order
+
+    stripped = strip_metadata(name)
+    if not Order.objects.filter(payment_proof=name).update(payment_proof=stripped):
+        # the order went away, or got another proof, meanwhile
+        default_storage.delete(stripped)
+        return name
+    default_storage.delete(name)
+    return build_derivatives(stripped)
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def build_all(names, workers=IMAGE_WORKERS):
+    """Build derivatives for many images, yielding (name, error) as they finish."""
+    if workers == 0:
+        for name in names:
+            try:
+                build_derivatives(name)
+            except Exception as exc:
+                yield name, exc
+            else:
+                yield name, None
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(build_derivatives, name): name for name in names}
+        for future in as_completed(futures):
+            yield futures[future], future.exception()
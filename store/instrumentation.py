@@ -0,0 +1,115 @@
+import contextlib
+import contextvars
+import functools
+import time
+from collections import Counter
+
+from django.db import connections
+from django.template.backends import django as django_backend
+
+# Metrics of the request being recorded, set by RequestMetricsMiddleware for
+# sampled requests only. When it is None every hook below returns at once.
+_metrics = contextvars.ContextVar('store_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Queries, database time and template/context processor time of one
+    request. Installed as an execute_wrapper on every database connection
+    while the request runs.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.processor_times = Counter()
+        # SQL text (parameters left out) -> executions
+        self.statements = Counter()
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - began
+            self.queries += 1
+            self.statements[sql] += 1
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def processor_time(self):
+        return sum(self.processor_times.values())
+
+    def repeated_statements(self, threshold):
+        """[(sql, executions)] run at least threshold times: N+1 suspects."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+@contextlib.contextmanager
+def record_request():
+    metrics = RequestMetrics()
+    token = _metrics.set(metrics)
+    try:
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(metrics))
+            yield metrics
+    finally:
+        _metrics.reset(token)
+
+
+def _timed_processor(processor):
+    @functools.wraps(processor)
+    def wrapper(request):
+        metrics = _metrics.get()
+        if metrics is None:
+            return processor(request)
+        began = time.perf_counter()
+        try:
+            return processor(request)
+        finally:
+            metrics.processor_times[processor.__name__] += time.perf_counter() - began
+    return wrapper
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        metrics = _metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        # count nested render_to_string() calls once, in the outer template
+        metrics._template_depth += 1
+        began = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._template_depth -= 1
+            if not metrics._template_depth:
+                metrics.template_time += time.perf_counter() - began
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    The Django template backend, timing template rendering and each context
+    processor for RequestMetricsMiddleware. Render time includes the
+    context processors, which run when the template binds its context.
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.engine.template_context_processors = tuple(
+            _timed_processor(processor) for processor in self.engine.template_context_processors
+        )
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
@@ -0,0 +1,37 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.sales_rollups import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from the existing orders, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', metavar='YYYY-MM-DD',
+            help="Only rebuild the days from this date on (default: all history).",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Orders per transaction (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+
+        started = time.monotonic()
+        done = 0
+        for done, last_id in backfill(since, options['chunk_size']):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{done} orders (up to #{last_id})")
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {done} orders in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,135 @@
+import io
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from store.checkout import place_order
+from store.db import stats as lock_stats
+from store.models import Address, Cart, Category, Order, Product
+
+# "tuned" is the DATABASES entry from settings (IMMEDIATE transactions, busy
+# timeout, pragmas) on a WAL database, as deployed; "plain" is what Django
+# does with no OPTIONS at all.
+PROFILES = ('tuned', 'plain')
+PRODUCTS = 20
+
+
+def _database(profile, path):
+    database = dict(settings.DATABASES['default'], NAME=path, CONN_MAX_AGE=0)
+    if profile == 'plain':
+        database['OPTIONS'] = {}
+    return database
+
+
+def _checkout_worker(number, orders, lines, start, results):
+    """One simulated gunicorn worker: fill the cart, check out, repeat."""
+    user = User.objects.get(username=f'bench{number}')
+    address = Address.objects.get(user=user)
+    products = list(Product.objects.order_by('id'))
+    latencies, errors = [], 0
+    start.wait()
+    for i in range(orders):
+        began = time.perf_counter()
+        try:
+            Cart.objects.bulk_create([
+                Cart(user=user, product=products[(number + i + line) % len(products)], quantity=1)
+                for line in range(lines)
+            ])
+            place_order(user, address, 'COD', None)
+        except OperationalError:
+            errors += 1
+            Cart.objects.filter(user=user).delete()
+        else:
+            latencies.append(time.perf_counter() - began)
+    connections.close_all()
+    results.put((latencies, errors, lock_stats['retried']))
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent checkouts from several processes against a scratch copy "
+        "of the database schema and report orders/second and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Processes checking out at once (default: 4).")
+        parser.add_argument('--orders', type=int, default=100, help="Checkouts per worker (default: 100).")
+        parser.add_argument('--lines', type=int, default=3, help="Cart lines per order (default: 3).")
+        parser.add_argument(
+            '--profile', choices=PROFILES + ('both',), default='both',
+            help="Database settings to run with (default: both, for comparison).",
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='bench-checkout-')
+        try:
+            profiles = PROFILES if options['profile'] == 'both' else (options['profile'],)
+            for profile in profiles:
+                self.run_profile(profile, os.path.join(directory, f'{profile}.sqlite3'), options)
+        finally:
+            connections.close_all()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run_profile(self, profile, path, options):
+        connections.close_all()
+        connection = connections['default']
+        connection.settings_dict.update(_database(profile, path))
+        call_command('migrate', verbosity=0, interactive=False)
+        if profile == 'tuned':
+            call_command('enable_wal', stdout=io.StringIO())
+
+        category = Category.objects.create(title='Bench', slug='bench', is_active=True, is_featured=False)
+        Product.objects.bulk_create([
+            Product(
+                title=f'Bench {i}', slug=f'bench-{i}', sku=f'BENCH-{i}', short_description='Bench',
+                price=Decimal('10.00') + i, category=category, is_active=True, is_featured=False,
+            )
+            for i in range(PRODUCTS)
+        ])
+        for number in range(options['workers']):
+            user = User.objects.create_user(f'bench{number}')
+            Address.objects.create(user=user, locality='Bench', city='Bench', state='Bench')
+
+        # children must open their own connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        start = context.Barrier(options['workers'] + 1)
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=_checkout_worker,
+                args=(number, options['orders'], options['lines'], start, results),
+            )
+            for number in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        start.wait()
+        began = time.perf_counter()
+        outcomes = [results.get() for _ in processes]
+        elapsed = time.perf_counter() - began
+        for process in processes:
+            process.join()
+
+        latencies = sorted(latency for worker, errors, retries in outcomes for latency in worker)
+        errors = sum(errors for worker, errors, retries in outcomes)
+        retries = sum(retries for worker, errors, retries in outcomes)
+        placed = Order.objects.count()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"{profile:<6} workers={options['workers']} orders={placed} "
+            f"lock_retries={retries} lock_errors={errors} "
+            f"throughput={placed / elapsed:.0f}/s "
+            f"p50={statistics.median(latencies) * 1000 if latencies else 0:.1f}ms "
+            f"p95={p95 * 1000:.1f}ms"
+        )
@@ -0,0 +1,293 @@
+import datetime
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store.models import Address, Category, Order, Product
+
+ROUTES = (
+    'home', 'detail', 'category_products', 'cart', 'checkout', 'orders',
+    'admin_orders', 'admin_products',
+)
+RESULTS_DIR = Path(settings.BASE_DIR) / 'bench-results'
+ADMIN_USERNAME = 'bench-admin'
+# Any 32 letters are a valid CSRF secret; sent as both cookie and header.
+CSRF_TOKEN = 'benchbenchbenchbenchbenchbench00'
+STARTUP_TIMEOUT = 30
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    return values[max(int(round(fraction * len(values))) - 1, 0)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Shopper:
+    """A logged in user with a session the HTTP clients send as a cookie."""
+
+    def __init__(self, user, host):
+        self.user = user
+        self.address_id = Address.objects.filter(user=user).values_list('id', flat=True).first()
+        self.client = Client(HTTP_HOST=host)
+        self.client.force_login(user)
+        self.cookie = (
+            f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}; '
+            f'{settings.CSRF_COOKIE_NAME}={CSRF_TOKEN}'
+        )
+
+
+class Scenario:
+    """
+    The requests of each route. request(route, number) returns the timed
+    (method, path, data, shopper) and, for checkout, the untimed request
+    that fills the cart first.
+    """
+
+    def __init__(self, clients, host, seed):
+        self.random = random.Random(seed)
+        self.products = list(
+            Product.objects.filter(is_active=True).order_by('id').values_list('id', 'slug')[:5000]
+        )
+        self.categories = list(
+            Category.objects.filter(is_active=True).order_by('id').values_list('slug', flat=True)[:500]
+        )
+        users = list(
+            User.objects.filter(is_staff=False, address__isnull=False).distinct().order_by('id')[:clients]
+        )
+        if not self.products or not self.categories or not users:
+            raise CommandError(
+                "Nothing to browse: needs active products and categories and users "
+                "with an address (see generate_dataset)."
+            )
+        self.shoppers = [Shopper(user, host) for user in users]
+        admin, created = User.objects.get_or_create(
+            username=ADMIN_USERNAME, defaults={'is_staff': True, 'is_superuser': True},
+        )
+        self.admin = Shopper(admin, host)
+
+    def request(self, route, number):
+        shopper = self.shoppers[number % len(self.shoppers)]
+        product_id, product_slug = self.random.choice(self.products)
+        if route == 'home':
+            return None, ('GET', reverse('store:home'), None, shopper)
+        if route == 'detail':
+            return None, ('GET', reverse('store:product-detail', args=[product_slug]), None, shopper)
+        if route == 'category_products':
+            slug = self.random.choice(self.categories)
+            return None, ('GET', reverse('store:category-products', args=[slug]), None, shopper)
+        if route == 'cart':
+            return None, ('GET', reverse('store:cart'), None, shopper)
+        if route == 'checkout':
+            add = ('POST', reverse('store:cart-api-add'), {'product_id': product_id}, shopper)
+            data = {'address': shopper.address_id, 'payment_method': 'COD'}
+            return add, ('POST', reverse('store:checkout'), data, shopper)
+        if route == 'orders':
+            return None, ('GET', reverse('store:orders'), None, shopper)
+        if route == 'admin_orders':
+            return None, ('GET', reverse('admin:store_order_changelist'), None, self.admin)
+        if route == 'admin_products':
+            return None, ('GET', reverse('admin:store_product_changelist'), None, self.admin)
+        raise ValueError(route)
+
+
+class HTTPTarget:
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+
+    def fetch(self, method, path, data, shopper):
+        headers = {'Cookie': shopper.cookie}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = CSRF_TOKEN
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the shop over HTTP: concurrent clients request each route against "
+        "a local gunicorn (or --url), then latency percentiles, throughput and "
+        "queries per request are printed and saved as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help="Benchmark this running server instead of starting gunicorn, "
+                 "e.g. http://127.0.0.1:8000. It must use the same database.",
+        )
+        parser.add_argument('--workers', type=int, default=4, help="gunicorn workers (default: 4).")
+        parser.add_argument('--clients', type=int, default=8, help="Concurrent clients (default: 8).")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per route (default: 200).")
+        parser.add_argument(
+            '--routes', nargs='+', choices=ROUTES, default=list(ROUTES),
+            help="Routes to run (default: all).",
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help=f"Results file (default: a new file in {RESULTS_DIR}).")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if url is None:
+            server, url = self.start_gunicorn(options['workers'])
+        try:
+            target = HTTPTarget(url)
+            scenario = Scenario(options['clients'], target.host, options['seed'])
+            results = {
+                'commit': git_commit(),
+                'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'server': 'gunicorn' if server else url,
+                'workers': options['workers'] if server else None,
+                'clients': options['clients'],
+                'requests': options['requests'],
+                'dataset': {
+                    'products': Product.objects.count(),
+                    'categories': Category.objects.count(),
+                    'users': User.objects.count(),
+                    'orders': Order.objects.count(),
+                },
+                'routes': {},
+            }
+            for route in options['routes']:
+                stats = self.run_route(target, scenario, route, options)
+                stats['queries'] = self.count_queries(scenario, route)
+                results['routes'][route] = stats
+                self.report(route, stats)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        output = Path(options['output'] or RESULTS_DIR / (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'unknown'}.json"
+        ))
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2) + '\n')
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}."))
+        if options['compare']:
+            self.compare(json.loads(Path(options['compare']).read_text()), results)
+
+    def start_gunicorn(self, workers):
+        if importlib.util.find_spec('gunicorn') is None:
+            raise CommandError("gunicorn is not installed; start a server yourself and pass --url.")
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        env = dict(os.environ, DEBUG=os.environ.get('DEBUG', 'False'))
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'jewelryshop.wsgi:application',
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                if server.poll() is not None:
+                    break
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("gunicorn did not start.")
+
+    def run_route(self, target, scenario, route, options):
+        requests = [scenario.request(route, number) for number in range(options['requests'])]
+
+        def client(number):
+            latencies, errors = [], 0
+            for setup, timed in requests[number::options['clients']]:
+                if setup is not None:
+                    target.fetch(*setup)
+                began = time.perf_counter()
+                status = target.fetch(*timed)
+                latencies.append(time.perf_counter() - began)
+                errors += status >= 400
+            return latencies, errors
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(options['clients']) as pool:
+            outcomes = list(pool.map(client, range(options['clients'])))
+        elapsed = time.perf_counter() - began
+        latencies = sorted(latency for worker, errors in outcomes for latency in worker)
+        return {
+            'requests': len(latencies),
+            'errors': sum(errors for worker, errors in outcomes),
+            'throughput': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        }
+
+    def count_queries(self, scenario, route):
+        """Queries one request of route runs, measured in this process."""
+        setup, (method, path, data, shopper) = scenario.request(route, 0)
+        if setup is not None:
+            setup_method, setup_path, setup_data, setup_shopper = setup
+            setup_shopper.client.post(setup_path, setup_data)
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'POST':
+                shopper.client.post(path, data)
+            else:
+                shopper.client.get(path)
+        return len(queries)
+
+    def report(self, route, stats):
+        self.stdout.write(
+            f"{route:<18} {stats['throughput']:>7.1f} req/s  p50={stats['p50_ms']:.1f}ms "
+            f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms "
+            f"queries={stats['queries']} errors={stats['errors']}"
+        )
+
+    def compare(self, before, after):
+        self.stdout.write(f"Compared with {before.get('commit')} ({before.get('started_at')}):")
+        for route, stats in after['routes'].items():
+            old = before['routes'].get(route)
+            if old is None:
+                continue
+            self.stdout.write(
+                f"{route:<18} p95 {old['p95_ms']:.1f} -> {stats['p95_ms']:.1f}ms "
+                f"({(stats['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.0%})  "
+                f"throughput {old['throughput']:.1f} -> {stats['throughput']:.1f}/s  "
+                f"queries {old['queries']} -> {stats['queries']}"
+            )
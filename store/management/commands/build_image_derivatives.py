@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.images import IMAGE_WORKERS, build_all, derivatives_ready
+from store.models import Category, Order, Product
+
+
+class Command(BaseCommand):
+    help = "Build the resized WebP/JPEG copies of product, category and payment proof images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=max(IMAGE_WORKERS, 1),
+            help="Worker processes; 0 builds in this process (default: %(default)s).",
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rebuild images that already have derivatives.",
+        )
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, field in (
+            (Product, 'product_image'),
+            (Category, 'category_image'),
+            (Order, 'payment_proof'),
+        ):
+            names.update(
+                model.objects.exclude(**{f'{field}__isnull': True})
+                .exclude(**{field: ''})
+                .values_list(field, flat=True)
+                .iterator()
+            )
+        if not options['force']:
+            names = {name for name in names if not derivatives_ready(name)}
+
+        started = time.monotonic()
+        built = failed = 0
+        for name, error in build_all(sorted(names), workers=options['workers']):
+            if error is None:
+                built += 1
+            else:
+                failed += 1
+                self.stderr.write(f"{name}: {error}")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Built derivatives for {built} images in {elapsed:.1f}s ({failed} failed)."
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Switch an SQLite database to write-ahead logging. The journal mode is "
+        "stored in the database file, so this runs once per database (after "
+        "migrate when deploying), not on every connection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="Database alias (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"{options['database']} is not an SQLite database.")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = WAL')
+            mode = cursor.fetchone()[0]
+        if mode.lower() != 'wal':
+            raise CommandError(f"SQLite kept journal_mode={mode}.")
+        self.stdout.write(self.style.SUCCESS(f"{connection.settings_dict['NAME']} uses WAL."))
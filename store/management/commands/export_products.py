@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from store.catalog_io import FORMATS, export_lines, guess_format
+
+
+class Command(BaseCommand):
+    help = "Write the product catalog as CSV or JSONL, streamed in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output', default='-',
+            help="File to write, or - for stdout (default).",
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help="File format (default: from the file extension, else csv).",
+        )
+
+    def handle(self, *args, **options):
+        path = options['output']
+        fmt = options['format'] or guess_format(path)
+        if path == '-':
+            for line in export_lines(fmt):
+                self.stdout.write(line, ending='')
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            stream.writelines(export_lines(fmt))
+        self.stdout.write(self.style.SUCCESS(f"Catalog written to {path}."))
@@ -0,0 +1,216 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from store.cache import bump_catalog_version
+from store.facets import rebuild_facet_counts
+from store.models import STATUS_CHOICES, Address, Cart, Category, Order, OrderItem, Product
+from store.sales_rollups import backfill
+
+# Every generated timestamp lies in the two years before this instant, so a
+# seed always produces the same rows whatever day the command runs.
+EPOCH = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+HISTORY_SECONDS = 2 * 365 * 24 * 3600
+
+# Every generated user logs in with this password.
+PASSWORD = 'bench-pass-123'
+
+WORDS = (
+    'Gold', 'Silver', 'Rose', 'Pearl', 'Diamond', 'Ruby', 'Emerald', 'Sapphire',
+    'Vintage', 'Classic', 'Twisted', 'Braided', 'Solitaire', 'Halo', 'Charm',
+)
+ITEMS = ('Ring', 'Necklace', 'Bracelet', 'Earrings', 'Pendant', 'Anklet', 'Brooch', 'Chain')
+# (status, weight): most history is delivered, a little is still open
+STATUS_WEIGHTS = (
+    ('Pending', 2), ('Accepted', 2), ('Packed', 1), ('On The Way', 2),
+    ('Delivered', 85), ('Cancelled', 8),
+)
+assert {status for status, weight in STATUS_WEIGHTS} == {value for value, label in STATUS_CHOICES}
+
+
+def insert(model, fields, rows):
+    """
+    INSERT rows (tuples in fields order) with one executemany, bypassing
+    model save(), signals and the catalog hooks.
+    """
+    qn = connection.ops.quote_name
+    columns = [model._meta.get_field(name) for name in fields]
+    with connection.cursor() as cursor:
+        # cursor.db skips the thread-local lookup the connection proxy does per value
+        db = cursor.db
+        cursor.executemany(
+            f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(field.column) for field in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})",
+            [
+                [field.get_db_prep_save(value, db) for field, value in zip(columns, row)]
+                for row in rows
+            ],
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with a deterministic synthetic shop: categories, "
+        "products, users with addresses, order history and open carts. Point "
+        "DATABASE_PATH at a scratch file and migrate it first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=500)
+        parser.add_argument('--products', type=int, default=200_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--orders', type=int, default=2_000_000)
+        parser.add_argument('--carts', type=int, default=20_000, help="Users with an open cart (default: 20000).")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed (default: 1).")
+        parser.add_argument(
+            '--batch-size', type=int, default=10_000,
+            help="Rows per INSERT transaction (default: 10000).",
+        )
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() or User.objects.exists():
+            raise CommandError(
+                "The database already has products or users; generate into a freshly "
+                "migrated DATABASE_PATH."
+            )
+        if options['users'] < 1 or options['products'] < 1 or options['categories'] < 1:
+            raise CommandError("--categories, --products and --users must be at least 1.")
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+
+        categories = self.step('categories', self.create_categories, options['categories'])
+        self.products = self.step('products', self.create_products, options['products'], categories)
+        self.users = self.step('users', self.create_users, options['users'])
+        self.step('orders', self.create_orders, options['orders'])
+        self.step('carts', self.create_carts, min(options['carts'], options['users']))
+
+        bump_catalog_version()
+        self.step('facet counts', rebuild_facet_counts)
+        self.step('search index', call_command, 'rebuild_search_index', stdout=StringIO())
+        self.step('sales rollups', lambda: list(backfill(chunk_size=self.batch_size)))
+        self.stdout.write(self.style.SUCCESS(
+            f"Dataset generated in {time.monotonic() - started:.0f}s."
+        ))
+
+    def step(self, name, func, *args, **kwargs):
+        began = time.monotonic()
+        result = func(*args, **kwargs)
+        if self.verbosity > 0:
+            self.stdout.write(f"{name}: {time.monotonic() - began:.1f}s")
+        return result
+
+    def moment(self):
+        return EPOCH - datetime.timedelta(seconds=self.random.randrange(HISTORY_SECONDS))
+
+    def batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield range(start, min(start + self.batch_size, count))
+
+    def first_id(self, model):
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def create_categories(self, count):
+        first = self.first_id(Category)
+        rows = []
+        for i in range(count):
+            created = self.moment()
+            rows.append((
+                first + i, f'{self.random.choice(WORDS)} {ITEMS[i % len(ITEMS)]}s {i}',
+                f'category-{i}', '', self.random.random() < 0.95, i < 3 or self.random.random() < 0.02,
+                created, created,
+            ))
+        with transaction.atomic():
+            insert(Category, ['id', 'title', 'slug', 'description', 'is_active', 'is_featured',
+                              'created_at', 'updated_at'], rows)
+        return list(range(first, first + count))
+
+    def create_products(self, count, categories):
+        """Returns [(id, price)], the order lines need both."""
+        first = self.first_id(Product)
+        products = []
+        for batch in self.batches(count):
+            rows = []
+            for i in batch:
+                title = f'{self.random.choice(WORDS)} {self.random.choice(WORDS)} {self.random.choice(ITEMS)}'
+                price = Decimal(self.random.randrange(500, 500_000)) / 100
+                created = self.moment()
+                rows.append((
+                    first + i, f'{title} {i}', f'product-{i}', f'SKU-{i:07d}',
+                    f'{title} in a gift box.', price, self.random.choice(categories),
+                    self.random.random() < 0.95, self.random.random() < 0.02, created, created,
+                ))
+                products.append((first + i, price))
+            with transaction.atomic():
+                insert(Product, ['id', 'title', 'slug', 'sku', 'short_description', 'price', 'category',
+                                 'is_active', 'is_featured', 'created_at', 'updated_at'], rows)
+        return products
+
+    def create_users(self, count):
+        """Returns [(user id, address id)], one saved address each."""
+        password = make_password(PASSWORD)  # hashing once keeps this fast
+        first_user, first_address = self.first_id(User), self.first_id(Address)
+        for batch in self.batches(count):
+            users, addresses = [], []
+            for i in batch:
+                users.append((
+                    first_user + i, f'user{i:06d}', '', '', f'user{i:06d}@example.com', password,
+                    False, False, True, self.moment(),
+                ))
+                addresses.append((
+                    first_address + i, first_user + i, f'{i} Main Street',
+                    f'City {i % 997}', f'State {i % 29}',
+                ))
+            with transaction.atomic():
+                insert(User, ['id', 'username', 'first_name', 'last_name', 'email', 'password', 'is_superuser', 'is_staff',
+                              'is_active', 'date_joined'], users)
+                insert(Address, ['id', 'user', 'locality', 'city', 'state'], addresses)
+        return [(first_user + i, first_address + i) for i in range(count)]
+
+    def create_orders(self, count):
+        first_order, first_item = self.first_id(Order), self.first_id(OrderItem)
+        statuses, weights = zip(*STATUS_WEIGHTS)
+        item_id = first_item
+        for batch in self.batches(count):
+            orders, items = [], []
+            for i in batch:
+                order_id = first_order + i
+                user_id, address_id = self.random.choice(self.users)
+                total = Decimal(0)
+                for product_id, price in self.random.sample(self.products, min(self.random.randint(1, 4), len(self.products))):
+                    quantity = self.random.randint(1, 3)
+                    items.append((item_id, order_id, product_id, quantity, price))
+                    total += quantity * price
+                    item_id += 1
+                payment_method = 'QR' if self.random.random() < 0.2 else 'COD'
+                orders.append((
+                    order_id, user_id, address_id, payment_method,
+                    'Verified' if payment_method == 'QR' else 'Pending',
+                    self.moment(), self.random.choices(statuses, weights)[0], total,
+                ))
+            with transaction.atomic():
+                insert(Order, ['id', 'user', 'address', 'payment_method', 'payment_status',
+                               'ordered_date', 'status', 'total_amount'], orders)
+                insert(OrderItem, ['id', 'order', 'product', 'quantity', 'unit_price'], items)
+
+    def create_carts(self, count):
+        now = EPOCH
+        rows = []
+        for user_id, address_id in self.random.sample(self.users, count):
+            for product_id, price in self.random.sample(self.products, min(self.random.randint(1, 5), len(self.products))):
+                rows.append((user_id, product_id, self.random.randint(1, 3), now, now))
+        for start in range(0, len(rows), self.batch_size):
+            with transaction.atomic():
+                insert(Cart, ['user', 'product', 'quantity', 'created_at', 'updated_at'],
+                       rows[start:start + self.batch_size])
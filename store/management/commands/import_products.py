@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.catalog_io import FORMATS, IMPORT_BATCH_SIZE, CatalogImport, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Create or update products from a CSV or JSONL file, matched by SKU."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help="File format (default: from the file extension, else csv).",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help=f"Rows per transaction (default: {IMPORT_BATCH_SIZE}).",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        importer = CatalogImport(options['batch_size'], progress=self.report_progress)
+        if path == '-':
+            stats = importer.run(read_rows(sys.stdin, fmt))
+        else:
+            try:
+                stream = open(path, newline='', encoding='utf-8-sig')
+            except OSError as exc:
+                raise CommandError(exc)
+            with stream:
+                stats = importer.run(read_rows(stream, fmt))
+
+        for line, message in importer.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['rows']} rows at {importer.rows_per_second:.0f} rows/s: "
+            f"{stats['created']} created, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['failed']} failed."
+        ))
+
+    def report_progress(self, importer):
+        if self.verbosity > 0:
+            self.stdout.write(
+                f"{importer.stats['rows']} rows ({importer.rows_per_second:.0f} rows/s)..."
+            )
+
@@ -0,0 +1,82 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store.task_queue import queue_stats, run_worker
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the database task backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help="Worker processes to start (default: 1).",
+        )
+        parser.add_argument(
+            '--queue', dest='queues', action='append',
+            help="Queue to work on; repeat for several (default: all queues).",
+        )
+        parser.add_argument('--backend', default='default', help="TASKS alias (default: default).")
+        parser.add_argument(
+            '--batch-size', type=int, default=10,
+            help="Tasks claimed per round trip (default: 10).",
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help="Seconds to wait when the queue is empty (default: 1).",
+        )
+        parser.add_argument(
+            '--max-tasks', type=int, default=None,
+            help="Exit after running this many tasks (per process).",
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help="Exit once the queue is empty.",
+        )
+        parser.add_argument(
+            '--metrics-interval', type=float, default=60,
+            help="Seconds between throughput log lines (default: 60).",
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Print queue statistics and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = queue_stats()
+            for (queue, status), count in sorted(stats['counts'].items()):
+                self.stdout.write(f"{queue:<12} {status:<11} {count}")
+            self.stdout.write(f"oldest ready task: {stats['oldest_ready_seconds']:.1f}s")
+            return
+
+        worker_options = {
+            key: options[key]
+            for key in ('backend', 'queues', 'batch_size', 'sleep', 'max_tasks', 'burst', 'metrics_interval')
+        }
+        if options['processes'] <= 1:
+            metrics = run_worker(**worker_options)
+            self.stdout.write(self.style.SUCCESS(
+                f"Worker stopped: {metrics['succeeded']} succeeded, "
+                f"{metrics['retried']} retried, {metrics['failed']} failed."
+            ))
+            return
+
+        # children must not share the parent's database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_worker, kwargs=worker_options)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} worker processes.")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # the workers got the same SIGINT and finish their batch
+            for process in processes:
+                process.join()
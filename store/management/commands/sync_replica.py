@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.routers import REPLICA_ALIAS
+
+
+def copy_database(source, target):
+    """
+    Copy the SQLite database at source to target with the online backup API,
+    which reads a consistent snapshot while other connections keep writing.
+    The copy is written next to target and renamed over it, so readers see
+    either the old or the new file, never half of one.
+    """
+    partial = f'{target}.partial'
+    # closing(): a sqlite3 connection's own context manager does not close it
+    with closing(sqlite3.connect(source)) as primary, closing(sqlite3.connect(partial)) as copy:
+        primary.backup(copy)
+        # readers open the copy read-only, which a WAL database does not allow
+        copy.execute('PRAGMA journal_mode = DELETE')
+    os.replace(partial, target)
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database to the read replica file "
+        "(REPLICA_PATH), once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep copying, sleeping this many seconds between copies "
+                 "(default: copy once). Keep it below REPLICA_PIN_SECONDS.",
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError("No replica configured, set REPLICA_PATH.")
+        source = str(settings.DATABASES['default']['NAME'])
+        target = settings.REPLICA_PATH
+        while True:
+            began = time.perf_counter()
+            copy_database(source, target)
+            self.stdout.write(
+                f"Copied {source} to {target} in {time.perf_counter() - began:.2f}s."
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
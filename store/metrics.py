@@ -0,0 +1,303 @@
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count, Min
+from django.tasks import TaskResultStatus
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file locks, dead workers' files are kept
+    fcntl = None
+
+# Prometheus metrics without a client library. Each process adds to its own
+# memory-mapped file of counters in METRICS_DIR; a scrape of /metrics sums
+# the files of every worker. A new process folds the files of exited ones
+# into its own, so counters stay monotonic across gunicorn worker restarts
+# without a file per dead worker piling up. Gauges are read from the
+# database at scrape time. Empty METRICS_DIR when deploying to reset the
+# counters.
+
+# Methods recorded as themselves; the label comes from the client, so any
+# other method is counted as "other" to keep the number of series bounded.
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+# Upper bounds (seconds) of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# name -> (type, help), in exposition order
+METRICS = {
+    'store_http_request_duration_seconds': (
+        'histogram', 'Time to serve a request, by view name, method and status.'),
+    'store_db_queries_total': (
+        'counter', 'Database queries run while serving requests, by view name.'),
+    'store_db_query_duration_seconds_total': (
+        'counter', 'Time spent in database queries while serving requests, by view name.'),
+    'store_catalog_cache_lookups_total': (
+        'counter', 'Catalog cache lookups, by result (hit or miss).'),
+    'store_page_cache_requests_total': (
+        'counter', 'Anonymous catalog pages served from the page cache, by result (hit, miss or stale).'),
+    'store_checkouts_total': (
+        'counter', 'Checkout attempts, by payment method and outcome (placed, invalid or failed).'),
+    'store_qr_payments_pending': (
+        'gauge', 'QR payments waiting for an admin to verify them.'),
+    'store_qr_payment_oldest_pending_seconds': (
+        'gauge', 'Age of the oldest QR payment waiting for verification.'),
+    'store_task_queue_depth': (
+        'gauge', 'Background tasks ready or running, by queue and status.'),
+}
+
+_HEADER = struct.Struct('<Q')  # bytes of the file in use
+_LENGTH = struct.Struct('<I')  # key length, before each entry
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 64 * 1024
+
+
+class CounterFile:
+    """
+    Float counters in a memory-mapped file written by one process. Entries
+    are [key length][key, padded to 8 bytes][float]; the header, which
+    readers trust, only moves past an entry once it is complete.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(_INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = _HEADER.unpack_from(self.map, 0)[0] or _HEADER.size
+        self.positions = {key: position for key, value, position in _entries(self.map, self.used)}
+
+    def add(self, key, amount=1):
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                position = self._append(key)
+            _VALUE.pack_into(self.map, position, _VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded = _LENGTH.size + len(encoded)
+        padded += -padded % 8
+        if self.used + padded + _VALUE.size > len(self.map):
+            size = len(self.map) * 2
+            self.map.close()
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        _LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + _LENGTH.size:self.used + _LENGTH.size + len(encoded)] = encoded
+        position = self.used + padded
+        _VALUE.pack_into(self.map, position, 0.0)
+        self.used = position + _VALUE.size
+        _HEADER.pack_into(self.map, 0, self.used)
+        self.positions[key] = position
+        return position
+
+
+def _entries(data, used):
+    offset = _HEADER.size
+    while offset < used:
+        length = _LENGTH.unpack_from(data, offset)[0]
+        key = bytes(data[offset + _LENGTH.size:offset + _LENGTH.size + length]).decode()
+        offset += _LENGTH.size + length
+        offset += -offset % 8
+        yield key, _VALUE.unpack_from(data, offset)[0], offset
+        offset += _VALUE.size
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+@contextmanager
+def _directory_lock(directory, exclusive):
+    """Between scrapes (shared) and a process folding dead files into its own."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_counters(path):
+    with open(path, 'rb') as stream:
+        data = stream.read()
+    if len(data) < _HEADER.size:
+        return []
+    return [(key, value) for key, value, position in _entries(data, _HEADER.unpack_from(data, 0)[0])]
+
+
+def _open_counter_file(directory):
+    """This process's file, with the counters of exited processes added in."""
+    os.makedirs(directory, exist_ok=True)
+    with _directory_lock(directory, exclusive=True):
+        counters = CounterFile(os.path.join(directory, f'{os.getpid()}.db'))
+        if fcntl is None:
+            return counters
+        for name in os.listdir(directory):
+            stem, ext = os.path.splitext(name)
+            if ext != '.db' or not stem.isdigit() or _alive(int(stem)):
+                continue
+            path = os.path.join(directory, name)
+            for key, value in _read_counters(path):
+                counters.add(key, value)
+            os.remove(path)
+        return counters
+
+
+def _counter_file():
+    directory = settings.METRICS_DIR
+    if not directory:
+        return None
+    # keyed by pid too: a forked worker must not write to its parent's file
+    key = (directory, os.getpid())
+    counters = _files.get(key)
+    if counters is None:
+        with _files_lock:
+            counters = _files.get(key)
+            if counters is None:
+                counters = _files[key] = _open_counter_file(directory)
+    return counters
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def sample_key(name, **labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in labels.items()) + '}'
+
+
+def inc(name, amount=1, **labels):
+    counters = _counter_file()
+    if counters is not None:
+        counters.add(sample_key(name, **labels), amount)
+
+
+def observe(name, value, **labels):
+    """Add value to histogram name (cumulative buckets, as exposed)."""
+    counters = _counter_file()
+    if counters is None:
+        return
+    for bound in LATENCY_BUCKETS:
+        if value <= bound:
+            le = '+Inf' if bound == math.inf else repr(bound)
+            counters.add(sample_key(f'{name}_bucket', **labels, le=le))
+    counters.add(sample_key(f'{name}_sum', **labels), value)
+    counters.add(sample_key(f'{name}_count', **labels))
+
+
+def observe_request(view, method, status, seconds, metrics):
+    """Record a served request; metrics is its instrumentation.RequestMetrics."""
+    method = method if method in HTTP_METHODS else 'other'
+    observe('store_http_request_duration_seconds', seconds, view=view, method=method, status=status)
+    inc('store_db_queries_total', metrics.queries, view=view)
+    inc('store_db_query_duration_seconds_total', metrics.db_time, view=view)
+
+
+def collect_counters(directory):
+    """Sum the counters of every process file in directory."""
+    totals = defaultdict(float)
+    if not os.path.isdir(directory):
+        return totals
+    # a dead process's counters are either in its file or already moved
+    # into a live one, never both, while the lock is held
+    with _directory_lock(directory, exclusive=False):
+        for name in os.listdir(directory):
+            if not name.endswith('.db'):
+                continue
+            for key, value in _read_counters(os.path.join(directory, name)):
+                totals[key] += value
+    return totals
+
+
+def collect_gauges():
+    from .models import Order, QueuedTask
+
+    pending = Order.objects.filter(payment_method='QR', payment_status='Pending').aggregate(
+        count=Count('id'), oldest=Min('ordered_date'),
+    )
+    gauges = {
+        'store_qr_payments_pending': pending['count'],
+        'store_qr_payment_oldest_pending_seconds': (
+            (timezone.now() - pending['oldest']).total_seconds() if pending['oldest'] else 0
+        ),
+    }
+    depth = (
+        QueuedTask.objects
+        .filter(status__in=[TaskResultStatus.READY, TaskResultStatus.RUNNING])
+        .values('queue_name', 'status')
+        .annotate(tasks=Count('id'))
+        .order_by()
+    )
+    for row in depth:
+        key = sample_key('store_task_queue_depth', queue=row['queue_name'], status=row['status'].lower())
+        gauges[key] = row['tasks']
+    return gauges
+
+
+_LE_RE = re.compile(r'(,?)le="([^"]+)"')
+_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+def _family(key):
+    name = key.split('{', 1)[0]
+    if name not in METRICS:
+        for suffix in _SUFFIXES:
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                return name[:-len(suffix)]
+    return name
+
+
+def _sample_order(key):
+    # histogram series together, their buckets by increasing le
+    name = key.split('{', 1)[0]
+    match = _LE_RE.search(key)
+    le = float(match.group(2)) if match else 0.0
+    series = _LE_RE.sub('', key[len(name):])
+    suffix = next((suffix for suffix in _SUFFIXES if name.endswith(suffix)), '')
+    return series, _SUFFIXES.index(suffix) if suffix else 0, le
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(int(value)) if value == int(value) else repr(value)
+
+
+def exposition():
+    """All metrics in the Prometheus text format (version 0.0.4)."""
+    samples = collect_counters(settings.METRICS_DIR) if settings.METRICS_DIR else {}
+    samples.update(collect_gauges())
+    families = defaultdict(list)
+    for key, value in samples.items():
+        families[_family(key)].append((key, value))
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(families.get(name, ()), key=lambda sample: _sample_order(sample[0])):
+            lines.append(f'{key} {_number(value)}')
+    return '\n'.join(lines) + '\n'
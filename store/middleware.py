@@ -0,0 +1,92 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from .instrumentation import record_request
+from .metrics import observe_request
+from .routers import PIN_SESSION_KEY, replica_configured, routing
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    For a REQUEST_METRICS_SAMPLE_RATE share of requests, record the queries,
+    database time, template time and context processor time, send them back
+    in a Server-Timing header and log them (at DEBUG). SQL run at least
+    REQUEST_METRICS_REPEATED_QUERIES times in one request (an N+1 loop) is
+    logged as a warning. Every request's latency and query totals also go
+    to the /metrics counters while METRICS_DIR is set; with neither, a
+    request skips all of it. Put it first, so the total covers the other
+    middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        self.repeated_threshold = settings.REQUEST_METRICS_REPEATED_QUERIES
+        self.exporting = bool(settings.METRICS_DIR)
+
+    def __call__(self, request):
+        sampled = self.sample_rate and random.random() < self.sample_rate
+        if not (sampled or self.exporting):
+            return self.get_response(request)
+
+        with record_request() as metrics:
+            response = self.get_response(request)
+        total = metrics.elapsed
+        match = request.resolver_match
+        view = match.view_name if match else '-'
+        if self.exporting:
+            observe_request(view, request.method, response.status_code, total, metrics)
+        if not sampled:
+            return response
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+            f'tpl;dur={metrics.template_time * 1000:.1f}',
+            f'cp;dur={metrics.processor_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f};desc="{view}"',
+        ])
+        logger.debug(
+            "request view=%s method=%s status=%d queries=%d db=%.1fms tpl=%.1fms cp=%.1fms total=%.1fms%s",
+            view, request.method, response.status_code, metrics.queries,
+            metrics.db_time * 1000, metrics.template_time * 1000,
+            metrics.processor_time * 1000, total * 1000,
+            ''.join(
+                f" cp.{name}={seconds * 1000:.1f}ms"
+                for name, seconds in metrics.processor_times.most_common()
+                if seconds >= 0.0001
+            ),
+        )
+        for sql, count in metrics.repeated_statements(self.repeated_threshold):
+            logger.warning(
+                "repeated query view=%s path=%s count=%d sql=%r",
+                view, request.path, count, sql,
+            )
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let CatalogReplicaRouter send this request's catalog reads to the
+    replica. A request that writes marks the session so the user's next
+    requests read their own writes from the primary until
+    REPLICA_PIN_SECONDS have passed. Must come after SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        pinned_until = request.session.get(PIN_SESSION_KEY, 0)
+        with routing(pinned=pinned_until > time.time()) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            request.session[PIN_SESSION_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+        return response
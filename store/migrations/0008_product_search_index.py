@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from store.search import SQLiteFTS5Backend
+
+    backend = SQLiteFTS5Backend(using=schema_editor.connection.alias)
+    backend.setup()
+    Product = apps.get_model('store', 'Product')
+    products = Product.objects.using(backend.using).filter(is_active=True)
+    backend.index_products(list(products))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS store_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_alter_product_options_alter_product_category_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def populate_facet_counts(apps, schema_editor):
+    from store.facets import facet_key
+
+    Product = apps.get_model('store', 'Product')
+    ProductFacetCount = apps.get_model('store', 'ProductFacetCount')
+    cells = Counter(
+        facet_key(*row) for row in Product.objects.values_list(
+            'category_id', 'price', 'is_featured', 'is_active'
+        ).iterator()
+    )
+    cells.pop(None, None)
+    ProductFacetCount.objects.bulk_create([
+        ProductFacetCount(
+            category_id=category_id, price_band=band,
+            is_featured=featured, product_count=count,
+        )
+        for (category_id, band, featured), count in cells.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_band', models.PositiveSmallIntegerField()),
+                ('is_featured', models.BooleanField()),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'price_band', 'is_featured'), name='unique_product_facet_cell')],
+            },
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
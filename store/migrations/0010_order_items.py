@@ -0,0 +1,136 @@
+# Generated by Django 6.0 on 2026-10-17 09:40
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Rows written by one checkout of the old per-line loop are milliseconds apart.
+CHECKOUT_WINDOW = timedelta(seconds=5)
+
+# Rows are only merged when all of these agree: a line an admin has since
+# cancelled stays an order of its own. The old checkout saved a copy of the
+# payment proof per line, so proof names differ within one checkout and the
+# order keeps the first row's proof, payment status and notes.
+ORDER_FIELDS = ('user_id', 'address_id', 'payment_method', 'status')
+
+
+def group_order_lines(apps, schema_editor):
+    """
+    Fold the old one-row-per-cart-line orders into one header per checkout:
+    consecutive rows with the same ORDER_FIELDS placed within
+    CHECKOUT_WINDOW become the lines of the earliest row.
+
+    The old rows kept no price, so unit_price (and the total) is the
+    product's price when the migration runs, not the price paid.
+    """
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    def fields(order):
+        return tuple(getattr(order, name) for name in ORDER_FIELDS)
+
+    rows = Order.objects.select_related('product').order_by(*ORDER_FIELDS, 'ordered_date', 'id')
+    items = []
+    merged_ids = []
+    totals = {}
+    header = None
+    for row in rows.iterator():
+        if (
+            header is None
+            or fields(row) != fields(header)
+            or row.ordered_date - last_date > CHECKOUT_WINDOW
+        ):
+            header = row
+            totals[header.id] = 0
+        else:
+            merged_ids.append(row.id)
+        last_date = row.ordered_date
+        items.append(OrderItem(
+            order_id=header.id,
+            product_id=row.product_id,
+            quantity=row.quantity,
+            unit_price=row.product.price,
+        ))
+        totals[header.id] += row.quantity * row.product.price
+
+    OrderItem.objects.bulk_create(items, batch_size=500)
+    for start in range(0, len(merged_ids), 500):
+        Order.objects.filter(id__in=merged_ids[start:start + 500]).delete()
+    for order_id, total in totals.items():
+        Order.objects.filter(id=order_id).update(total_amount=total)
+
+
+def split_order_lines(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    copied = [field.attname for field in Order._meta.concrete_fields if not field.primary_key]
+    for order in Order.objects.all().iterator():
+        lines = list(OrderItem.objects.filter(order_id=order.id).order_by('id'))
+        if not lines:
+            continue
+        first, rest = lines[0], lines[1:]
+        Order.objects.filter(id=order.id).update(
+            product_id=first.product_id, quantity=first.quantity
+        )
+        if not rest:
+            continue
+        copies = Order.objects.bulk_create([
+            Order(**{
+                **{name: getattr(order, name) for name in copied},
+                'product_id': line.product_id,
+                'quantity': line.quantity,
+            })
+            for line in rest
+        ])
+        # auto_now_add stamped the copies with the current time
+        Order.objects.filter(id__in=[copy.id for copy in copies]).update(
+            ordered_date=order.ordered_date
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_facet_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Total Amount'),
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Unit Price')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='store.order', verbose_name='Order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product', verbose_name='Product')),
+            ],
+        ),
+        # product/quantity must be nullable while reversing, before the lines
+        # are copied back into them
+        migrations.AlterField(
+            model_name='order',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='store.product', verbose_name='Product'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='quantity',
+            field=models.PositiveIntegerField(null=True, verbose_name='Quantity'),
+        ),
+        migrations.RunPython(group_order_lines, split_order_lines),
+        migrations.RemoveField(
+            model_name='order',
+            name='product',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='quantity',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_order_status_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_path', models.CharField(max_length=255)),
+                ('queue_name', models.CharField(max_length=32)),
+                ('priority', models.SmallIntegerField(default=0)),
+                ('status', models.CharField(choices=[('READY', 'Ready'), ('RUNNING', 'Running'), ('FAILED', 'Failed'), ('SUCCESSFUL', 'Successful')], default='READY', max_length=10)),
+                ('args', models.JSONField(default=list)),
+                ('kwargs', models.JSONField(default=dict)),
+                ('run_after', models.DateTimeField()),
+                ('enqueued_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_attempted_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('claim', models.CharField(blank=True, default='', max_length=32)),
+                ('worker_ids', models.JSONField(default=list)),
+                ('errors', models.JSONField(default=list)),
+                ('return_value', models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'queue_name', '-priority', 'run_after'], name='queued_task_claim_idx'), models.Index(fields=['claim'], name='queued_task_batch_idx')],
+            },
+        ),
+    ]
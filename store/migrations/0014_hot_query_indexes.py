@@ -0,0 +1,96 @@
+# Generated by Django 6.0 on 2026-10-17 16:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def dedupe_category_slugs(apps, schema_editor):
+    """
+    Slugs were not unique before: the first category keeps its slug, later
+    ones get -<id>, or -<id>-2, -<id>-3... when another category has it.
+    """
+    Category = apps.get_model('store', 'Category')
+    max_length = Category._meta.get_field('slug').max_length
+    duplicates = (
+        Category.objects.values('slug')
+        .annotate(categories=Count('id'))
+        .filter(categories__gt=1)
+    )
+    for row in duplicates.iterator():
+        later = Category.objects.filter(slug=row['slug']).order_by('id')[1:]
+        for category in later:
+            suffix, counter = f'-{category.id}', 1
+            slug = category.slug[:max_length - len(suffix)] + suffix
+            while Category.objects.filter(slug=slug).exists():
+                counter += 1
+                suffix = f'-{category.id}-{counter}'
+                slug = category.slug[:max_length - len(suffix)] + suffix
+            Category.objects.filter(id=category.id).update(slug=slug)
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Concurrent adds could leave two lines for one product: keep the first, summed."""
+    Cart = apps.get_model('store', 'Cart')
+    duplicates = (
+        Cart.objects.values('user_id', 'product_id')
+        .annotate(lines=Count('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates.iterator():
+        lines = Cart.objects.filter(user_id=row['user_id'], product_id=row['product_id']).order_by('id')
+        keep = lines.values_list('id', flat=True).first()
+        Cart.objects.filter(id=keep).update(quantity=row['total'])
+        lines.exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_category_slugs, migrations.RunPython.noop),
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(max_length=55, unique=True, verbose_name='Category Slug'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_user_product_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at'], name='category_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_featured', True)), fields=['created_at'], name='category_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-ordered_date'], name='order_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at'], name='product_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'created_at'], name='product_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_featured', True)), fields=['created_at'], name='product_featured_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 18:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('payment_method', 'QR'), ('payment_status', 'Pending')), fields=['ordered_date'], name='order_qr_pending_idx'),
+        ),
+    ]
@@ -1,7 +1,51 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.tasks import TaskResultStatus
+
+from .cache import bump_catalog_version
+from .facets import rebuild_facet_counts
+
+# Product fields that decide which ProductFacetCount cell a product is in.
+FACET_FIELDS = {'category', 'category_id', 'price', 'is_featured', 'is_active'}
 
 # Create your models here.
+class CatalogQuerySet(models.QuerySet):
+    """
+    update()/bulk_create()/bulk_update() skip post_save, so the bulk paths
+    (admin actions, imports) bump the catalog version themselves and, when a
+    faceted field may have changed, recount the shop facets. update() also
+    stamps updated_at, which the page cache's Last-Modified/ETag are built on.
+    """
+
+    def _bulk_changed(self, fields=None):
+        transaction.on_commit(bump_catalog_version, using=self.db)
+        if self.model is Product and (fields is None or FACET_FIELDS.intersection(fields)):
+            transaction.on_commit(rebuild_facet_counts, using=self.db)
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        rows = super().update(**kwargs)
+        if rows:
+            self._bulk_changed(kwargs)
+        return rows
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            self._bulk_changed()
+        return objs
+    bulk_create.alters_data = True
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows:
+            self._bulk_changed(fields)
+        return rows
+    bulk_update.alters_data = True
+
+
 class Address(models.Model):
     user = models.ForeignKey(User, verbose_name="User", on_delete=models.CASCADE)
     locality = models.CharField(max_length=150, verbose_name="Nearest Location")
@@ -14,7 +58,7 @@ class Address(models.Model):
 
 class Category(models.Model):
     title = models.CharField(max_length=50, verbose_name="Category Title")
-    slug = models.SlugField(max_length=55, verbose_name="Category Slug")
+    slug = models.SlugField(max_length=55, unique=True, verbose_name="Category Slug")
     description = models.TextField(blank=True, verbose_name="Category Description")
     category_image = models.ImageField(upload_to='category', blank=True, null=True, verbose_name="Category Image")
     is_active = models.BooleanField(verbose_name="Is Active?")
@@ -22,9 +66,24 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created Date")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated Date")
 
+    objects = CatalogQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ('-created_at', )
+        # Django writes is_active=True as a bare `WHERE "is_active"`, which
+        # SQLite cannot look up in an index key, so the flag filters are
+        # partial indexes ordered for the listing that uses them.
+        indexes = [
+            models.Index(
+                fields=['created_at'], condition=models.Q(is_active=True),
+                name='category_active_idx',
+            ),
+            models.Index(
+                fields=['created_at'], condition=models.Q(is_active=True, is_featured=True),
+                name='category_featured_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -48,6 +107,26 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CatalogQuerySet.as_manager()
+
+    class Meta:
+        # Listings walk these newest first (see store.pagination.keyset_page);
+        # the rowid that ends every SQLite index key breaks created_at ties.
+        indexes = [
+            models.Index(
+                fields=['created_at'], condition=models.Q(is_active=True),
+                name='product_active_idx',
+            ),
+            models.Index(
+                fields=['category', 'created_at'], condition=models.Q(is_active=True),
+                name='product_active_category_idx',
+            ),
+            models.Index(
+                fields=['created_at'], condition=models.Q(is_active=True, is_featured=True),
+                name='product_featured_idx',
+            ),
+        ]
+
 
 class Cart(models.Model):
     user = models.ForeignKey(User, verbose_name="User", on_delete=models.CASCADE)
@@ -56,6 +135,12 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created Date")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated Date")
 
+    class Meta:
+        # one line per product: adding it again raises the quantity
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cart_user_product_uniq'),
+        ]
+
     def __str__(self):
         return str(self.user)
     
@@ -81,10 +166,9 @@ PAYMENT_STATUS_CHOICES = (
 )
 
 class Order(models.Model):
-    user = models.ForeignKey(User, verbose_name="User", on_delete=models.CASCADE)
+    # indexed by order_user_date_idx
+    user = models.ForeignKey(User, verbose_name="User", on_delete=models.CASCADE, db_index=False)
     address = models.ForeignKey(Address, verbose_name="Shipping Address", on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, verbose_name="Product", on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField(verbose_name="Quantity")
 
     payment_method = models.CharField(
         max_length=10,
@@ -125,9 +209,207 @@ class Order(models.Model):
         default="Pending"
     )
 
+    # Sum of the line totals, stored so listings never have to join the lines
+    total_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name="Total Amount"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-ordered_date'], name='order_user_date_idx'),
+            # the QR verification backlog, counted on every /metrics scrape
+            models.Index(
+                fields=['ordered_date'],
+                condition=models.Q(payment_method='QR', payment_status='Pending'),
+                name='order_qr_pending_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Order #{self.id}"
-    
+
+    # Uses the prefetched items when the queryset has prefetch_related('items')
     @property
-    def total_amount(self):
-        return self.quantity * self.product.price
\ No newline at end of file
+    def total_quantity(self):
+        return sum(item.quantity for item in self.items.all())
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, related_name='items', verbose_name="Order", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name="Product", on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(verbose_name="Quantity")
+    # Price at checkout time, later catalog price changes do not alter the order
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Unit Price")
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id}"
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+
+# Audit rows store statuses as small integers (their position in
+# STATUS_CHOICES) to keep the table compact.
+STATUS_CODE_CHOICES = tuple(
+    (code, label) for code, (value, label) in enumerate(STATUS_CHOICES)
+)
+
+
+class OrderStatusChange(models.Model):
+    """
+    Append-only log of order status transitions, written in batches by
+    store.order_states. Rows are never updated.
+    """
+    order = models.ForeignKey(Order, related_name='status_changes', on_delete=models.CASCADE)
+    from_status = models.PositiveSmallIntegerField(choices=STATUS_CODE_CHOICES)
+    to_status = models.PositiveSmallIntegerField(choices=STATUS_CODE_CHOICES)
+    changed_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"#{self.order_id}: {self.get_from_status_display()} -> {self.get_to_status_display()}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Order status changes are append-only.")
+        super().save(*args, **kwargs)
+
+class ProductFacetCount(models.Model):
+    """
+    Number of active products per (category, price band, featured) cell.
+    Kept in step with Product by store.signals so the shop facets never
+    have to GROUP BY over the product table; see store.facets.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    price_band = models.PositiveSmallIntegerField()
+    is_featured = models.BooleanField()
+    product_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category', 'price_band', 'is_featured'],
+                name='unique_product_facet_cell',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id}/{self.price_band}/{self.is_featured}: {self.product_count}"
+
+
+class QueuedTask(models.Model):
+    """
+    A background task stored by the database task backend
+    (store.task_queue.DatabaseBackend) until a `run_task_worker` process
+    claims and runs it. Failed attempts go back to READY with a later
+    run_after until the backend's MAX_ATTEMPTS is used up.
+    """
+    task_path = models.CharField(max_length=255)
+    queue_name = models.CharField(max_length=32)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(
+        max_length=10,
+        choices=TaskResultStatus.choices,
+        default=TaskResultStatus.READY,
+    )
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    run_after = models.DateTimeField()
+    enqueued_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_attempted_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # token of the worker batch currently holding the row, see Worker.claim()
+    claim = models.CharField(max_length=32, blank=True, default='')
+    worker_ids = models.JSONField(default=list)
+    errors = models.JSONField(default=list)
+    return_value = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'queue_name', '-priority', 'run_after'],
+                name='queued_task_claim_idx',
+            ),
+            models.Index(fields=['claim'], name='queued_task_batch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task_path} [{self.status}]"
+
+
+class DailyProductSales(models.Model):
+    """
+    Units and revenue per product and order day, kept up to date by
+    store.sales_rollups so reports never scan the order tables. Cancelled
+    orders are not counted.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    order_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.revenue}"
+
+
+class DailyCategorySales(models.Model):
+    """Same as DailyProductSales, per category."""
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    order_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily category sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_daily_category_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category_id}: {self.revenue}"
+
+
+class DailyPaymentSales(models.Model):
+    """
+    Orders and order totals per order day, payment method and current order
+    status. Cancelled orders are included, under their own status.
+    """
+    day = models.DateField()
+    payment_method = models.CharField(max_length=10)
+    order_status = models.CharField(choices=STATUS_CHOICES, max_length=50)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily payment sales'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'payment_method', 'order_status'],
+                name='unique_daily_payment_sales',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.payment_method}/{self.order_status}: {self.revenue}"
+
+
+class SalesDashboard(DailyCategorySales):
+    """Admin entry for the sales dashboard (store.admin.SalesDashboardAdmin)."""
+
+    class Meta:
+        proxy = True
+        verbose_name = 'Sales dashboard'
+        verbose_name_plural = 'Sales dashboard'
@@ -0,0 +1,79 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import STATUS_CHOICES, Order, OrderStatusChange
+from .sales_rollups import move_orders
+
+# Allowed order status transitions. Delivered and Cancelled are final, and
+# an order that has left the shop can no longer be cancelled.
+TRANSITIONS = {
+    'Pending': ('Accepted', 'Cancelled'),
+    'Accepted': ('Packed', 'Cancelled'),
+    'Packed': ('On The Way', 'Cancelled'),
+    'On The Way': ('Delivered',),
+    'Delivered': (),
+    'Cancelled': (),
+}
+
+STATUS_CODES = {value: code for code, (value, label) in enumerate(STATUS_CHOICES)}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def can_transition(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, ())
+
+
+def source_statuses(to_status):
+    """The statuses an order may move to to_status from."""
+    if to_status not in TRANSITIONS:
+        raise InvalidTransition(f"Unknown order status: {to_status!r}")
+    return [status for status, targets in TRANSITIONS.items() if to_status in targets]
+
+
+def _record_changes(orders, from_status, to_status, actor_id, changed_at):
+    """INSERT ... SELECT one audit row per order in the orders queryset."""
+    select_sql, params = orders.values('id').query.sql_with_params()
+    table = connection.ops.quote_name(OrderStatusChange._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (order_id, from_status, to_status, changed_by_id, changed_at) "
+            f"SELECT batch.id, %s, %s, %s, %s FROM ({select_sql}) batch",
+            [
+                STATUS_CODES[from_status],
+                STATUS_CODES[to_status],
+                actor_id,
+                connection.ops.adapt_datetimefield_value(changed_at),
+                *params,
+            ],
+        )
+        return cursor.rowcount
+
+
+def transition(queryset, to_status, actor=None):
+    """
+    Move every order in queryset that is allowed to reach to_status, and
+    return how many moved. Orders whose current status does not allow it are
+    left untouched.
+
+    Each allowed source status costs a fixed number of statements whatever
+    the batch size: an INSERT ... SELECT into the audit table, the sales
+    rollup adjustments (store.sales_rollups) and one conditional UPDATE.
+    The audit insert takes the write lock first, so all of them see the
+    same rows.
+    """
+    changed_at = timezone.now()
+    actor_id = getattr(actor, 'pk', None)
+    moved = 0
+    with transaction.atomic():
+        for from_status in source_statuses(to_status):
+            orders = Order.objects.filter(
+                pk__in=queryset.values('pk'), status=from_status
+            )
+            if not _record_changes(orders, from_status, to_status, actor_id, changed_at):
+                continue
+            move_orders(orders, from_status, to_status)
+            moved += orders.update(status=to_status)
+    return moved
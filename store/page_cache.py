@@ -0,0 +1,157 @@
+import functools
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, urlencode
+
+from . import metrics
+from .cache import get_catalog_version
+from .routers import use_primary
+from .session_cart import SessionCart
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+# Browsers and the CDN revalidate every time (answered with a 304 while the
+# ETag holds) but may keep showing their copy this long while they do.
+PAGE_STALE_WHILE_REVALIDATE = getattr(settings, 'PAGE_STALE_WHILE_REVALIDATE', 30)
+# The deployed code and templates: a new release renders every page again.
+PAGE_CACHE_RELEASE = getattr(settings, 'PAGE_CACHE_RELEASE', '')
+# Longest a render may hold a page's lock.
+RENDER_LOCK_TIMEOUT = 30
+
+
+def cacheable(request):
+    # no session cookie: anonymous, and nothing per-visitor beyond the
+    # cookie cart, whose size is part of the key; a pending flash message
+    # must be rendered (and consumed) for this visitor only
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def shown(request, label, rows):
+    """
+    Note the catalog rows (instances or dicts with id and updated_at) a page
+    displays; its ETag and Last-Modified are computed from them.
+    """
+    seen = getattr(request, '_page_cache_rows', None)
+    if seen is None:
+        return
+    for row in rows:
+        if row is None:
+            continue
+        if isinstance(row, dict):
+            seen.add((label, row['id'], row['updated_at']))
+        else:
+            seen.add((label, row.pk, row.updated_at))
+
+
+def page_key(request, cart_count, params=()):
+    # only the query parameters the view reads are part of the key, so
+    # tracking parameters and cache busters share the page
+    query = urlencode([(name, request.GET[name]) for name in params if name in request.GET])
+    path = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'store:page:{path}:{cart_count}'
+
+
+def _entry(response, rows, version, cart_count):
+    rows = sorted(rows, key=lambda row: (row[0], row[1]))
+    fingerprint = hashlib.md5(repr((PAGE_CACHE_RELEASE, rows, cart_count)).encode()).hexdigest()
+    return {
+        'version': version,
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': f'"{fingerprint}"',
+        'last_modified': int(max(row[2] for row in rows).timestamp()) if rows else None,
+    }
+
+
+def _response(request, entry, state):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    response['X-Page-Cache'] = state
+    # a response that will set a cookie (the CSRF one, if anything asked for
+    # a token) must not be stored by a shared cache and sent to others
+    audience = 'private' if request.META.get('CSRF_COOKIE_NEEDS_UPDATE') else 'public'
+    patch_cache_control(
+        response, **{audience: True}, max_age=0, stale_while_revalidate=PAGE_STALE_WHILE_REVALIDATE,
+    )
+    patch_vary_headers(response, ['Cookie'])
+    metrics.inc('store_page_cache_requests_total', result=state.lower())
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+    )
+
+
+def anonymous_page_cache(view=None, *, params=()):
+    """
+    Full-page cache for anonymous visitors of a catalog view. Pages are
+    stored per path, the query params the view reads and cookie cart size,
+    tagged with the catalog version, and answered with ETag/Last-Modified
+    so repeat visits get a 304. The version and ETag include
+    PAGE_CACHE_RELEASE, so a deploy with new templates renders pages again.
+    Stored pages are rendered from the primary, as a lagging replica would
+    file old rows under the new version.
+
+    After a catalog change or a deploy, the request that takes the page's
+    render lock renders it in line. The previous copy (stale-while-
+    revalidate) goes only to requests that can't take the lock while it is
+    held; with none they render the page themselves, without storing it.
+    It is also served if the render fails on a database error.
+    """
+    if view is None:
+        return functools.partial(anonymous_page_cache, params=params)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not cacheable(request):
+            return view(request, *args, **kwargs)
+
+        cart_count = len(SessionCart(request))
+        key = page_key(request, cart_count, params)
+        version = (PAGE_CACHE_RELEASE, get_catalog_version())
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return _response(request, entry, 'HIT')
+        stale = entry
+
+        lock = f'{key}:lock'
+        if not cache.add(lock, 1, timeout=RENDER_LOCK_TIMEOUT):
+            if stale is not None:
+                return _response(request, stale, 'STALE')
+            return view(request, *args, **kwargs)
+
+        try:
+            request._page_cache_rows = set()
+            with use_primary():
+                response = view(request, *args, **kwargs)
+        except DatabaseError:
+            if stale is None:
+                raise
+            logger.warning("page render failed, serving the stale copy of %s", request.path, exc_info=True)
+            return _response(request, stale, 'STALE')
+        finally:
+            cache.delete(lock)
+
+        # never share a page carrying a visitor's CSRF token
+        if (
+            response.status_code != 200
+            or response.streaming
+            or b'csrfmiddlewaretoken' in response.content
+        ):
+            return response
+        entry = _entry(response, request._page_cache_rows, version, cart_count)
+        cache.set(key, entry, timeout=PAGE_CACHE_TIMEOUT)
+        return _response(request, entry, 'MISS')
+    return wrapper
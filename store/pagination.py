@@ -0,0 +1,91 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import cached_catalog
+
+CATEGORY_PAGE_SIZE = 12
+
+
+def encode_cursor(obj):
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Return (created_at, id) for a cursor made by encode_cursor(), or None if
+    it is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, page_size=CATEGORY_PAGE_SIZE):
+    """
+    Newest-first page of queryset ordered on (created_at, id).
+
+    Rather than OFFSET, the cursor names the last row of the previous page, so
+    page 500 costs the same index range scan as page 1.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    rows = list(queryset[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        'object_list': rows,
+        'next_cursor': encode_cursor(rows[-1]) if has_next else None,
+    }
+
+
+def cached_first_page(name, queryset, cursor, *parts):
+    """
+    keyset_page() of queryset, through the catalog cache for first pages
+    that have rows. Cursors and filters come from the client, so caching
+    every page asked for would let anyone fill the cache; later pages cost
+    the same index range scan as the first and are read directly.
+    """
+    if cursor:
+        return keyset_page(queryset, cursor)
+    return cached_catalog(
+        name, lambda: keyset_page(queryset), *parts, keep=lambda page: page['object_list'],
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for the large admin changelists. The unfiltered COUNT(*) is
+    cached for COUNT_CACHE_TIMEOUT seconds, and filtered or searched lists
+    count at most COUNT_LIMIT rows, so no page load scans the whole table.
+    """
+    COUNT_LIMIT = 10000
+    COUNT_CACHE_TIMEOUT = 300
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if queryset.query.where:
+            return queryset[:self.COUNT_LIMIT].count()
+        return cache.get_or_set(
+            f'store:admin-count:{queryset.model._meta.label_lower}',
+            queryset.count,
+            self.COUNT_CACHE_TIMEOUT,
+        )
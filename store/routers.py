@@ -0,0 +1,135 @@
+import contextlib
+import contextvars
+import logging
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = 'replica'
+
+# Catalog and analytics models whose reads may lag behind the primary.
+# Carts, orders, users and sessions always stay on the primary.
+REPLICA_MODELS = {
+    'category',
+    'product',
+    'productfacetcount',
+    'dailyproductsales',
+    'dailycategorysales',
+    'dailypaymentsales',
+    'salesdashboard',
+}
+
+# Session key holding the time.time() until which a user who just wrote
+# reads from the primary. Keep REPLICA_PIN_SECONDS above the replica lag.
+PIN_SESSION_KEY = '_db_primary_until'
+
+# Seconds between checks that the replica can be opened.
+HEALTH_CHECK_INTERVAL = 30
+
+# Routing state of the current request, set by ReplicaRoutingMiddleware.
+# Outside a request (commands, tasks, the shell) it is None and every read
+# goes to the primary.
+_routing = contextvars.ContextVar('store_db_routing', default=None)
+_health = {'checked_at': None, 'available': False}
+
+
+class RequestRouting:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def replica_available():
+    """
+    True when the replica can be opened, checked at most once per
+    HEALTH_CHECK_INTERVAL per process. While it is down reads fall back to
+    the primary.
+    """
+    now = time.monotonic()
+    checked_at = _health['checked_at']
+    if checked_at is not None and now - checked_at < HEALTH_CHECK_INTERVAL:
+        return _health['available']
+    try:
+        with connections[REPLICA_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT 1')
+        available = True
+    except DatabaseError as exc:
+        if _health['available'] or checked_at is None:
+            logger.warning("Read replica unavailable, reading from the primary: %s", exc)
+        available = False
+    _health.update(checked_at=now, available=available)
+    return available
+
+
+@contextlib.contextmanager
+def routing(pinned=False):
+    """Route the reads inside the block as for a request; see the middleware."""
+    state = RequestRouting(pinned)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Send every read inside the block to the primary."""
+    state = _routing.get()
+    if state is None or state.pinned:
+        yield
+        return
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = False
+
+
+class CatalogReplicaRouter:
+    """
+    Send catalog and analytics reads made while serving a request to the
+    replica, unless the user wrote something in this request or within the
+    last REPLICA_PIN_SECONDS, a transaction is open on the primary, or the
+    replica is down. Writes always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is None
+            or state.pinned
+            or state.wrote
+            or model._meta.app_label != 'store'
+            or model._meta.model_name not in REPLICA_MODELS
+            or not replica_configured()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+            or not replica_available()
+        ):
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica is a copy of the primary, see `manage.py sync_replica`
+        if db == REPLICA_ALIAS:
+            return False
+        return None
@@ -0,0 +1,187 @@
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCategorySales, DailyPaymentSales, DailyProductSales, Order, OrderItem
+
+# The daily rollups are adjusted in the same transaction as the orders they
+# describe: record_orders() when orders are placed (or removed), move_orders()
+# from store.order_states when their status changes, so reports read a few
+# hundred rollup rows instead of joining and multiplying the order lines.
+# Every adjustment is a set-based INSERT ... ON CONFLICT DO UPDATE, whatever
+# the number of orders (SQLite 3.24+ or PostgreSQL).
+
+# Cancelled orders stay in DailyPaymentSales under their status but are taken
+# out of the product and category revenue.
+UNCOUNTED_STATUS = 'Cancelled'
+
+LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * F('unit_price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+# rollup model -> ({key column: column of the values() rows}, summed columns)
+ROLLUP_COLUMNS = {
+    DailyProductSales: (
+        {'day': 'day', 'product_id': 'product'},
+        ('order_count', 'units', 'revenue'),
+    ),
+    DailyCategorySales: (
+        {'day': 'day', 'category_id': 'product__category'},
+        ('order_count', 'units', 'revenue'),
+    ),
+    DailyPaymentSales: (
+        {'day': 'day', 'payment_method': 'payment_method', 'order_status': 'order_status'},
+        ('order_count', 'revenue'),
+    ),
+}
+
+
+def _add(model, rows, sign=1):
+    """
+    Add rows, a values() queryset with the key and summed columns, into
+    model's table; sign=-1 subtracts them.
+    """
+    keys, totals = ROLLUP_COLUMNS[model]
+    select_sql, params = rows.query.sql_with_params()
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = ', '.join(qn(column) for column in [*keys, *totals])
+    selected = ', '.join(
+        [f'batch.{qn(source)}' for source in keys.values()]
+        + [f'%s * batch.{qn(column)}' for column in totals]
+    )
+    updates = ', '.join(
+        f'{qn(column)} = {table}.{qn(column)} + excluded.{qn(column)}' for column in totals
+    )
+    with connection.cursor() as cursor:
+        # "WHERE true" keeps SQLite from reading ON CONFLICT as a join clause
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {selected} FROM ({select_sql}) batch "
+            f"WHERE true ON CONFLICT ({', '.join(qn(column) for column in keys)}) "
+            f"DO UPDATE SET {updates}",
+            [sign] * len(totals) + list(params),
+        )
+
+
+def _line_rows(orders, group):
+    counted = orders.exclude(status=UNCOUNTED_STATUS).values('pk')
+    return (
+        OrderItem.objects.filter(order__in=counted)
+        .annotate(day=TruncDate('order__ordered_date'))
+        .values('day', group)
+        .annotate(
+            order_count=Count('order', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum(LINE_TOTAL),
+        )
+        .order_by()
+    )
+
+
+def _payment_rows(orders, status=None):
+    return (
+        Order.objects.filter(pk__in=orders.values('pk'))
+        .annotate(
+            day=TruncDate('ordered_date'),
+            order_status=F('status') if status is None else Value(status),
+        )
+        .values('day', 'payment_method', 'order_status')
+        .annotate(order_count=Count('id'), revenue=Sum('total_amount'))
+        .order_by()
+    )
+
+
+def record_orders(orders, sign=1):
+    """Count the orders queryset (with its lines) in every rollup; sign=-1 removes it."""
+    _add(DailyProductSales, _line_rows(orders, 'product'), sign)
+    _add(DailyCategorySales, _line_rows(orders, 'product__category'), sign)
+    _add(DailyPaymentSales, _payment_rows(orders), sign)
+
+
+def move_orders(orders, from_status, to_status):
+    """
+    Follow a status change of the orders queryset. Must run before the
+    orders are updated, while they still have from_status.
+    """
+    _add(DailyPaymentSales, _payment_rows(orders, from_status), -1)
+    _add(DailyPaymentSales, _payment_rows(orders, to_status))
+    if to_status == UNCOUNTED_STATUS:
+        _add(DailyProductSales, _line_rows(orders, 'product'), -1)
+        _add(DailyCategorySales, _line_rows(orders, 'product__category'), -1)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def backfill(since=None, chunk_size=1000):
+    """
+    Rebuild the rollups from the orders placed on or after since (all of
+    them when None), chunk_size orders per transaction so the write lock is
+    never held for long. Yields (orders processed, last order id) after each
+    chunk. Orders placed while this runs are counted by checkout as usual;
+    status changes to orders not yet reached would be counted twice, so run
+    it when the shop is quiet.
+    """
+    orders = Order.objects.all()
+    with transaction.atomic():
+        for model in ROLLUP_COLUMNS:
+            stale = model.objects.all()
+            if since is not None:
+                stale = stale.filter(day__gte=since)
+            stale.delete()
+        # later orders were recorded by checkout after the delete
+        last_id = Order.objects.aggregate(last=Max('pk'))['last'] or 0
+    if since is not None:
+        orders = orders.filter(ordered_date__gte=day_start(since))
+
+    done = 0
+    chunk_start = 0
+    while True:
+        ids = list(
+            orders.filter(pk__gt=chunk_start, pk__lte=last_id)
+            .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            record_orders(orders.filter(pk__gt=chunk_start, pk__lte=ids[-1]))
+        done += len(ids)
+        chunk_start = ids[-1]
+        yield done, chunk_start
+
+
+def sales_report(since, until):
+    """Dashboard figures for the days since..until (inclusive), from the rollups only."""
+    days = {'day__gte': since, 'day__lte': until}
+    payments = DailyPaymentSales.objects.filter(**days)
+    counted = payments.exclude(order_status=UNCOUNTED_STATUS)
+    return {
+        'totals': counted.aggregate(orders=Sum('order_count'), revenue=Sum('revenue')),
+        'daily': list(
+            counted.values('day')
+            .annotate(orders=Sum('order_count'), revenue=Sum('revenue'))
+            .order_by('day')
+        ),
+        'categories': list(
+            DailyCategorySales.objects.filter(**days)
+            .values('category__title')
+            .annotate(units=Sum('units'), revenue=Sum('revenue'))
+            .order_by('-revenue')
+        ),
+        'products': list(
+            DailyProductSales.objects.filter(**days)
+            .values('product__title', 'product__sku')
+            .annotate(units=Sum('units'), revenue=Sum('revenue'))
+            .order_by('-revenue')[:10]
+        ),
+        'payments': list(
+            payments.values('payment_method', 'order_status')
+            .annotate(orders=Sum('order_count'), revenue=Sum('revenue'))
+            .order_by('payment_method', 'order_status')
+        ),
+    }
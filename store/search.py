@@ -0,0 +1,171 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+SEARCH_PAGE_SIZE = 12
+
+_TOKEN_RE = re.compile(r'\w[\w-]*', re.UNICODE)
+
+
+class SearchBackend:
+    """
+    Interface for product full-text search. Only active products are indexed;
+    callers pass product ids and get ranked ids back, the rows themselves are
+    always loaded through the ORM.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def setup(self):
+        """Create whatever storage the index needs. Must be idempotent."""
+
+    def index_products(self, products):
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, limit=SEARCH_PAGE_SIZE, offset=0):
+        """Return (ranked product ids, total number of matches)."""
+        raise NotImplementedError
+
+    def match_ids(self, query):
+        """
+        The ids of the products matching query, for an __in lookup. Backends
+        that can return a subquery, so a common term never turns into a
+        list of parameters longer than the database accepts.
+        """
+        ids, total = self.search(query, limit=None)
+        return ids
+
+    def filter_queryset(self, queryset, query):
+        """Narrow a Product queryset to the matches for query (admin search)."""
+        return queryset.filter(id__in=self.match_ids(query))
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    FTS5 virtual table whose rowid is the product id. Lookups go through the
+    FTS index, so search cost follows the number of matches rather than the
+    size of store_product.
+    """
+
+    table = 'store_product_fts'
+    # bm25 column weights: a title hit outranks a SKU hit outranks body text
+    weights = (10.0, 5.0, 1.0)
+
+    @cached_property
+    def connection(self):
+        return connections[self.using]
+
+    def setup(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "title, sku, short_description, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+
+    def index_products(self, products):
+        rows = [
+            (p.id, p.title, p.sku, p.short_description)
+            for p in products if p.is_active
+        ]
+        stale = [p.id for p in products if not p.is_active]
+        with self.connection.cursor() as cursor:
+            ids = [(row[0],) for row in rows] + [(pk,) for pk in stale]
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", ids)
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, title, sku, short_description) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s",
+                [(pk,) for pk in product_ids],
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def match_expression(self, query):
+        # Quote every token so user input can never be parsed as FTS5 syntax;
+        # the trailing * turns the last token into a prefix match.
+        tokens = _TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        terms = ['"%s"' % token.replace('"', '""') for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def search(self, query, limit=SEARCH_PAGE_SIZE, offset=0):
+        match = self.match_expression(query)
+        if match is None:
+            return [], 0
+
+        rank = 'bm25({}, {})'.format(self.table, ', '.join(map(str, self.weights)))
+        sql = (
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+            f"ORDER BY {rank}"
+        )
+        params = [match]
+        if limit is not None:
+            sql += " LIMIT %s OFFSET %s"
+            params += [limit, offset]
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+            if limit is None:
+                total = len(ids)
+            else:
+                cursor.execute(
+                    f"SELECT count(*) FROM {self.table} WHERE {self.table} MATCH %s",
+                    [match],
+                )
+                total = cursor.fetchone()[0]
+        return ids, total
+
+    def match_ids(self, query):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+        return RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(
+            settings, 'PRODUCT_SEARCH_BACKEND', 'store.search.SQLiteFTS5Backend'
+        )
+        _backend = import_string(path)()
+    return _backend
+
+
+def search_products(query, page=1, page_size=SEARCH_PAGE_SIZE):
+    """
+    One page of active products matching query, best match first.
+    Returns (products, total).
+    """
+    from .models import Product
+
+    offset = (page - 1) * page_size
+    ids, total = get_search_backend().search(query, limit=page_size, offset=offset)
+    products = Product.objects.filter(id__in=ids, is_active=True).in_bulk()
+    return [products[pk] for pk in ids if pk in products], total
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models import F
+
+from .cache import clear_cart_count
+from .db import retry_on_locked
+from .models import Cart, Product
+
+# Anonymous carts live in a signed cookie ("product_id:quantity,...") so
+# browsing visitors never write to the Cart table or the session store.
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'store.session_cart'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+MAX_LINES = 50
+MAX_QUANTITY = 999
+
+
+class SessionCartLine:
+    """Quacks like a Cart row for cart.html; id is the product id."""
+
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def line_total(self):
+        return self.quantity * self.product.price
+
+
+class SessionCart:
+
+    def __init__(self, request):
+        raw = request.get_signed_cookie(
+            COOKIE_NAME, default='', salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE
+        )
+        self.items = self._parse(raw)
+        self.modified = False
+
+    @staticmethod
+    def _parse(raw):
+        items = {}
+        for pair in raw.split(',') if raw else ():
+            try:
+                product_id, quantity = (int(part) for part in pair.split(':'))
+            except ValueError:
+                continue
+            if product_id > 0 and quantity > 0:
+                items[product_id] = min(quantity, MAX_QUANTITY)
+        return items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def set(self, product_id, quantity):
+        if quantity <= 0:
+            self.items.pop(product_id, None)
+        elif product_id in self.items or len(self.items) < MAX_LINES:
+            self.items[product_id] = min(quantity, MAX_QUANTITY)
+        self.modified = True
+
+    def add(self, product_id, quantity=1):
+        self.set(product_id, self.items.get(product_id, 0) + quantity)
+
+    def remove(self, product_id):
+        self.set(product_id, 0)
+
+    def clear(self):
+        self.items = {}
+        self.modified = True
+
+    def lines(self):
+        """The cart lines with their products, in one query."""
+        products = Product.objects.filter(id__in=self.items, is_active=True).in_bulk()
+        return [
+            SessionCartLine(products[product_id], quantity)
+            for product_id, quantity in self.items.items()
+            if product_id in products
+        ]
+
+    def save(self, response):
+        if not self.modified:
+            return response
+        if self.items:
+            response.set_signed_cookie(
+                COOKIE_NAME,
+                ','.join(f'{pk}:{qty}' for pk, qty in self.items.items()),
+                salt=COOKIE_SALT,
+                max_age=COOKIE_MAX_AGE,
+                httponly=True,
+                samesite='Lax',
+            )
+        else:
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        return response
+
+    @retry_on_locked
+    def merge_into(self, user):
+        """
+        Move this cart into the user's Cart rows in one batch: existing lines
+        get the quantities added, new lines are bulk inserted. Returns the
+        number of lines created.
+        """
+        if not self.items:
+            return 0
+        product_ids = set(
+            Product.objects.filter(id__in=self.items, is_active=True)
+            .values_list('id', flat=True)
+        )
+        with transaction.atomic():
+            existing = {
+                line.product_id: line
+                for line in Cart.objects.filter(user=user, product_id__in=product_ids)
+            }
+            for product_id, line in existing.items():
+                line.quantity = F('quantity') + self.items[product_id]
+            Cart.objects.bulk_update(existing.values(), ['quantity'])
+            created = Cart.objects.bulk_create([
+                Cart(user=user, product_id=product_id, quantity=self.items[product_id])
+                for product_id in product_ids if product_id not in existing
+            ])
+            # bulk writes send no signals
+            transaction.on_commit(lambda: clear_cart_count(user.pk))
+        self.clear()
+        return len(created)
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, clear_cart_count
+from .facets import adjust_facet, facet_key, move_facet
+from .images import derivatives_ready
+from .models import Cart, Category, Order, Product
+from .sales_rollups import record_orders
+from .search import get_search_backend
+from .tasks import build_image_derivatives, normalize_payment_proof
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    # Bump after commit, otherwise a concurrent request could re-cache the
+    # old rows under the new version before our transaction is visible.
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def invalidate_cart_count(sender, instance, **kwargs):
+    # the next page counts the lines again; after commit for the same reason
+    user_id = instance.user_id
+    transaction.on_commit(lambda: clear_cart_count(user_id))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_search_backend().index_products([instance]))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_products([pk]))
+
+
+@receiver(pre_save, sender=Product)
+def remember_facet_cell(sender, instance, raw=False, **kwargs):
+    instance._facet_key_before = None
+    if instance.pk and not raw:
+        row = Product.objects.filter(pk=instance.pk).values_list(
+            'category_id', 'price', 'is_featured', 'is_active'
+        ).first()
+        if row is not None:
+            instance._facet_key_before = facet_key(*row)
+
+
+@receiver(post_save, sender=Product)
+def update_facet_counts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    move_facet(
+        getattr(instance, '_facet_key_before', None),
+        facet_key(instance.category_id, instance.price, instance.is_featured, instance.is_active),
+    )
+
+
+@receiver(post_delete, sender=Product)
+def remove_facet_count(sender, instance, **kwargs):
+    adjust_facet(
+        facet_key(instance.category_id, instance.price, instance.is_featured, instance.is_active),
+        -1,
+    )
+
+
+# model -> (image field, background task run for new uploads)
+IMAGE_FIELDS = {
+    Product: ('product_image', build_image_derivatives),
+    Category: ('category_image', build_image_derivatives),
+    Order: ('payment_proof', normalize_payment_proof),
+}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Order)
+def process_uploaded_image(sender, instance, raw=False, **kwargs):
+    field, image_task = IMAGE_FIELDS[sender]
+    image = getattr(instance, field)
+    if raw or not image or derivatives_ready(image.name):
+        return
+    name = image.name
+    transaction.on_commit(lambda: image_task.enqueue(name))
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    # before the cascade takes the order lines away
+    record_orders(Order.objects.filter(pk=instance.pk), sign=-1)
@@ -0,0 +1,302 @@
+import logging
+import os
+import signal
+import socket
+import time
+from collections import Counter
+from datetime import timedelta
+from traceback import format_exception
+
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.tasks import TaskContext, TaskResult, TaskResultStatus, task_backends
+from django.tasks.backends.base import BaseTaskBackend
+from django.tasks.base import TaskError
+from django.tasks.exceptions import TaskResultDoesNotExist
+from django.tasks.signals import task_enqueued, task_finished, task_started
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.json import normalize_json
+from django.utils.module_loading import import_string
+
+from .models import QueuedTask
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseBackend(BaseTaskBackend):
+    """
+    Django tasks backend that keeps tasks in the project database
+    (QueuedTask), so no broker is needed. Tasks enqueued inside a
+    transaction only become visible to workers once it commits.
+
+    OPTIONS:
+        MAX_ATTEMPTS   runs before a task is marked FAILED (default 3)
+        RETRY_BACKOFF  seconds before the first retry, doubled after
+                       each failed attempt (default 10)
+        LEASE          seconds after its claim or the start of its run
+                       after which a RUNNING task whose worker died is
+                       handed out again (default 600)
+    """
+    supports_defer = True
+    supports_get_result = True
+    supports_priority = True
+
+    def __init__(self, alias, params):
+        super().__init__(alias, params)
+        self.max_attempts = self.options.get('MAX_ATTEMPTS', 3)
+        self.retry_backoff = self.options.get('RETRY_BACKOFF', 10)
+        self.lease = self.options.get('LEASE', 600)
+
+    def enqueue(self, task, args, kwargs):
+        self.validate_task(task)
+        now = timezone.now()
+        row = QueuedTask.objects.create(
+            task_path=task.module_path,
+            queue_name=task.queue_name,
+            priority=task.priority,
+            args=normalize_json(args),
+            kwargs=normalize_json(kwargs),
+            run_after=task.run_after or now,
+            enqueued_at=now,
+        )
+        result = self.to_result(row, task)
+        task_enqueued.send(type(self), task_result=result)
+        return result
+
+    def get_result(self, result_id):
+        try:
+            row = QueuedTask.objects.get(pk=result_id)
+        except (QueuedTask.DoesNotExist, ValueError):
+            raise TaskResultDoesNotExist(result_id)
+        return self.to_result(row)
+
+    def to_result(self, row, task=None):
+        if task is None:
+            task = import_string(row.task_path).using(
+                priority=row.priority, queue_name=row.queue_name, backend=self.alias
+            )
+        result = TaskResult(
+            task=task,
+            id=str(row.pk),
+            status=TaskResultStatus(row.status),
+            enqueued_at=row.enqueued_at,
+            started_at=row.started_at,
+            finished_at=row.finished_at,
+            last_attempted_at=row.last_attempted_at,
+            args=row.args,
+            kwargs=row.kwargs,
+            backend=self.alias,
+            errors=[TaskError(**error) for error in row.errors],
+            worker_ids=list(row.worker_ids),
+        )
+        object.__setattr__(result, '_return_value', row.return_value)
+        return result
+
+
+class Worker:
+    """
+    Claims READY tasks in batches and runs them. Several workers (e.g. the
+    processes of `run_task_worker --processes N`) can share one queue: a row
+    is claimed by exactly one batch, see claim(), and only runs, and has
+    its result saved, while that claim still holds, see start().
+    """
+
+    def __init__(self, backend='default', queues=None, batch_size=10,
+                 idle_sleep=1.0, metrics_interval=60):
+        self.backend = task_backends[backend]
+        self.queues = sorted(queues or self.backend.queues)
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.metrics_interval = metrics_interval
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}'
+        self.metrics = Counter()
+        self.stopping = False
+
+    def claim(self):
+        """
+        Mark up to batch_size runnable tasks as RUNNING for this worker and
+        return them. With SKIP LOCKED support (PostgreSQL, MySQL 8) the rows
+        are locked and skipped by other workers; SQLite has no row locks, so
+        there the claim is one UPDATE ... WHERE id IN (SELECT ... LIMIT n),
+        which picks and marks the rows under a single write lock.
+        """
+        now = timezone.now()
+        token = get_random_string(32)
+        runnable = QueuedTask.objects.filter(
+            Q(status=TaskResultStatus.READY, run_after__lte=now)
+            | Q(
+                status=TaskResultStatus.RUNNING,
+                last_attempted_at__lt=now - timedelta(seconds=self.backend.lease),
+            ),
+            queue_name__in=self.queues,
+        ).order_by('-priority', 'run_after', 'id')
+
+        # an idle poll stays a plain read: with IMMEDIATE transactions any
+        # atomic() block takes SQLite's write lock, even to find nothing
+        if not runnable.exists():
+            return []
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                ids = list(
+                    runnable.select_for_update(skip_locked=True)
+                    .values_list('pk', flat=True)[:self.batch_size]
+                )
+                batch = QueuedTask.objects.filter(pk__in=ids)
+            else:
+                batch = QueuedTask.objects.filter(
+                    pk__in=runnable.values('pk')[:self.batch_size]
+                )
+            claimed = batch.update(
+                status=TaskResultStatus.RUNNING, claim=token, last_attempted_at=now
+            )
+        if not claimed:
+            return []
+        return list(QueuedTask.objects.filter(claim=token).order_by('-priority', 'run_after', 'id'))
+
+    def start(self, row):
+        """
+        Record the attempt and renew the lease just before the run, so a task
+        late in its batch is not handed out again while the earlier ones run,
+        and an attempt whose worker dies still counts. False if the lease ran
+        out meanwhile and another worker claimed the task.
+        """
+        now = timezone.now()
+        row.worker_ids.append(self.worker_id)
+        row.last_attempted_at = now
+        if row.started_at is None:
+            row.started_at = now
+        return bool(QueuedTask.objects.filter(pk=row.pk, claim=row.claim).update(
+            last_attempted_at=now, started_at=row.started_at, worker_ids=row.worker_ids,
+        ))
+
+    def execute(self, row):
+        backend = self.backend
+        if not self.start(row):
+            logger.warning("task %s was claimed by another worker, skipped", row.pk)
+            self.metrics['lost'] += 1
+            return
+        self.metrics['wait_seconds'] += (row.last_attempted_at - row.run_after).total_seconds()
+
+        started = time.monotonic()
+        result = None
+        try:
+            result = backend.to_result(row)
+            task_started.send(type(backend), task_result=result)
+            if result.task.takes_context:
+                value = result.task.call(TaskContext(task_result=result), *row.args, **row.kwargs)
+            else:
+                value = result.task.call(*row.args, **row.kwargs)
+            row.return_value = normalize_json(value)
+        except KeyboardInterrupt:
+            raise
+        except BaseException as exc:
+            exception_type = type(exc)
+            row.errors.append({
+                'exception_class_path': f'{exception_type.__module__}.{exception_type.__qualname__}',
+                'traceback': ''.join(format_exception(exc)),
+            })
+            attempts = len(row.worker_ids)
+            if result is not None and attempts < backend.max_attempts:
+                row.status = TaskResultStatus.READY
+                row.run_after = timezone.now() + timedelta(
+                    seconds=backend.retry_backoff * 2 ** (attempts - 1)
+                )
+                outcome = 'retried'
+            else:
+                row.status = TaskResultStatus.FAILED
+                row.finished_at = timezone.now()
+                outcome = 'failed'
+            logger.warning("task %s %s (attempt %d): %r", row.pk, outcome, attempts, exc)
+        else:
+            row.status = TaskResultStatus.SUCCESSFUL
+            row.finished_at = timezone.now()
+            outcome = 'succeeded'
+
+        token, row.claim = row.claim, ''
+        fields = ('status', 'run_after', 'finished_at', 'claim', 'errors', 'return_value')
+        if not QueuedTask.objects.filter(pk=row.pk, claim=token).update(
+            **{name: getattr(row, name) for name in fields}
+        ):
+            # another worker holds the task now and will save its own run
+            logger.warning("task %s outran its lease, its result is dropped", row.pk)
+            outcome = 'lost'
+        self.metrics[outcome] += 1
+        self.metrics['run_seconds'] += time.monotonic() - started
+        if result is not None and outcome != 'lost':
+            task_finished.send(type(backend), task_result=backend.to_result(row, result.task))
+
+    def log_metrics(self, elapsed):
+        processed = sum(self.metrics[key] for key in ('succeeded', 'retried', 'failed', 'lost'))
+        logger.info(
+            "worker=%s processed=%d succeeded=%d retried=%d failed=%d lost=%d "
+            "rate=%.1f/s avg_run=%.1fms avg_wait=%.1fms",
+            self.worker_id, processed, self.metrics['succeeded'],
+            self.metrics['retried'], self.metrics['failed'], self.metrics['lost'],
+            processed / elapsed if elapsed else 0,
+            self.metrics['run_seconds'] * 1000 / processed if processed else 0,
+            self.metrics['wait_seconds'] * 1000 / processed if processed else 0,
+        )
+
+    def run(self, max_tasks=None, burst=False):
+        """
+        Work until stopped, until max_tasks have run, or (burst) until the
+        queue is empty. Returns the metrics counter.
+        """
+        started = last_log = time.monotonic()
+        processed = 0
+        while not self.stopping:
+            batch = self.claim()
+            if not batch:
+                if burst:
+                    break
+                time.sleep(self.idle_sleep)
+            for row in batch:
+                self.execute(row)
+                processed += 1
+            if max_tasks is not None and processed >= max_tasks:
+                break
+            if time.monotonic() - last_log >= self.metrics_interval:
+                self.log_metrics(time.monotonic() - started)
+                last_log = time.monotonic()
+        self.log_metrics(time.monotonic() - started)
+        return self.metrics
+
+    def stop(self, *args):
+        # finish the current batch, then exit
+        self.stopping = True
+
+
+def run_worker(**options):
+    """Entry point of one worker process (see run_task_worker)."""
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    worker = Worker(
+        backend=options['backend'],
+        queues=options['queues'],
+        batch_size=options['batch_size'],
+        idle_sleep=options['sleep'],
+        metrics_interval=options['metrics_interval'],
+    )
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.run(max_tasks=options['max_tasks'], burst=options['burst'])
+
+
+def queue_stats():
+    """Task counts per queue and status, plus the age of the oldest runnable task."""
+    now = timezone.now()
+    counts = {
+        (row['queue_name'], row['status']): row['count']
+        for row in QueuedTask.objects.values('queue_name', 'status')
+        .annotate(count=Count('id')).order_by()
+    }
+    oldest = QueuedTask.objects.filter(
+        status=TaskResultStatus.READY, run_after__lte=now
+    ).aggregate(oldest=Min('run_after'))['oldest']
+    return {
+        'counts': counts,
+        'oldest_ready_seconds': (now - oldest).total_seconds() if oldest else 0,
+    }
@@ -0,0 +1,47 @@
+import logging
+from io import TextIOWrapper
+
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMultiAlternatives
+from django.tasks import task
+
+from . import images
+from .catalog_io import CatalogImport, read_rows
+
+logger = logging.getLogger(__name__)
+
+# Background tasks, run by `manage.py run_task_worker` (store.task_queue).
+# Arguments must be JSON serializable: pass names and ids, not objects.
+
+
+@task(queue_name='images')
+def build_image_derivatives(name):
+    images.build_derivatives(name)
+
+
+@task(queue_name='images')
+def normalize_payment_proof(name):
+    images.normalize_payment_proof(name)
+
+
+@task(queue_name='email')
+def send_email(subject, body, from_email, to, html_body=None):
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html_body:
+        message.attach_alternative(html_body, 'text/html')
+    message.send()
+
+
+@task()
+def import_catalog(name, fmt):
+    """Import a catalog file uploaded through the product admin, then delete it."""
+    importer = CatalogImport()
+    with default_storage.open(name, 'rb') as raw:
+        stats = importer.run(read_rows(TextIOWrapper(raw, encoding='utf-8-sig', newline=''), fmt))
+    default_storage.delete(name)
+    logger.info(
+        "catalog import %s: %d rows at %.0f rows/s, %d created, %d updated, %d failed",
+        name, stats['rows'], importer.rows_per_second,
+        stats['created'], stats['updated'], stats['failed'],
+    )
+    return {**stats, 'errors': importer.errors}
@@ -0,0 +1,50 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..images import SIZES, SIZES_ATTRIBUTE, derivative_url, derivatives_ready
+
+register = template.Library()
+
+
+def _srcset(image, up_to, ext):
+    widths = [size for size, width in SIZES.items() if width <= SIZES[up_to]]
+    return ', '.join(f'{derivative_url(image, size, ext)} {SIZES[size]}w' for size in widths)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', size='listing', css_class='img-fluid', fallback=None, lazy=True):
+    """
+    <picture> for an ImageField: WebP and JPEG srcsets of the derivatives up
+    to size (see store.images), lazily loaded unless lazy=False. Falls back
+    to the original file while the derivatives are still being built, and
+    to the static fallback image when there is no upload at all.
+
+        {% responsive_image product.product_image product.title 'listing' fallback='img/product-1.jpg' %}
+    """
+    attrs = {'class': css_class, 'alt': alt, 'decoding': 'async'}
+    if lazy:
+        attrs['loading'] = 'lazy'
+
+    if not image:
+        attrs['src'] = static(fallback) if fallback else ''
+        return format_html('<img {}>', _attributes(attrs))
+    if not derivatives_ready(image.name):
+        attrs['src'] = image.url
+        return format_html('<img {}>', _attributes(attrs))
+
+    attrs.update({
+        'src': derivative_url(image, size),
+        'srcset': _srcset(image, size, 'jpg'),
+        'sizes': SIZES_ATTRIBUTE[size],
+    })
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}"><img {}></picture>',
+        _srcset(image, size, 'webp'),
+        SIZES_ATTRIBUTE[size],
+        _attributes(attrs),
+    )
+
+
+def _attributes(attrs):
+    return format_html_join(' ', '{}="{}"', attrs.items())
@@ -1,3 +1,1811 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+import csv
+import json
+import re
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from collections import Counter
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.tasks import TaskResultStatus, task
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.text import slugify
+from django.views.decorators.csrf import ensure_csrf_cookie
+
+from PIL import Image
+
+from .admin import indexed_search
+from .cache import CATALOG_VERSION_KEY, bump_catalog_version, catalog_key, get_catalog_version
+from .cart_summary import cart_summary
+from .checkout import EmptyCart, place_order
+from .db import retry_on_locked
+from .facets import browse_products, facet_counts, facet_key
+from .catalog_io import CatalogImport, export_lines, read_rows
+from .images import (
+    build_derivatives, derivative_name, derivatives_ready, normalize_payment_proof, strip_metadata,
+)
+from .instrumentation import record_request
+from .metrics import CounterFile, collect_counters, inc
+from .models import (
+    Address, Cart, Category, DailyCategorySales, DailyPaymentSales, DailyProductSales,
+    Order, OrderItem, OrderStatusChange, Product, ProductFacetCount, QueuedTask,
+)
+from .order_export import export_orders, order_lines
+from .order_states import STATUS_CODES, InvalidTransition, transition
+from .pagination import cached_first_page, decode_cursor, encode_cursor, keyset_page
+from .page_cache import anonymous_page_cache, page_key
+from . import routers
+from .sales_rollups import sales_report
+from .search import get_search_backend, search_products
+from .session_cart import COOKIE_NAME as CART_COOKIE
+from .task_queue import Worker
+from .uploads import INVALID_TYPE, PAYMENT_PROOF_MAX_SIZE, TOO_LARGE
+from .views import RELATED_PRODUCTS_LIMIT
+
+
+def setUpModule():
+    # Keep the suite off the working tree's cache and metrics files: a
+    # shared cache would also leak catalog versions and cart counts
+    # between tests.
+    metrics_dir = tempfile.mkdtemp()
+    unittest.addModuleCleanup(shutil.rmtree, metrics_dir)
+    isolation = override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        METRICS_DIR=metrics_dir,
+    )
+    isolation.enable()
+    unittest.addModuleCleanup(isolation.disable)
+
+
+def make_category(title='Rings', **fields):
+    """A saved category, active and not featured unless fields say otherwise."""
+    fields = {'slug': slugify(title), 'is_active': True, 'is_featured': False, **fields}
+    return Category.objects.create(title=title, **fields)
+
+
+def new_product(category, title='Ring', sku='R1', **fields):
+    """An unsaved product at 10.00, active and not featured unless fields say otherwise."""
+    fields = {
+        'slug': slugify(title), 'short_description': title, 'price': Decimal('10.00'),
+        'is_active': True, 'is_featured': False, **fields,
+    }
+    return Product(category=category, title=title, sku=sku, **fields)
+
+
+def make_product(category, title='Ring', sku='R1', **fields):
+    product = new_product(category, title, sku, **fields)
+    product.save()
+    return product
+
+
+class CatalogCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = make_category()
+        cls.product = make_product(cls.category)
+
+    def test_edits_invalidate_cached_pages(self):
+        url = reverse('store:category-products', args=[self.category.slug])
+        self.assertContains(self.client.get(url), 'Ring')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Gold Ring'
+            self.product.save()
+        self.assertContains(self.client.get(url), 'Gold Ring')
+
+        # bulk updates skip post_save and bump the version themselves
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(id=self.product.id).update(title='Silver Ring')
+        self.assertContains(self.client.get(url), 'Silver Ring')
+
+    def test_version_never_goes_back_when_its_key_is_culled(self):
+        version = bump_catalog_version()
+        cache.delete(CATALOG_VERSION_KEY)
+        self.assertGreater(get_catalog_version(), version)
+        cache.delete(CATALOG_VERSION_KEY)
+        self.assertGreater(bump_catalog_version(), version)
+
+    def test_unknown_category_slugs_are_not_cached(self):
+        response = self.client.get(reverse('store:category-products', args=['no-such-slug']))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(catalog_key('category', 'no-such-slug'), cache)
+
+
+class CartBadgeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='secret-pass-123')
+        cls.category = make_category()
+        cls.products = [make_product(cls.category, f'Ring {i}', f'R{i}') for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def badge(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('store:profile'))
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        return response.context['cart_count'], sql
+
+    def test_menu_and_badge_are_served_without_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.create(user=self.user, product=self.products[0])
+        self.badge()
+        count, sql = self.badge()
+        self.assertEqual(count, 1)
+        self.assertNotIn('store_cart', sql)
+        self.assertNotIn('store_category', sql)
+
+    def test_admin_edits_and_cascades_update_the_badge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            lines = [Cart.objects.create(user=self.user, product=product) for product in self.products]
+        self.assertEqual(self.badge()[0], 2)
+
+        # what the admin delete action does
+        with self.captureOnCommitCallbacks(execute=True):
+            lines[0].delete()
+        self.assertEqual(self.badge()[0], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[1].delete()
+        self.assertEqual(self.badge()[0], 0)
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = make_category()
+        Product.objects.bulk_create([new_product(cls.category, f'Ring {i}', f'R{i}') for i in range(24)])
+        # a batch import stamps many rows with the same created_at
+        Product.objects.filter(id__in=Product.objects.order_by('id').values('id')[5:15]).update(
+            created_at=datetime(2026, 1, 1, tzinfo=dt_timezone.utc),
+        )
+
+    def walk(self, page_size):
+        pages, cursor = [], None
+        while True:
+            page = keyset_page(Product.objects.all(), cursor, page_size)
+            pages.append([product.id for product in page['object_list']])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_product_once_across_created_at_ties(self):
+        for page_size, sizes in ((5, [5, 5, 5, 5, 4]), (12, [12, 12]), (24, [24])):
+            with self.subTest(page_size=page_size):
+                pages = self.walk(page_size)
+                self.assertEqual([len(page) for page in pages], sizes)
+                ids = [pk for page in pages for pk in page]
+                self.assertCountEqual(ids, Product.objects.values_list('id', flat=True))
+                expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+                self.assertEqual(ids, expected)
+
+    def test_malformed_cursor_shows_the_first_page(self):
+        self.assertIsNone(decode_cursor('not a cursor'))
+        url = reverse('store:category-products', args=[self.category.slug])
+        response = self.client.get(url, {'after': 'bm90IGEgY3Vyc29y'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.client.get(url).content)
+
+    def test_only_first_pages_with_rows_are_cached(self):
+        # cursors are the client's to choose: caching their pages would let
+        # anyone fill the cache
+        bump_catalog_version()
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            page = cached_first_page('category-products', Product.objects.all(), '', self.category.id)
+            cached_first_page('category-products', Product.objects.all(), page['next_cursor'], self.category.id)
+            cached_first_page('category-products', Product.objects.none(), '', 0)
+        self.assertEqual(
+            [call.args[0] for call in cache_set.call_args_list],
+            [catalog_key('category-products', self.category.id)],
+        )
+
+    def test_related_products_are_capped(self):
+        product = Product.objects.first()
+        # signed in, so the page is rendered rather than served from the page cache
+        self.client.force_login(User.objects.create_user('shopper'))
+        response = self.client.get(reverse('store:product-detail', args=[product.slug]))
+        self.assertEqual(len(response.context['related_products']), RELATED_PRODUCTS_LIMIT)
+        self.assertNotIn(product, response.context['related_products'])
+
+
+class ProductSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        category = make_category()
+        cls.in_text = make_product(
+            category, 'Gold Band', 'GB1', short_description='A band set with a small emerald.',
+        )
+        cls.in_title = make_product(category, 'Emerald Ring', 'ER1', short_description='A classic ring.')
+        cls.inactive = make_product(
+            category, 'Emerald Pendant', 'EP1', short_description='Retired.', is_active=False,
+        )
+        # the signal handlers index on commit, which never happens in a TestCase
+        get_search_backend().index_products([cls.in_text, cls.in_title, cls.inactive])
+
+    def test_title_matches_rank_first(self):
+        products, total = search_products('emerald')
+        self.assertEqual(products, [self.in_title, self.in_text])
+        self.assertEqual(total, 2)
+        # the last word is a prefix
+        self.assertEqual(search_products('emer')[0], [self.in_title, self.in_text])
+
+    def test_query_syntax_is_never_interpreted(self):
+        self.assertEqual(search_products('emerald" OR ring*')[1], 0)
+        self.assertEqual(search_products('-*"()')[1], 0)
+        response = self.client.get(reverse('store:shop'), {'q': 'NEAR(emerald'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_shop_lists_ranked_results(self):
+        response = self.client.get(reverse('store:shop'), {'q': 'emerald'})
+        self.assertEqual(response.context['products'], [self.in_title, self.in_text])
+        self.assertEqual(response.context['total'], 2)
+
+    def test_admin_falls_back_to_like_for_inactive_products(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:store_product_changelist')
+        response = self.client.get(url, {'q': 'pendant'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+        response = self.client.get(url, {'q': 'pendant', 'is_active__exact': '0'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.inactive])
+
+
+class FacetCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rings = make_category()
+        cls.chains = make_category('Chains')
+        cls.products = [
+            make_product(category, f'Item {i}', f'I{i}', price=price, is_featured=featured)
+            for i, (category, price, featured) in enumerate([
+                (cls.rings, Decimal('10.00'), False),
+                (cls.rings, Decimal('30.00'), True),
+                (cls.chains, Decimal('30.00'), False),
+                (cls.chains, Decimal('300.00'), True),
+            ])
+        ]
+
+    def assertCellsMatchProducts(self):
+        cells = {
+            (cell.category_id, cell.price_band, cell.is_featured): cell.product_count
+            for cell in ProductFacetCount.objects.filter(product_count__gt=0)
+        }
+        expected = Counter(
+            facet_key(*row) for row in Product.objects.values_list(
+                'category_id', 'price', 'is_featured', 'is_active',
+            )
+        )
+        expected.pop(None, None)
+        self.assertEqual(cells, dict(expected))
+
+    def test_cells_follow_product_edits(self):
+        self.assertCellsMatchProducts()
+        first, second, third, fourth = self.products
+
+        first.price = Decimal('60.00')  # moves to another price band
+        first.save()
+        self.assertCellsMatchProducts()
+        second.is_active = False
+        second.save()
+        self.assertCellsMatchProducts()
+        third.category = self.rings
+        third.save()
+        self.assertCellsMatchProducts()
+        fourth.delete()
+        self.assertCellsMatchProducts()
+
+        # bulk updates recount every cell after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(category=self.rings).update(is_featured=True)
+        self.assertCellsMatchProducts()
+
+    def test_counts_drill_sideways(self):
+        bump_catalog_version()  # the cells are cached per catalog version
+        counts = facet_counts({'category': self.rings.id, 'price': None, 'featured': False})
+        self.assertEqual(counts['total'], 2)
+        # the other categories keep their counts while one is picked
+        self.assertEqual(counts['categories'], {self.rings.id: 2, self.chains.id: 2})
+        self.assertEqual(counts['price_bands'], {0: 1, 1: 1})
+        self.assertEqual(counts['featured'], 1)
+
+        counts = facet_counts({'category': None, 'price': 1, 'featured': True})
+        self.assertEqual(counts['total'], 1)
+        self.assertEqual(counts['categories'], {self.rings.id: 1})
+
+    def test_only_first_pages_of_real_selections_are_cached(self):
+        bump_catalog_version()
+        selections = [
+            {'category': self.rings.id, 'price': None, 'featured': False},
+            {'category': 987654, 'price': None, 'featured': False},  # no such category
+        ]
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            for selected in selections:
+                browse_products(selected)
+            browse_products(selections[0], encode_cursor(self.products[1]))
+        self.assertEqual(
+            [call.args[0] for call in cache_set.call_args_list if ':shop-products:' in call.args[0]],
+            [catalog_key('shop-products', self.rings.id, None, 0)],
+        )
+
+    def test_shop_lists_the_selected_facets(self):
+        bump_catalog_version()
+        response = self.client.get(reverse('store:shop'), {'category': self.chains.id, 'price': '1'})
+        self.assertEqual(response.context['products'], [self.products[2]])
+        self.assertEqual(response.context['total'], 1)
+
+
+class PlaceOrderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret-pass-123')
+        category = make_category()
+        cls.products = [
+            make_product(category, f'Ring {i}', f'R{i}', price=Decimal('10.00') * (i + 1))
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        for product in self.products:
+            Cart.objects.create(user=self.user, product=product, quantity=2)
+        self.new_address = {'locality': 'Here', 'city': 'Town', 'state': 'State'}
+
+    def test_one_order_with_a_line_per_cart_line(self):
+        order = place_order(self.user, self.new_address, 'COD', None)
+        self.assertEqual(order.total_amount, Decimal('120.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'quantity', 'unit_price')),
+            [(product.id, 2, product.price) for product in self.products],
+        )
+        self.assertEqual(order.address.locality, 'Here')
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        self.assertEqual(DailyPaymentSales.objects.get().revenue, Decimal('120.00'))
+
+    def test_a_failure_leaves_nothing_behind(self):
+        with mock.patch('store.checkout.record_orders', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                place_order(self.user, self.new_address, 'COD', None)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(Address.objects.exists())
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 3)
+
+    def test_the_order_holds_the_cart_as_it_is_when_placed(self):
+        # what the checkout page showed is not what gets ordered
+        shown = cart_summary(self.user)
+        Cart.objects.filter(product=self.products[0]).update(quantity=5)
+        Cart.objects.filter(product=self.products[2]).delete()
+        order = place_order(self.user, self.new_address, 'COD', None)
+        self.assertNotEqual(order.total_amount, shown.amount)
+        self.assertEqual(order.total_amount, Decimal('90.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'quantity')),
+            [(self.products[0].id, 5), (self.products[1].id, 2)],
+        )
+
+    def test_a_second_checkout_of_the_same_cart_fails_cleanly(self):
+        timings = {}
+        place_order(self.user, self.new_address, 'COD', None, timings)
+        self.assertEqual(set(timings), {'orders', 'clear_cart'})
+        with self.assertRaises(EmptyCart):
+            place_order(self.user, self.new_address, 'COD', None)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Address.objects.count(), 1)
+
+    def test_checkout_of_a_cart_emptied_meanwhile_places_nothing(self):
+        self.client.force_login(self.user)
+        shown = cart_summary(self.user)
+        Cart.objects.filter(user=self.user).delete()
+        with mock.patch('store.views.cart_summary', return_value=shown):
+            response = self.client.post(reverse('store:checkout'), {'payment_method': 'COD', **self.new_address})
+        self.assertRedirects(response, reverse('store:cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs a data migration between before and after; the schema is migrated back to the end."""
+
+    before = after = None
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        self.addCleanup(lambda: self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes()))
+
+
+class OrderItemsMigrationTests(MigrationTestCase):
+    """Migration 0010 folds the old one-row-per-cart-line orders into orders with lines."""
+
+    before = [('store', '0009_product_facet_count')]
+    after = [('store', '0010_order_items')]
+
+    def setUp(self):
+        super().setUp()
+        apps = self.migrate(self.before)
+        Order = apps.get_model('store', 'Order')
+        user = apps.get_model('auth', 'User').objects.create(username='buyer')
+        address = apps.get_model('store', 'Address').objects.create(
+            user=user, locality='A', city='B', state='C',
+        )
+        category = apps.get_model('store', 'Category').objects.create(
+            title='Rings', slug='rings', is_active=True, is_featured=False,
+        )
+        ring, band = [
+            apps.get_model('store', 'Product').objects.create(
+                title=title, slug=title.lower(), sku=title, short_description=title,
+                price=price, category=category, is_active=True, is_featured=False,
+            )
+            for title, price in (('Ring', Decimal('10.00')), ('Band', Decimal('20.00')))
+        ]
+        placed = datetime(2025, 12, 1, 12, 0, 0, tzinfo=dt_timezone.utc)
+        rows = [
+            # one checkout of two lines
+            (ring, 1, 0, 'Delivered', 'Verified', ''),
+            (band, 2, 0.2, 'Delivered', 'Verified', ''),
+            # a line of the same checkout, cancelled and refunded since
+            (ring, 3, 0.4, 'Cancelled', 'Rejected', 'Refunded'),
+            # a later checkout
+            (band, 1, 60, 'Delivered', 'Verified', ''),
+        ]
+        self.dates = []
+        for i, (product, quantity, seconds, status, payment_status, notes) in enumerate(rows):
+            # the old checkout saved the screenshot once per cart line
+            order = Order.objects.create(
+                user=user, address=address, product=product, quantity=quantity,
+                payment_method='QR', payment_proof=f'payment_proofs/proof_{i}.png',
+                status=status, payment_status=payment_status, admin_notes=notes,
+            )
+            self.dates.append(placed + timedelta(seconds=seconds))
+            Order.objects.filter(id=order.id).update(ordered_date=self.dates[-1])
+
+    def test_only_rows_that_agree_are_merged(self):
+        apps = self.migrate(self.after)
+        orders = apps.get_model('store', 'Order').objects.order_by('id')
+        self.assertEqual(
+            [
+                (order.status, order.admin_notes, order.payment_proof.name, order.total_amount,
+                 sorted(order.items.values_list('product__title', 'quantity')))
+                for order in orders
+            ],
+            [
+                ('Delivered', '', 'payment_proofs/proof_0.png', Decimal('50.00'), [('Band', 2), ('Ring', 1)]),
+                ('Cancelled', 'Refunded', 'payment_proofs/proof_2.png', Decimal('30.00'), [('Ring', 3)]),
+                ('Delivered', '', 'payment_proofs/proof_3.png', Decimal('20.00'), [('Band', 1)]),
+            ],
+        )
+
+    def test_reversing_keeps_the_order_dates(self):
+        self.migrate(self.after)
+        apps = self.migrate(self.before)
+        rows = apps.get_model('store', 'Order').objects.order_by('ordered_date', 'id')
+        # the lines of a merged order all get the order's date back
+        self.assertEqual(
+            [(row.product.title, row.quantity, row.status, row.ordered_date) for row in rows],
+            [
+                ('Ring', 1, 'Delivered', self.dates[0]),
+                ('Band', 2, 'Delivered', self.dates[0]),
+                ('Ring', 3, 'Cancelled', self.dates[2]),
+                ('Band', 1, 'Delivered', self.dates[3]),
+            ],
+        )
+
+
+class CategorySlugMigrationTests(MigrationTestCase):
+    """Migration 0014 makes Category.slug unique, renaming duplicates first."""
+
+    before = [('store', '0013_sales_rollups')]
+    after = [('store', '0014_hot_query_indexes')]
+
+    def test_duplicate_slugs_are_renamed(self):
+        Category = self.migrate(self.before).get_model('store', 'Category')
+        long_slug = 'r' * 55
+        ids = [
+            Category.objects.create(title=slug, slug=slug, is_active=True, is_featured=False).id
+            for slug in ('rings', 'rings', 'bands', long_slug, long_slug)
+        ]
+
+        Category = self.migrate(self.after).get_model('store', 'Category')
+        self.assertEqual(
+            list(Category.objects.order_by('id').values_list('slug', flat=True)),
+            ['rings', f'rings-{ids[1]}', 'bands', long_slug, long_slug[:55 - len(f'-{ids[4]}')] + f'-{ids[4]}'],
+        )
+
+    def test_renamed_slugs_skip_slugs_in_use(self):
+        Category = self.migrate(self.before).get_model('store', 'Category')
+        second = [
+            Category.objects.create(title='Rings', slug='rings', is_active=True, is_featured=False).id
+            for _ in range(2)
+        ][1]
+        for slug in (f'rings-{second}', f'rings-{second}-2'):
+            Category.objects.create(title=slug, slug=slug, is_active=True, is_featured=False)
+
+        Category = self.migrate(self.after).get_model('store', 'Category')
+        self.assertEqual(Category.objects.get(id=second).slug, f'rings-{second}-3')
+        self.assertEqual(Category.objects.filter(slug=f'rings-{second}').count(), 1)
+
+
+class CartAPITests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='secret-pass-123')
+        cls.product = make_product(make_category())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_adding_a_product_again_raises_the_quantity_of_its_line(self):
+        url = reverse('store:cart-api-add')
+        self.client.post(url, {'product_id': self.product.id})
+        response = self.client.post(url, {'product_id': self.product.id, 'quantity': 2})
+        self.assertEqual(response.json()['line']['quantity'], 3)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+        with self.assertRaises(IntegrityError):
+            Cart.objects.create(user=self.user, product=self.product)
+
+    def test_bad_requests_get_an_error_and_change_nothing(self):
+        add = reverse('store:cart-api-add')
+        hidden = make_product(self.product.category, 'Hidden', 'H1', is_active=False)
+        for data, status in (
+            ({}, 400),
+            ({'product_id': 'ring'}, 400),
+            ({'product_id': self.product.id, 'quantity': 0}, 400),
+            ({'product_id': 999999}, 404),
+            ({'product_id': hidden.id}, 404),
+        ):
+            with self.subTest(data=data):
+                response = self.client.post(add, data)
+                self.assertEqual(response.status_code, status)
+                self.assertIn('error', response.json())
+        self.assertEqual(self.client.get(add).status_code, 405)
+
+        line = Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        quantity = reverse('store:cart-api-quantity', args=[line.id])
+        self.assertEqual(self.client.post(quantity, {'delta': 'x'}).status_code, 400)
+        self.assertEqual(self.client.post(quantity, {'quantity': -1}).status_code, 400)
+        self.assertFalse(Cart.objects.exclude(id=line.id).exists())
+        self.assertEqual(Cart.objects.get().quantity, 2)
+
+    def test_quantity_changes_and_removal(self):
+        line = Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        quantity = reverse('store:cart-api-quantity', args=[line.id])
+        response = self.client.post(quantity, {'delta': 1})
+        self.assertEqual(response.json()['line']['quantity'], 3)
+        self.assertEqual(response.json()['cart']['count'], 1)
+        # a line that would drop to zero is removed
+        response = self.client.post(quantity, {'delta': -3})
+        self.assertIsNone(response.json()['line'])
+        self.assertEqual(response.json()['cart']['count'], 0)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_other_users_lines_are_left_alone(self):
+        other = User.objects.create_user('other')
+        line = Cart.objects.create(user=other, product=self.product, quantity=2)
+        self.client.post(reverse('store:cart-api-quantity', args=[line.id]), {'quantity': 5})
+        response = self.client.post(reverse('store:cart-api-remove', args=[line.id]))
+        self.assertEqual(response.json()['cart']['count'], 0)
+        line.refresh_from_db()
+        self.assertEqual(line.quantity, 2)
+
+
+class SessionCartTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='secret-pass-123')
+        category = make_category()
+        cls.ring, cls.band = [make_product(category, title, title) for title in ('Ring', 'Band')]
+
+    def add(self, product, times=1):
+        for _ in range(times):
+            self.client.get(reverse('store:add-to-cart'), {'prod_id': product.id})
+
+    def test_anonymous_cart_lives_in_the_cookie(self):
+        self.add(self.ring, 2)
+        self.add(self.band)
+        response = self.client.get(reverse('store:cart'))
+        self.assertEqual(
+            sorted((line.product.title, line.quantity) for line in response.context['cart_products']),
+            [('Band', 1), ('Ring', 2)],
+        )
+        self.assertFalse(Cart.objects.exists())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.add(self.ring)
+        value = self.client.cookies[CART_COOKIE].value
+        self.assertIn(f'{self.ring.id}:1', value)
+        self.client.cookies[CART_COOKIE] = value.replace(f'{self.ring.id}:1', f'{self.ring.id}:9', 1)
+        response = self.client.get(reverse('store:cart'))
+        self.assertEqual(list(response.context['cart_products']), [])
+
+    def test_login_merges_the_cookie_cart(self):
+        Cart.objects.create(user=self.user, product=self.ring, quantity=1)
+        self.add(self.ring, 2)
+        self.add(self.band)
+        response = self.client.post(reverse('store:login'), {
+            'username': 'shopper', 'password': 'secret-pass-123',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(Cart.objects.filter(user=self.user).values_list('product__title', 'quantity')),
+            [('Band', 1), ('Ring', 3)],
+        )
+        # the cookie is cleared, so a later login cannot merge it again
+        self.assertEqual(response.cookies[CART_COOKIE].value, '')
+
+
+class CartSummaryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass-123')
+        cls.category = make_category()
+        cls.products = [
+            make_product(cls.category, f'Ring {i}', f'R{i}', price=Decimal('12.50') + i)
+            for i in range(10)
+        ]
+
+    def fill_cart(self, size):
+        Cart.objects.filter(user=self.user).delete()
+        Cart.objects.bulk_create([
+            Cart(user=self.user, product=product, quantity=2)
+            for product in self.products[:size]
+        ])
+
+    def test_totals_are_computed_in_sql(self):
+        self.fill_cart(3)
+        summary = cart_summary(self.user)
+
+        self.assertEqual(summary.count, 3)
+        self.assertEqual(summary.amount, Decimal('81.00'))
+        self.assertEqual(summary.total, Decimal('91.00'))
+        self.assertEqual(summary.lines[1].line_total, Decimal('27.00'))
+
+    def test_summary_query_count_is_constant(self):
+        for size in (1, 10):
+            self.fill_cart(size)
+            with self.assertNumQueries(2):
+                summary = cart_summary(self.user)
+                for line in summary.lines:
+                    line.product.title, line.line_total
+
+    def test_cart_and_checkout_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        counts = []
+        for size in (1, 10):
+            bump_catalog_version()  # both sizes build the cached menu
+            self.fill_cart(size)
+            for name in ('store:cart', 'store:checkout'):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(context.captured_queries))
+        self.assertEqual(counts[:2], counts[2:])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LargeTableAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        cls.category = make_category()
+        cls.products = [
+            make_product(cls.category, title, title[:3].upper(), price=Decimal('20.00'))
+            for title in ('Emerald', 'Sapphire')
+        ]
+        # the signal handlers index on commit, which never happens in a TestCase
+        get_search_backend().index_products(cls.products)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_orders(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f'customer{Order.objects.count()}')
+            address = Address.objects.create(user=user, locality='A', city='B', state='C')
+            order = Order.objects.create(user=user, address=address, total_amount=40)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, unit_price=product.price)
+                for product in self.products
+            ])
+            Cart.objects.create(user=user, product=self.products[0])
+
+    def changelist_queries(self, name, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_changelist_query_count_is_constant(self):
+        for name in ('admin:store_order_changelist', 'admin:store_cart_changelist'):
+            self.add_orders(1)
+            self.changelist_queries(name)  # warm the cached row count
+            small, _ = self.changelist_queries(name)
+            self.add_orders(20)
+            large, _ = self.changelist_queries(name)
+            self.assertEqual(small, large, name)
+
+    def test_indexed_search(self):
+        self.add_orders(3)
+        order = Order.objects.order_by('id').last()
+        name = 'admin:store_order_changelist'
+
+        _, response = self.changelist_queries(name, q=f'#{order.id}')
+        self.assertEqual(list(response.context['cl'].result_list), [order])
+
+        _, response = self.changelist_queries(name, q=order.user.username)
+        self.assertEqual(list(response.context['cl'].result_list), [order])
+
+        _, response = self.changelist_queries(name, q='customer')
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+
+        _, response = self.changelist_queries(name, q='sapphire')
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+
+        _, response = self.changelist_queries('admin:store_cart_changelist', q='sapphire')
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+        # usernames match by case-sensitive prefix, on the unique index
+        _, response = self.changelist_queries(name, q='Customer')
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+    def test_product_matches_are_a_subquery(self):
+        # not a list of ids: a common term would pass SQLite's variable limit
+        for model in (Order, Cart):
+            model_admin = admin_site._registry[model]
+            queryset = indexed_search(model.objects.all(), 'sapphire', model_admin.product_condition)
+            sql, params = queryset.query.sql_with_params()
+            self.assertIn('MATCH', sql)
+            self.assertEqual([param for param in params if param in [p.id for p in self.products]], [])
+
+
+class OrderStateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'secret-pass-123')
+        cls.address = Address.objects.create(user=cls.staff, locality='A', city='B', state='C')
+
+    def make_orders(self, status, count):
+        Order.objects.bulk_create([
+            Order(user=self.staff, address=self.address, status=status)
+            for _ in range(count)
+        ])
+
+    def test_batch_transition_is_a_constant_number_of_statements(self):
+        self.make_orders('Pending', 40)
+        self.make_orders('Accepted', 10)
+        self.make_orders('Packed', 30)
+        self.make_orders('Delivered', 20)
+
+        # savepoint + (audit insert, 2 payment rollup moves, product and
+        # category rollup removals, update) per allowed source status
+        with self.assertNumQueries(2 + 6 * 3):
+            moved = transition(Order.objects.all(), 'Cancelled', self.staff)
+
+        self.assertEqual(moved, 80)
+        self.assertEqual(Order.objects.filter(status='Cancelled').count(), 80)
+        self.assertEqual(Order.objects.filter(status='Delivered').count(), 20)
+        self.assertEqual(OrderStatusChange.objects.count(), 80)
+        self.assertEqual(
+            OrderStatusChange.objects.filter(
+                from_status=STATUS_CODES['Packed'], to_status=STATUS_CODES['Cancelled'],
+                changed_by=self.staff,
+            ).count(),
+            30,
+        )
+
+    def test_invalid_transitions_are_refused(self):
+        self.make_orders('Cancelled', 1)
+        order = Order.objects.get()
+
+        self.assertEqual(transition(Order.objects.all(), 'Delivered'), 0)
+        with self.assertRaises(InvalidTransition):
+            transition(Order.objects.all(), 'Lost')
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse('admin:order-update-status', args=[order.id, 'Delivered']))
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Cancelled')
+        self.assertFalse(OrderStatusChange.objects.exists())
+
+    def test_audit_rows_are_append_only(self):
+        self.make_orders('Pending', 1)
+        transition(Order.objects.all(), 'Accepted')
+        change = OrderStatusChange.objects.get()
+        with self.assertRaises(ValueError):
+            change.save()
+
+
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGBA', (1200, 800), (200, 10, 10, 128)).save(buffer, 'PNG')
+        self.name = default_storage.save('product/ring.png', ContentFile(buffer.getvalue()))
+        self.product = Product(title='Ring', product_image=self.name)
+
+    def render(self):
+        return Template(
+            "{% load store_images %}{% responsive_image product.product_image product.title 'listing' %}"
+        ).render(Context({'product': self.product}))
+
+    def test_derivatives_have_deterministic_names_and_sizes(self):
+        build_derivatives(self.name)
+
+        for size, width in (('thumb', 120), ('listing', 400), ('detail', 900)):
+            for ext in ('webp', 'jpg'):
+                name = derivative_name(self.name, size, ext)
+                self.assertTrue(name.startswith('product/derivatives/ring.png-'))
+                with default_storage.open(name) as image_file:
+                    self.assertEqual(Image.open(image_file).width, width)
+
+    def test_same_stem_in_another_format_gets_its_own_derivatives(self):
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), 'blue').save(buffer, 'JPEG')
+        other = default_storage.save('product/ring.jpg', ContentFile(buffer.getvalue()))
+        build_derivatives(self.name)
+        build_derivatives(other)
+
+        self.assertNotEqual(derivative_name(self.name, 'thumb', 'jpg'), derivative_name(other, 'thumb', 'jpg'))
+        with default_storage.open(derivative_name(self.name, 'listing', 'jpg')) as image_file:
+            self.assertEqual(Image.open(image_file).width, 400)
+        with default_storage.open(derivative_name(other, 'listing', 'jpg')) as image_file:
+            self.assertEqual(Image.open(image_file).width, 400)
+
+    def test_rebuild_replaces_derivatives_in_place(self):
+        build_derivatives(self.name)
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), 'green').save(buffer, 'PNG')
+        with default_storage.open(self.name, 'wb') as image_file:
+            image_file.write(buffer.getvalue())
+        build_derivatives(self.name)
+
+        with default_storage.open(derivative_name(self.name, 'detail', 'jpg')) as image_file:
+            self.assertEqual(Image.open(image_file).width, 300)
+        # no leftovers under alternate names
+        self.assertEqual(len(default_storage.listdir('product/derivatives')[1]), 6)
+
+    def test_template_tag_emits_lazy_srcset(self):
+        self.assertIn('src="/media/product/ring.png"', self.render())
+
+        build_derivatives(self.name)
+        html = self.render()
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('/media/product/derivatives/ring.png-400.webp 400w', html)
+        self.assertNotIn('ring.png-900', html)
+        self.assertIn('loading="lazy"', html)
+
+
+def png_bytes(size=(40, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class PaymentProofUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('payer', 'payer@example.com', 'secret-pass-123')
+        cls.address = Address.objects.create(user=cls.user, locality='A', city='B', state='C')
+        cls.product = make_product(make_category(), price=Decimal('15.00'))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        Cart.objects.create(user=self.user, product=self.product)
+        self.client.force_login(self.user)
+
+    def checkout(self, name, content, content_type='image/png'):
+        return self.client.post(reverse('store:checkout'), {
+            'address': self.address.id,
+            'payment_method': 'QR',
+            'payment_proof': SimpleUploadedFile(name, content, content_type),
+        }, follow=True)
+
+    def assertRejected(self, response, error):
+        self.assertIn(error, [str(message) for message in response.context['messages']])
+        self.assertFalse(Order.objects.exists())
+
+    def test_magic_bytes_decide_the_type(self):
+        self.assertRejected(
+            self.checkout('proof.png', b'<?php echo "not an image"; ?>' * 10),
+            INVALID_TYPE,
+        )
+        self.assertRejected(self.checkout('proof.png', b'\x89PNG'), INVALID_TYPE)
+
+    def test_oversized_upload_is_rejected(self):
+        content = png_bytes() + b'\0' * PAYMENT_PROOF_MAX_SIZE
+        self.assertRejected(self.checkout('proof.png', content), TOO_LARGE)
+
+    def test_valid_proof_is_stored_with_sniffed_type(self):
+        # a PNG sent as JPEG by the client is still accepted as a PNG
+        response = self.checkout('proof.png', png_bytes(), content_type='image/jpeg')
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get()
+        self.assertTrue(default_storage.exists(order.payment_proof.name))
+        self.assertEqual(order.payment_status, 'Pending')
+
+    def test_strip_metadata_removes_exif(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), 'white').save(buffer, 'JPEG', exif=exif)
+        name = default_storage.save('payment_proofs/proof.jpg', ContentFile(buffer.getvalue()))
+
+        stripped = strip_metadata(name)
+        self.assertNotEqual(stripped, name)
+        with default_storage.open(stripped) as proof:
+            self.assertEqual(dict(Image.open(proof).getexif()), {})
+
+    def test_normalize_swaps_the_proof_before_deleting_the_original(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), 'white').save(buffer, 'JPEG', quality=95, exif=exif)
+        name = default_storage.save('payment_proofs/proof.jpg', ContentFile(buffer.getvalue()))
+        with default_storage.open(name) as proof:
+            quantization = Image.open(proof).quantization
+        order = Order.objects.create(
+            user=self.user, address=self.address, payment_method='QR', payment_proof=name,
+        )
+
+        stripped = normalize_payment_proof(name)
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_proof.name, stripped)
+        self.assertFalse(default_storage.exists(name))
+        with default_storage.open(stripped) as proof:
+            image = Image.open(proof)
+            self.assertEqual(dict(image.getexif()), {})
+            self.assertEqual(image.quantization, quantization)
+        self.assertTrue(derivatives_ready(stripped))
+
+    def test_normalize_keeps_the_original_without_an_order(self):
+        name = default_storage.save('payment_proofs/proof.png', ContentFile(png_bytes()))
+
+        self.assertEqual(normalize_payment_proof(name), name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(default_storage.listdir('payment_proofs'), ([], ['proof.png']))
+
+
+@task
+def add_numbers(a, b):
+    return a + b
+
+
+@task
+def always_fails():
+    raise RuntimeError('boom')
+
+
+@task(takes_context=True)
+def recorded_attempts(context):
+    return QueuedTask.objects.get(pk=context.task_result.id).worker_ids
+
+
+@task(takes_context=True)
+def loses_its_claim(context):
+    QueuedTask.objects.filter(pk=context.task_result.id).update(claim='another-worker')
+    return 'done'
+
+
+class TaskQueueTests(TestCase):
+
+    def test_enqueued_tasks_run_in_priority_order(self):
+        low = add_numbers.enqueue(1, 2)
+        high = add_numbers.using(priority=10).enqueue(3, 4)
+        self.assertEqual(low.status, TaskResultStatus.READY)
+
+        worker = Worker(batch_size=1)
+        self.assertEqual([row.id for row in worker.claim()], [int(high.id)])
+
+        metrics = Worker().run(burst=True)
+        self.assertEqual(metrics['succeeded'], 1)
+        low.refresh()
+        self.assertEqual(low.status, TaskResultStatus.SUCCESSFUL)
+        self.assertEqual(low.return_value, 3)
+
+    def test_batches_are_claimed_once(self):
+        for i in range(5):
+            add_numbers.enqueue(i, i)
+        first, second = Worker(batch_size=3), Worker(batch_size=3)
+        claimed = [row.id for row in first.claim()] + [row.id for row in second.claim()]
+        self.assertEqual(len(claimed), 5)
+        self.assertEqual(len(set(claimed)), 5)
+        self.assertEqual(first.claim(), [])
+
+    def test_a_task_late_in_its_batch_is_not_run_twice(self):
+        first, second = [add_numbers.enqueue(i, i) for i in range(2)]
+        worker, other = Worker(batch_size=2), Worker()
+        worker.worker_id, other.worker_id = 'worker', 'other'
+        done, late = worker.claim()
+        worker.execute(done)
+        # the first run outlasted the lease taken at the batch claim
+        QueuedTask.objects.filter(pk=late.pk).update(
+            last_attempted_at=late.last_attempted_at - timedelta(seconds=worker.backend.lease + 1),
+        )
+        reclaimed = other.claim()
+        self.assertEqual([row.pk for row in reclaimed], [int(second.id)])
+
+        with self.assertLogs('store.task_queue', 'WARNING'):
+            worker.execute(late)
+        self.assertEqual(worker.metrics['lost'], 1)
+        other.execute(reclaimed[0])
+        second.refresh()
+        self.assertEqual(second.status, TaskResultStatus.SUCCESSFUL)
+        self.assertEqual(second.worker_ids, ['other'])
+
+    def test_the_attempt_is_saved_before_the_run(self):
+        result = recorded_attempts.enqueue()
+        worker = Worker()
+        worker.run(burst=True)
+        result.refresh()
+        self.assertEqual(result.return_value, [worker.worker_id])
+
+    def test_a_run_that_lost_its_claim_saves_nothing(self):
+        result = loses_its_claim.enqueue()
+        with self.assertLogs('store.task_queue', 'WARNING'):
+            metrics = Worker().run(burst=True)
+        self.assertEqual(metrics['lost'], 1)
+        row = QueuedTask.objects.get(pk=result.id)
+        self.assertEqual((row.status, row.claim), (TaskResultStatus.RUNNING, 'another-worker'))
+        self.assertIsNone(row.return_value)
+
+    def test_idle_poll_is_a_single_read(self):
+        add_numbers.using(run_after=datetime.now(dt_timezone.utc) + timedelta(hours=1)).enqueue(1, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(Worker().claim(), [])
+
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        result = always_fails.enqueue()
+        worker = Worker()
+        with self.assertLogs('store.task_queue', 'WARNING'):
+            worker.run(burst=True)
+
+        row = QueuedTask.objects.get(pk=result.id)
+        self.assertEqual(row.status, TaskResultStatus.READY)
+        self.assertGreater(row.run_after, row.last_attempted_at)
+        worker.run(burst=True)  # not due yet
+        self.assertEqual(QueuedTask.objects.get(pk=row.pk).worker_ids, row.worker_ids)
+
+        for _ in range(2):
+            QueuedTask.objects.filter(pk=row.pk).update(run_after=row.enqueued_at)
+            with self.assertLogs('store.task_queue', 'WARNING'):
+                worker.run(burst=True)
+        result.refresh()
+        self.assertEqual(result.status, TaskResultStatus.FAILED)
+        self.assertEqual(result.attempts, 3)
+        self.assertEqual(result.errors[-1].exception_class, RuntimeError)
+
+
+class SalesRollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('owner', 'owner@example.com', 'secret-pass-123')
+        cls.address = Address.objects.create(user=cls.user, locality='A', city='B', state='C')
+        cls.rings = make_category()
+        cls.chains = make_category('Chains')
+        cls.ring = make_product(cls.rings, price=Decimal('15.00'))
+        cls.chain = make_product(cls.chains, 'Chain', 'C1', price=Decimal('40.00'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def place_order(self, ring_quantity=2):
+        Cart.objects.create(user=self.user, product=self.ring, quantity=ring_quantity)
+        Cart.objects.create(user=self.user, product=self.chain, quantity=1)
+        self.client.post(reverse('store:checkout'), {
+            'address': self.address.id, 'payment_method': 'COD',
+        })
+        return Order.objects.latest('id')
+
+    def snapshot(self):
+        return [
+            sorted(model.objects.values_list(*fields))
+            for model, fields in (
+                (DailyProductSales, ('day', 'product_id', 'order_count', 'units', 'revenue')),
+                (DailyCategorySales, ('day', 'category_id', 'order_count', 'units', 'revenue')),
+                (DailyPaymentSales, ('day', 'payment_method', 'order_status', 'order_count', 'revenue')),
+            )
+        ]
+
+    def test_checkout_and_status_changes_update_the_rollups(self):
+        first = self.place_order(2)
+        self.place_order(1)
+        today = first.ordered_date.date()
+
+        ring = DailyProductSales.objects.get(product=self.ring)
+        self.assertEqual((ring.day, ring.order_count, ring.units, ring.revenue), (today, 2, 3, Decimal('45.00')))
+        self.assertEqual(DailyCategorySales.objects.get(category=self.chains).revenue, Decimal('80.00'))
+        self.assertEqual(
+            list(DailyPaymentSales.objects.values_list('order_status', 'order_count', 'revenue')),
+            [('Pending', 2, Decimal('125.00'))],
+        )
+
+        transition(Order.objects.filter(pk=first.pk), 'Cancelled')
+        self.assertEqual(DailyProductSales.objects.get(product=self.ring).units, 1)
+        self.assertEqual(DailyCategorySales.objects.get(category=self.chains).revenue, Decimal('40.00'))
+        self.assertEqual(
+            sorted(DailyPaymentSales.objects.filter(order_count__gt=0).values_list('order_status', 'order_count')),
+            [('Cancelled', 1), ('Pending', 1)],
+        )
+
+        Order.objects.filter(pk=first.pk).delete()
+        self.assertFalse(DailyPaymentSales.objects.filter(order_status='Cancelled', order_count__gt=0).exists())
+
+    def test_backfill_matches_the_incremental_rollups(self):
+        for quantity in (1, 2, 3):
+            self.place_order(quantity)
+        transition(Order.objects.filter(pk=Order.objects.earliest('id').pk), 'Cancelled')
+        transition(Order.objects.filter(pk=Order.objects.latest('id').pk), 'Accepted')
+        incremental = self.snapshot()
+
+        call_command('backfill_sales_rollups', chunk_size=2, stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_dashboard_reads_only_the_rollups(self):
+        self.place_order()
+        day = Order.objects.get().ordered_date.date()
+        self.assertEqual(sales_report(day, day)['totals']['revenue'], Decimal('70.00'))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:store_salesdashboard_changelist'), {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Chains')
+        order_tables = ('"store_order"', '"store_orderitem"')
+        for query in context.captured_queries:
+            self.assertFalse(any(table in query['sql'] for table in order_tables), query['sql'])
+
+
+class CatalogImportExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        cls.rings = make_category()
+        make_category('Chains')
+        make_product(cls.rings, 'Old ring', 'R0')
+
+    def import_csv(self, text, batch_size=1000):
+        importer = CatalogImport(batch_size)
+        importer.run(read_rows(StringIO(text), 'csv'))
+        return importer
+
+    def test_upsert_by_sku(self):
+        importer = self.import_csv(
+            'sku,title,category,price,is_featured\n'
+            'R0,,chains,12.5,\n'
+            'R1,New ring,rings,20,1\n'
+            'R2,Broken,bangles,20,0\n'
+            'R3,No price,rings,,0\n'
+        )
+        self.assertEqual(
+            importer.stats,
+            {'rows': 4, 'created': 1, 'updated': 1, 'unchanged': 0, 'failed': 2},
+        )
+        self.assertEqual([line for line, message in importer.errors], [4, 5])
+
+        old = Product.objects.get(sku='R0')
+        self.assertEqual((old.title, old.category.slug, old.price), ('Old ring', 'chains', Decimal('12.50')))
+        new = Product.objects.get(sku='R1')
+        self.assertTrue(new.is_active and new.is_featured)
+        self.assertEqual(get_search_backend().search('new ring')[0], [new.id])
+
+    def test_a_failed_import_still_publishes_its_committed_batches(self):
+        def rows():
+            yield 2, {'sku': 'R1', 'title': 'New ring', 'category': 'rings', 'price': '20'}
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        version = get_catalog_version()
+        with self.assertRaises(UnicodeDecodeError):
+            CatalogImport(batch_size=1).run(rows())
+        self.assertTrue(Product.objects.filter(sku='R1').exists())
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertEqual(
+            ProductFacetCount.objects.aggregate(products=Sum('product_count'))['products'], 2,
+        )
+
+    def test_queries_grow_per_batch_not_per_row(self):
+        def rows(count):
+            return 'sku,title,category,price\n' + ''.join(
+                f'B{i},Bulk {i},rings,{i}\n' for i in range(count)
+            )
+
+        counts = []
+        for count in (10, 50):
+            Product.objects.filter(sku__startswith='B').delete()
+            with CaptureQueriesContext(connection) as context:
+                self.import_csv(rows(count), batch_size=10)
+            counts.append(len(context.captured_queries))
+        # each extra batch: existing SKUs, savepoint, insert, 2 index
+        # statements, release; the number of rows does not matter
+        self.assertEqual(counts[1] - counts[0], 4 * 6)
+
+    def test_export_round_trips(self):
+        self.import_csv('sku,title,category,price,detail_description\nR1,"Ring, gold",rings,20,"two\nlines"\n')
+        exported = ''.join(export_lines('csv'))
+        self.assertTrue(exported.startswith('sku,title,slug,category,price'))
+        self.assertEqual(self.import_csv(exported).stats['unchanged'], 2)
+
+        lines = list(export_lines('jsonl', Product.objects.filter(sku='R1')))
+        self.assertEqual(json.loads(lines[0])['detail_description'], 'two\nlines')
+
+        stdout = StringIO()
+        call_command('export_products', format='csv', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), exported)
+
+    def test_admin_export_action_streams(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:store_product_changelist'), {
+            'action': 'export_jsonl',
+            '_selected_action': list(Product.objects.values_list('pk', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['sku'] for row in rows], ['R0'])
+
+
+class OrderExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('finance', 'finance@example.com', 'secret-pass-123')
+        address = Address.objects.create(user=cls.admin, locality='Main St', city='Pune', state='MH')
+        ring = make_product(make_category(), price=Decimal('15.00'))
+        for day, status in ((1, 'Delivered'), (2, 'Cancelled'), (3, 'Pending')):
+            order = Order.objects.create(user=cls.admin, address=address, status=status, total_amount=45)
+            Order.objects.filter(pk=order.pk).update(
+                ordered_date=datetime(2026, 3, day, 12, tzinfo=dt_timezone.utc)
+            )
+            OrderItem.objects.create(order=order, product=ring, quantity=3, unit_price=ring.price)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def export(self, **params):
+        response = self.client.get(reverse('admin:order-export'), params)
+        self.assertTrue(response.streaming)
+        return list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_filters_by_date_and_status(self):
+        rows = self.export(format='csv', since='2026-03-02', until='2026-03-03')
+        self.assertEqual([row['status'] for row in rows], ['Cancelled', 'Pending'])
+
+        rows = self.export(format='csv', status=['Delivered', 'Pending'])
+        self.assertEqual([row['status'] for row in rows], ['Delivered', 'Pending'])
+        self.assertEqual(rows[0]['username'], 'finance')
+        self.assertEqual(rows[0]['city'], 'Pune')
+        self.assertEqual(rows[0]['sku'], 'R1')
+        self.assertEqual(rows[0]['line_total'], '45.00')
+
+    def test_export_reads_in_chunks(self):
+        with mock.patch('store.order_export.EXPORT_CHUNK_SIZE', 2), \
+                CaptureQueriesContext(connection) as context:
+            lines = list(export_orders('jsonl', order_lines()))
+        self.assertEqual(len(lines), 3)
+        # two full chunks and the empty one that ends the walk, each one joined query
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertEqual(json.loads(lines[0])['product'], 'Ring')
+
+    def test_form_is_shown_without_a_format(self):
+        response = self.client.get(reverse('admin:order-export'), {'since': 'yesterday'})
+        self.assertContains(response, 'Invalid since date')
+
+
+class SQLiteProfileTests(TestCase):
+
+    def test_connection_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class EnableWALTests(TestCase):
+
+    def test_wal_is_a_one_off_command_not_a_connection_pragma(self):
+        # every connection runs init_command; the journal mode would be
+        # written into whatever database file it opens
+        self.assertNotIn('journal_mode', settings.DATABASES['default']['OPTIONS']['init_command'])
+        # the in-memory test database cannot use WAL, which the command reports
+        with self.assertRaisesMessage(CommandError, 'journal_mode=memory'):
+            call_command('enable_wal', stdout=StringIO())
+
+
+class RetryOnLockedTests(SimpleTestCase):
+
+    def test_locked_transactions_are_retried_a_bounded_number_of_times(self):
+        calls = []
+
+        @retry_on_locked(attempts=3, backoff=0)
+        def write(fail_times, error='database is locked'):
+            calls.append(1)
+            if len(calls) <= fail_times:
+                raise OperationalError(error)
+            return 'done'
+
+        with self.assertLogs('store.db', 'WARNING') as logs:
+            self.assertEqual(write(2), 'done')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(logs.records), 2)
+
+        calls.clear()
+        with self.assertRaises(OperationalError), self.assertLogs('store.db', 'WARNING'):
+            write(5)
+        self.assertEqual(len(calls), 3)
+
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            write(1, 'no such table: store_cart')
+        self.assertEqual(len(calls), 1)
+
+        # only the outermost transaction can be retried
+        calls.clear()
+        with mock.patch('store.db.connection.in_atomic_block', True), \
+                self.assertRaises(OperationalError):
+            write(1)
+        self.assertEqual(len(calls), 1)
+
+
+@mock.patch('store.routers.replica_configured', return_value=True)
+@mock.patch('store.routers.connections')
+class CatalogReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        routers._health.update(checked_at=None, available=False)
+        self.router = routers.CatalogReplicaRouter()
+
+    def test_catalog_reads_go_to_the_replica_until_the_request_writes(self, connections, configured):
+        connections.__getitem__.return_value.in_atomic_block = False
+        read = self.router.db_for_read
+
+        self.assertIsNone(read(Product))  # outside a request
+        with routers.routing():
+            self.assertEqual(read(Product), 'replica')
+            self.assertEqual(read(DailyCategorySales), 'replica')
+            self.assertIsNone(read(Order))
+            with routers.use_primary():
+                self.assertIsNone(read(Category))
+            self.assertEqual(read(Category), 'replica')
+            self.assertEqual(self.router.db_for_write(Cart), 'default')
+            self.assertIsNone(read(Product))
+        with routers.routing(pinned=True):
+            self.assertIsNone(read(Product))
+
+        connections.__getitem__.return_value.in_atomic_block = True
+        with routers.routing():
+            self.assertIsNone(read(Product))
+
+    def test_reads_fall_back_to_the_primary_while_the_replica_is_down(self, connections, configured):
+        replica = connections.__getitem__.return_value
+        replica.in_atomic_block = False
+        replica.cursor.side_effect = OperationalError('unable to open database file')
+        with routers.routing(), self.assertLogs('store.routers', 'WARNING'):
+            self.assertIsNone(self.router.db_for_read(Product))
+            # the failed check is remembered rather than retried on every query
+            self.assertIsNone(self.router.db_for_read(Product))
+        self.assertEqual(replica.cursor.call_count, 1)
+
+
+@mock.patch('store.middleware.replica_configured', return_value=True)
+class ReplicaRoutingMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='secret-pass-123')
+        cls.product = make_product(make_category())
+
+    def test_a_write_pins_the_user_to_the_primary(self, configured):
+        self.client.force_login(self.user)
+        self.client.get(reverse('store:product-detail', args=[self.product.slug]))
+        self.assertNotIn(routers.PIN_SESSION_KEY, self.client.session)
+
+        with self.settings(REPLICA_PIN_SECONDS=30):
+            self.client.get(reverse('store:add-to-cart'), {'prod_id': self.product.id})
+        self.assertAlmostEqual(
+            self.client.session[routers.PIN_SESSION_KEY], time.time() + 30, delta=5,
+        )
+
+
+class QueryPlanTests(TestCase):
+    """
+    Run EXPLAIN QUERY PLAN on every query the storefront views issue and
+    fail when one reads a whole store table instead of searching an index,
+    or sorts the rows of a LIMITed page.
+    """
+
+    # Tables that are read whole by design: a few hundred facet cells.
+    SCANNED_TABLES = {'store_productfacetcount'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='secret-pass-123')
+        address = Address.objects.create(user=cls.user, locality='Here', city='Town', state='State')
+        cls.category = make_category(is_featured=True)
+        cls.products = Product.objects.bulk_create([
+            new_product(
+                cls.category, f'Ring {i}', f'R{i}', price=Decimal('10.00') + i, is_featured=i % 2 == 0,
+            )
+            for i in range(30)
+        ])
+        Cart.objects.create(user=cls.user, product=cls.products[0], quantity=2)
+        cls.order = Order.objects.create(user=cls.user, address=address, total_amount=Decimal('20.00'))
+        OrderItem.objects.create(order=cls.order, product=cls.products[1], quantity=1, unit_price=Decimal('11.00'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def full_scans(self, url, params=None):
+        bump_catalog_version()  # build the cached catalog values again
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertLess(response.status_code, 400, url)
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    match = re.match(r'SCAN (store_\w+)$', row[-1])
+                    if match and match.group(1) not in self.SCANNED_TABLES:
+                        scans.append(f'{row[-1]}: {sql}')
+                    # a page that has to sort reads every matching row first
+                    elif row[-1] == 'USE TEMP B-TREE FOR ORDER BY' and ' LIMIT ' in sql:
+                        scans.append(f'{row[-1]}: {sql}')
+        return scans
+
+    def test_storefront_queries_search_an_index(self):
+        page = self.client.get(reverse('store:category-products', args=['rings']))
+        pages = [
+            (reverse('store:home'), None),
+            (reverse('store:product-detail', args=[self.products[0].slug]), None),
+            (reverse('store:all-categories'), None),
+            (reverse('store:category-products', args=['rings']), None),
+            (reverse('store:category-products', args=['rings']), {'after': page.context['next_cursor']}),
+            (reverse('store:shop'), None),
+            (reverse('store:shop'), {'featured': '1'}),
+            (reverse('store:shop'), {'category': self.category.id, 'price': '0'}),
+            (reverse('store:cart'), None),
+            (reverse('store:cart-api-summary'), None),
+            (reverse('store:checkout'), None),
+            (reverse('store:orders'), None),
+            (reverse('store:order-receipt', args=[self.order.id]), None),
+            (reverse('store:profile'), None),
+            (reverse('store:add-to-cart'), {'prod_id': self.products[2].id}),
+            (reverse('store:metrics'), None),
+        ]
+        for url, params in pages:
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.full_scans(url, params), [])
+
+
+class GenerateDatasetTests(TestCase):
+
+    def test_small_dataset_is_consistent(self):
+        call_command(
+            'generate_dataset', categories=5, products=40, users=10, orders=60, carts=4,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(Address.objects.count(), 10)
+        self.assertEqual(Order.objects.count(), 60)
+        self.assertEqual(Cart.objects.values('user').distinct().count(), 4)
+        order = Order.objects.order_by('id').first()
+        self.assertEqual(order.total_amount, sum(item.line_total for item in order.items.all()))
+        self.assertEqual(order.address.user_id, order.user_id)
+
+        # the rollups were backfilled from the generated history
+        counted = sum(
+            Order.objects.exclude(status='Cancelled').values_list('total_amount', flat=True)
+        )
+        report = sales_report(datetime(2000, 1, 1).date(), datetime(2030, 1, 1).date())
+        self.assertEqual(report['totals']['revenue'], counted)
+        self.assertTrue(self.client.login(username='user000000', password='bench-pass-123'))
+
+
+class RequestMetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_product(make_category(is_featured=True), is_featured=True)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+    def test_sampled_requests_get_a_server_timing_header(self):
+        bump_catalog_version()
+        response = self.client.get(reverse('store:home'))
+        timing = dict(
+            part.split(';', 1) for part in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timing), {'db', 'tpl', 'cp', 'total'})
+        self.assertRegex(timing['db'], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertIn('desc="store:home"', timing['total'])
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_left_alone(self):
+        response = self.client.get(reverse('store:home'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_repeated_statements_are_counted_without_parameters(self):
+        with record_request() as metrics:
+            for slug in ('a', 'b', 'c'):
+                Product.objects.filter(slug=slug).first()
+            Category.objects.first()
+        self.assertEqual(metrics.queries, 4)
+        [(sql, count)] = metrics.repeated_statements(3)
+        self.assertIn('store_product', sql)
+        self.assertEqual(count, 3)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_counters_of_all_processes_are_summed(self):
+        first = CounterFile(f'{self.directory}/100.db')
+        second = CounterFile(f'{self.directory}/200.db')
+        for i in range(2000):  # outgrows the initial file size
+            first.add(f'series_{i}')
+        first.add('requests{view="home"}', 2)
+        second.add('requests{view="home"}', 0.5)
+        totals = collect_counters(self.directory)
+        self.assertEqual(totals['requests{view="home"}'], 2.5)
+        self.assertEqual(totals['series_1999'], 1)
+
+        # a worker restarted under the same pid carries on from its file
+        CounterFile(f'{self.directory}/200.db').add('requests{view="home"}')
+        self.assertEqual(collect_counters(self.directory)['requests{view="home"}'], 3.5)
+
+    def test_files_of_exited_processes_are_folded_into_a_new_one(self):
+        dead, alive = 2 ** 22 + 1, os.getppid()  # above Linux's pid_max
+        CounterFile(f'{self.directory}/{dead}.db').add('requests{view="home"}', 2)
+        CounterFile(f'{self.directory}/{alive}.db').add('requests{view="home"}', 1)
+
+        with self.settings(METRICS_DIR=self.directory):
+            inc('requests', view='home')
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory) if name.endswith('.db')),
+            sorted([f'{alive}.db', f'{os.getpid()}.db']),
+        )
+        self.assertEqual(collect_counters(self.directory)['requests{view="home"}'], 4)
+
+    def test_scrape(self):
+        user = User.objects.create_user('payer')
+        address = Address.objects.create(user=user, locality='Here', city='Town', state='State')
+        Order.objects.create(user=user, address=address, payment_method='QR')
+        with self.settings(METRICS_DIR=self.directory, METRICS_TOKEN=''):
+            self.client.get(reverse('store:all-categories'))
+            self.client.generic('BREW', reverse('store:all-categories'))
+            response = self.client.get(reverse('store:metrics'))
+            self.assertEqual(
+                self.client.get(reverse('store:metrics'), REMOTE_ADDR='10.0.0.1').status_code, 403,
+            )
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE store_http_request_duration_seconds histogram', lines)
+        self.assertIn(
+            'store_http_request_duration_seconds_count'
+            '{view="store:all-categories",method="GET",status="200"} 1',
+            lines,
+        )
+        # methods are the client's to choose, so unknown ones share a label
+        self.assertIn(
+            'store_http_request_duration_seconds_count'
+            '{view="store:all-categories",method="other",status="200"} 1',
+            lines,
+        )
+        buckets = [line for line in lines if line.startswith(
+            'store_http_request_duration_seconds_bucket{view="store:all-categories"'
+        )]
+        self.assertTrue(buckets[-1].endswith('le="+Inf"} 1'))
+        self.assertIn('store_qr_payments_pending 1', lines)
+
+        with self.settings(METRICS_DIR=self.directory, METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('store:metrics')).status_code, 403)
+            response = self.client.get(
+                reverse('store:metrics'), HTTP_AUTHORIZATION='Bearer s3cret', REMOTE_ADDR='10.0.0.1',
+            )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = make_category(is_featured=True)
+        cls.product = make_product(cls.category, is_featured=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_cached_and_revalidated(self):
+        url = reverse('store:home')
+        first = self.client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertIn('Cookie', first['Vary'])
+        self.assertEqual(first['Cache-Control'], 'public, max-age=0, stale-while-revalidate=30')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.client.get(url, headers={'if-none-match': first['ETag']}).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, headers={'if-modified-since': first['Last-Modified']}).status_code, 304,
+        )
+
+        # a bulk edit moves the catalog version and the validators
+        time.sleep(1)  # Last-Modified has whole seconds
+        Product.objects.filter(id=self.product.id).update(title='Gold Ring')
+        bump_catalog_version()  # on_commit never runs in a TestCase
+        changed = self.client.get(url, headers={'if-none-match': first['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed['X-Page-Cache'], 'MISS')
+        self.assertContains(changed, 'Gold Ring')
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertNotEqual(changed['Last-Modified'], first['Last-Modified'])
+
+        # the cookie cart is part of the key: its count is in the navbar
+        self.client.get(reverse('store:add-to-cart'), {'prod_id': self.product.id})
+        with_cart = self.client.get(url)
+        self.assertEqual(with_cart['X-Page-Cache'], 'MISS')
+        self.assertContains(with_cart, '(1)')
+        self.assertNotEqual(with_cart['ETag'], changed['ETag'])
+
+    def test_signed_in_users_get_the_page_rendered(self):
+        user = User.objects.create_user('shopper', password='secret-pass-123')
+        self.client.force_login(user)
+        response = self.client.get(reverse('store:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_detail_page_carries_no_csrf_token(self):
+        url = reverse('store:product-detail', args=[self.product.slug])
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        self.client.cookies.clear()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        # nor the cookie: a CDN would hand one visitor's to everyone
+        self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertContains(response, reverse('store:cart-api-token'))
+
+        # the add-to-cart script asks for the token instead
+        token = self.client.get(reverse('store:cart-api-token'))
+        self.assertIn(settings.CSRF_COOKIE_NAME, token.cookies)
+        self.assertIn('private', token['Cache-Control'])
+        self.assertTrue(token.json()['token'])
+
+    def test_pages_that_set_the_csrf_cookie_are_private(self):
+        view = ensure_csrf_cookie(anonymous_page_cache(lambda request: HttpResponse('page')))
+        for state in ('MISS', 'HIT'):
+            response = view(RequestFactory().get('/page/'))
+            self.assertEqual(response['X-Page-Cache'], state)
+            self.assertIn('private', response['Cache-Control'])
+            self.assertNotIn('public', response['Cache-Control'])
+
+    def test_a_new_release_renders_pages_again(self):
+        url = reverse('store:all-categories')
+        first = self.client.get(url)
+        with mock.patch('store.page_cache.PAGE_CACHE_RELEASE', 'next'):
+            deployed = self.client.get(url, headers={'if-none-match': first['ETag']})
+        self.assertEqual(deployed.status_code, 200)
+        self.assertEqual(deployed['X-Page-Cache'], 'MISS')
+        self.assertNotEqual(deployed['ETag'], first['ETag'])
+
+    def test_stale_page_is_served_while_another_request_renders(self):
+        url = reverse('store:all-categories')
+        first = self.client.get(url)
+        Category.objects.filter(id=self.category.id).update(title='Bands')
+        bump_catalog_version()
+        lock = f'{page_key(first.wsgi_request, 0)}:lock'
+        cache.add(lock, 1)
+        with self.assertNumQueries(0):
+            stale = self.client.get(url)
+        self.assertEqual(stale['X-Page-Cache'], 'STALE')
+        self.assertNotContains(stale, 'Bands')
+
+        cache.delete(lock)
+        fresh = self.client.get(url)
+        self.assertEqual(fresh['X-Page-Cache'], 'MISS')
+        self.assertContains(fresh, 'Bands')
+
+    def test_key_ignores_query_params_the_view_does_not_read(self):
+        url = reverse('store:category-products', args=[self.category.slug])
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, {'utm_source': 'mail'})['X-Page-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url, {'after': 'next'})['X-Page-Cache'], 'MISS')
+        self.assertEqual(
+            self.client.get(url, {'after': 'next', 'utm_source': 'mail'})['X-Page-Cache'], 'HIT',
+        )
+
+    def test_pending_messages_skip_the_cache(self):
+        url = reverse('store:home')
+        self.client.get(url)
+        self.client.cookies['messages'] = 'pending'
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+
+    def test_request_without_a_stale_copy_renders_instead_of_waiting(self):
+        url = reverse('store:all-categories')
+        lock = f'{page_key(self.client.get(url).wsgi_request, 0)}:lock'
+        cache.clear()
+        cache.add(lock, 1)
+        started = time.monotonic()
+        response = self.client.get(url)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Rings')
+        # the render holding the lock stores the page, not this one
+        self.assertIsNone(cache.get(lock.removesuffix(':lock')))
+
+    def test_stored_pages_are_rendered_from_the_primary(self):
+        # a lagging replica would store old rows under the new catalog version
+        pinned = []
+
+        @anonymous_page_cache
+        def view(request):
+            pinned.append(routers._routing.get().pinned)
+            return HttpResponse('page')
+
+        with routers.routing():
+            view(RequestFactory().get('/page/'))
+        self.assertEqual(pinned, [True])
+
+    def test_stale_page_is_served_when_the_database_fails(self):
+        url = reverse('store:category-products', args=[self.category.slug])
+        self.client.get(url)
+        bump_catalog_version()
+        with mock.patch('store.views.cached_catalog', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('store.page_cache', 'WARNING'):
+                response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+        self.assertContains(response, 'Ring')
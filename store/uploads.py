@@ -0,0 +1,88 @@
+from io import BytesIO
+
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler, SkipFile, StopFutureHandlers,
+)
+
+PAYMENT_PROOF_FIELD = 'payment_proof'
+PAYMENT_PROOF_MAX_SIZE = 5 * 1024 * 1024
+
+TOO_LARGE = "Payment proof image is too large. Maximum size is 5MB."
+INVALID_TYPE = "Invalid file type. Please upload a valid image (JPG, PNG, or WEBP)."
+
+# Enough leading bytes to tell the accepted formats apart.
+SNIFF_LENGTH = 12
+
+
+def sniff_image_type(head):
+    """Content type from the file's magic bytes, or None if not accepted."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class PaymentProofUploadHandler(FileUploadHandler):
+    """
+    Receives the checkout payment proof while the request body streams in.
+    The upload is dropped (SkipFile) as soon as it is known to be bad: when
+    the request is larger than the limit, when the first bytes are not a
+    JPEG/PNG/WebP signature, or when it grows past PAYMENT_PROOF_MAX_SIZE.
+    Nothing is written to disk, and at most 5MB is held in memory.
+
+    The reason is left on request.payment_proof_error for the view. Other
+    file fields are passed on to the default handlers.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_too_large = content_length > PAYMENT_PROOF_MAX_SIZE + 64 * 1024
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.activated = field_name == PAYMENT_PROOF_FIELD
+        if not self.activated:
+            return
+        self.request.payment_proof_error = None
+        if self.request_too_large:
+            self.reject(TOO_LARGE)
+        self.buffer = BytesIO()
+        self.sniffed_type = None
+        raise StopFutureHandlers()
+
+    def reject(self, error):
+        self.request.payment_proof_error = error
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activated:
+            return raw_data
+        if start + len(raw_data) > PAYMENT_PROOF_MAX_SIZE:
+            self.reject(TOO_LARGE)
+        self.buffer.write(raw_data)
+        if self.sniffed_type is None and self.buffer.tell() >= SNIFF_LENGTH:
+            self.sniffed_type = sniff_image_type(self.buffer.getbuffer()[:SNIFF_LENGTH].tobytes())
+            if self.sniffed_type is None:
+                self.reject(INVALID_TYPE)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+        if self.sniffed_type is None:
+            # Shorter than any signature. The file is still returned so the
+            # parser does not fall through to the other handlers.
+            self.request.payment_proof_error = INVALID_TYPE
+        self.buffer.seek(0)
+        return InMemoryUploadedFile(
+            file=self.buffer,
+            field_name=self.field_name,
+            name=self.file_name,
+            content_type=self.sniffed_type or 'application/octet-stream',
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
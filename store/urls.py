@@ -19,6 +19,11 @@ urlpatterns = [
     path('plus-cart/<int:cart_id>/', views.plus_cart, name="plus-cart"),
     path('minus-cart/<int:cart_id>/', views.minus_cart, name="minus-cart"),
     path('cart/', views.cart, name="cart"),
+    path('api/cart/', views.cart_api_summary, name="cart-api-summary"),
+    path('api/cart/token/', views.cart_api_token, name="cart-api-token"),
+    path('api/cart/add/', views.cart_api_add, name="cart-api-add"),
+    path('api/cart/<int:cart_id>/quantity/', views.cart_api_quantity, name="cart-api-quantity"),
+    path('api/cart/<int:cart_id>/remove/', views.cart_api_remove, name="cart-api-remove"),
     path('checkout/', views.checkout, name="checkout"),
     path('orders/', views.orders, name="orders"),
     path('orders/receipt/<int:order_id>/', views.order_receipt, name='order-receipt'),
@@ -30,12 +35,14 @@ urlpatterns = [
     path('categories/', views.all_categories, name="all-categories"),
     path('category/<slug:slug>/', views.category_products, name="category-products"),
     path('shop/', views.shop, name="shop"),
+    path('catalog-cache/stats/', views.catalog_cache_stats_view, name="catalog-cache-stats"),
+    path('metrics', views.metrics_view, name="metrics"),
 
     # ---------------- AUTH ----------------
     path('accounts/register/', views.RegistrationView.as_view(), name="register"),
     path(
         'accounts/login/',
-        auth_views.LoginView.as_view(
+        views.LoginView.as_view(
             template_name='account/login.html',
             authentication_form=LoginForm
         ),
@@ -1,52 +1,142 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.contrib import messages
 from django.views import View
 from django.conf import settings  # ADD THIS LINE
-import decimal
-
-from .models import Address, Cart, Category, Order, Product
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import F, Prefetch
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.middleware.csrf import get_token
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_POST
+import logging
+import time
+
+from .cache import cached_catalog, catalog_cache_stats, set_cart_count
+from .cart_summary import CartSummary, cart_lines, cart_summary, cart_totals, session_cart_summary
+from .checkout import EmptyCart, place_order
+from . import metrics
+from .models import Address, Cart, Category, Order, OrderItem, Product
+from .facets import PRICE_BANDS, browse_products, parse_facets
 from .forms import RegistrationForm, AddressForm
+from .page_cache import anonymous_page_cache, shown
+from .pagination import cached_first_page, decode_cursor
+from .search import SEARCH_PAGE_SIZE, search_products
+from .session_cart import SessionCart
+from .uploads import PaymentProofUploadHandler
+
+logger = logging.getLogger(__name__)
+
+RELATED_PRODUCTS_LIMIT = 4
 
 
+@anonymous_page_cache
 def home(request):
-    categories = Category.objects.filter(is_active=True, is_featured=True)[:3]
-    products = Product.objects.filter(is_active=True, is_featured=True)[:8]
+    categories = cached_catalog(
+        'home-categories',
+        lambda: Category.objects.filter(is_active=True, is_featured=True)[:3],
+    )
+    products = cached_catalog(
+        'home-products',
+        lambda: Product.objects.filter(is_active=True, is_featured=True)[:8],
+    )
+    shown(request, 'category', categories)
+    shown(request, 'product', products)
     return render(request, 'store/index.html', {
         'categories': categories,
         'products': products,
     })
 
 
+@anonymous_page_cache
 def detail(request, slug):
-    product = get_object_or_404(Product, slug=slug)
-    related_products = Product.objects.exclude(id=product.id).filter(
-        is_active=True,
-        category=product.category
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
+    # Newest-id first rides the category_id index without a sort step.
+    related_products = cached_catalog(
+        'related-products',
+        lambda: Product.objects.exclude(id=product.id).filter(
+            is_active=True,
+            category_id=product.category_id
+        ).order_by('-id')[:RELATED_PRODUCTS_LIMIT],
+        product.id,
     )
+    shown(request, 'product', [product, *related_products])
+    shown(request, 'category', [product.category])
     return render(request, 'store/detail.html', {
         'product': product,
         'related_products': related_products,
     })
 
 
+@anonymous_page_cache
 def all_categories(request):
-    categories = Category.objects.filter(is_active=True)
+    categories = cached_catalog(
+        'active-categories',
+        lambda: Category.objects.filter(is_active=True),
+    )
+    shown(request, 'category', categories)
     return render(request, 'store/categories.html', {'categories': categories})
 
 
+@anonymous_page_cache(params=('after',))
 def category_products(request, slug):
-    category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(is_active=True, category=category)
-    categories = Category.objects.filter(is_active=True)
+    category = cached_catalog(
+        'category',
+        lambda: Category.objects.filter(slug=slug).first(),
+        slug,
+    )
+    if category is None:
+        raise Http404("No Category matches the given query.")
+    after = request.GET.get('after', '')
+    if decode_cursor(after) is None:
+        after = ''
+    page = cached_first_page(
+        'category-products',
+        Product.objects.filter(is_active=True, category=category),
+        after,
+        category.id,
+    )
+    categories = cached_catalog(
+        'active-categories',
+        lambda: Category.objects.filter(is_active=True),
+    )
+    shown(request, 'category', [category, *categories])
+    shown(request, 'product', page['object_list'])
     return render(request, 'store/category_products.html', {
         'category': category,
-        'products': products,
+        'products': page['object_list'],
+        'next_cursor': page['next_cursor'],
+        'is_first_page': not after,
         'categories': categories,
     })
 
 
+@staff_member_required
+def catalog_cache_stats_view(request):
+    return JsonResponse(catalog_cache_stats())
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape target. With METRICS_TOKEN set it wants
+    `Authorization: Bearer <token>`; without one only loopback may scrape.
+    """
+    if settings.METRICS_TOKEN:
+        allowed = constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+        )
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1')
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # ---------- AUTH ----------
 
 class RegistrationView(View):
@@ -56,16 +146,29 @@ class RegistrationView(View):
 
     def post(self, request):
         form = RegistrationForm(request.POST)
+        session_cart = SessionCart(request)
         if form.is_valid():
-            form.save()
+            user = form.save()
+            session_cart.merge_into(user)
             messages.success(request, "Registration successful!")
-        return render(request, 'account/register.html', {'form': form})
+        response = render(request, 'account/register.html', {'form': form})
+        return session_cart.save(response)
+
+
+class LoginView(auth_views.LoginView):
+    """Log in and move the anonymous cookie cart into the user's cart."""
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        session_cart = SessionCart(self.request)
+        session_cart.merge_into(self.request.user)
+        return session_cart.save(response)
 
 
 @login_required
 def profile(request):
     addresses = Address.objects.filter(user=request.user)
-    orders = Order.objects.filter(user=request.user)
+    orders = _orders_with_items(request.user)
     return render(request, 'account/profile.html', {
         'addresses': addresses,
         'orders': orders
@@ -91,113 +194,131 @@ class AddressView(View):
         return redirect('store:profile')
 
 
-@login_required
 def add_to_cart(request):
     product = get_object_or_404(Product, id=request.GET.get('prod_id'))
+    if not request.user.is_authenticated:
+        session_cart = SessionCart(request)
+        session_cart.add(product.id)
+        return session_cart.save(redirect('store:cart'))
+
     cart, created = Cart.objects.get_or_create(
         user=request.user,
         product=product
     )
     if not created:
-        cart.quantity += 1
-        cart.save()
+        Cart.objects.filter(id=cart.id).update(quantity=F('quantity') + 1)
     return redirect('store:cart')
 
 
-@login_required
 def cart(request):
-    cart_products = Cart.objects.filter(user=request.user)
-    amount = sum(p.quantity * p.product.price for p in cart_products)
-    shipping_amount = decimal.Decimal(10)
+    if not request.user.is_authenticated:
+        summary = session_cart_summary(SessionCart(request))
+        addresses = []
+    else:
+        summary = cart_summary(request.user)
+        set_cart_count(request.user, summary.count)
+        addresses = Address.objects.filter(user=request.user)
 
     return render(request, 'store/cart.html', {
-        'cart_products': cart_products,
-        'amount': amount,
-        'shipping_amount': shipping_amount,
-        'total_amount': amount + shipping_amount,
-        'addresses': Address.objects.filter(user=request.user),
+        'cart_products': summary.lines,
+        'amount': summary.amount,
+        'shipping_amount': summary.shipping,
+        'total_amount': summary.total,
+        'addresses': addresses,
     })
 
 
 @login_required
+@csrf_exempt
 def checkout(request):
-    cart_items = Cart.objects.filter(user=request.user)
+    # The upload handler has to be installed before anything reads
+    # request.POST, the CSRF check included, hence csrf_protect below.
+    request.upload_handlers.insert(0, PaymentProofUploadHandler(request))
+    return _checkout(request)
+
+
+@csrf_protect
+def _checkout(request):
+    timings = {}
+    started = time.perf_counter()
+    summary = cart_summary(request.user)
+    cart_items = summary.lines
     addresses = Address.objects.filter(user=request.user)
+    timings['load'] = time.perf_counter() - started
 
-    if not cart_items.exists():
+    if not cart_items:
         messages.warning(request, "Your cart is empty!")
         return redirect('store:cart')
 
-    # calculate totals
-    amount = 0
-    cart_data = []
-    for item in cart_items:
-        line = item.quantity * item.product.price
-        amount += line
-        cart_data.append({
-            'product': item.product,
-            'quantity': item.quantity,
-            'line_total': line
-        })
-
-    shipping = decimal.Decimal(10)
-    total = amount + shipping
-
     if request.method == "POST":
         saved_addr_id = request.POST.get('address')
         payment_method = request.POST.get('payment_method')
+        # label values come from a fixed set, whatever the client posts
+        method_label = payment_method if payment_method in ('COD', 'QR') else 'other'
 
         # NEW ADDRESS
         new_locality = request.POST.get('locality')
         new_city = request.POST.get('city')
         new_state = request.POST.get('state')
 
-        # Choose saved address OR create a new one
+        # Choose saved address OR validate the new one
         if saved_addr_id:
             address = get_object_or_404(Address, id=saved_addr_id, user=request.user)
         else:
             if not(new_locality and new_city and new_state):
+                metrics.inc('store_checkouts_total', payment_method=method_label, outcome='invalid')
                 messages.error(request, "Please fill all fields for new address.")
                 return redirect('store:checkout')
-
-            address = Address.objects.create(
-                user=request.user,
-                locality=new_locality,
-                city=new_city,
-                state=new_state
-            )
+            address = None
 
         # Handle payment proof for QR payment
         payment_proof = None
         if payment_method == "QR":
+            # Size and file type were checked while streaming (store.uploads)
+            upload_error = getattr(request, 'payment_proof_error', None)
+            if upload_error:
+                metrics.inc('store_checkouts_total', payment_method=method_label, outcome='invalid')
+                messages.error(request, upload_error)
+                return redirect('store:checkout')
+
             payment_proof = request.FILES.get('payment_proof')
             if not payment_proof:
+                metrics.inc('store_checkouts_total', payment_method=method_label, outcome='invalid')
                 messages.error(request, "Please upload your payment screenshot for QR payment.")
                 return redirect('store:checkout')
-            
-            # Validate file size (max 5MB)
-            if payment_proof.size > 5 * 1024 * 1024:
-                messages.error(request, "Payment proof image is too large. Maximum size is 5MB.")
-                return redirect('store:checkout')
-            
-            # Validate file type
-            allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
-            if payment_proof.content_type not in allowed_types:
-                messages.error(request, "Invalid file type. Please upload a valid image (JPG, PNG, or WEBP).")
-                return redirect('store:checkout')
 
-        # Create orders for each cart item
-        for item in cart_items:
-            Order.objects.create(
-                user=request.user,
-                address=address,
-                product=item.product,
-                quantity=item.quantity,
-                payment_method=payment_method,
-                payment_proof=payment_proof,
-                payment_status='Pending' if payment_method == 'QR' else 'Verified'
+            # Store the screenshot before taking the database write lock.
+            phase = time.perf_counter()
+            proof_field = Order._meta.get_field('payment_proof')
+            payment_proof = proof_field.storage.save(
+                proof_field.generate_filename(None, payment_proof.name),
+                payment_proof,
+                max_length=proof_field.max_length,
             )
-            item.delete()
+            timings['upload'] = time.perf_counter() - phase
+
+        if address is None:
+            address = {'locality': new_locality, 'city': new_city, 'state': new_state}
+        try:
+            order = place_order(request.user, address, payment_method, payment_proof, timings)
+        except EmptyCart:
+            # another checkout of this cart got there first
+            if payment_proof:
+                Order._meta.get_field('payment_proof').storage.delete(payment_proof)
+            metrics.inc('store_checkouts_total', payment_method=method_label, outcome='invalid')
+            messages.warning(request, "Your cart is empty!")
+            return redirect('store:cart')
+        except Exception:
+            metrics.inc('store_checkouts_total', payment_method=method_label, outcome='failed')
+            raise
+        metrics.inc('store_checkouts_total', payment_method=method_label, outcome='placed')
+
+        timings['total'] = time.perf_counter() - started
+        logger.info(
+            "checkout user=%s order=%s payment=%s %s",
+            request.user.pk, order.pk, payment_method,
+            ' '.join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items()),
+        )
 
         if payment_method == "QR":
             messages.success(
@@ -211,43 +332,145 @@ def checkout(request):
         return redirect('store:orders')
 
     return render(request, 'store/checkout.html', {
-        'cart_items': cart_data,
+        'cart_items': cart_items,
         'addresses': addresses,
-        'amount': amount,
-        'shipping_amount': shipping,
-        'total_amount': total,
+        'amount': summary.amount,
+        'shipping_amount': summary.shipping,
+        'total_amount': summary.total,
     })
 
 
+def _orders_with_items(user):
+    return Order.objects.filter(user=user).order_by('-ordered_date').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+
+
 @login_required
 def orders(request):
-    orders = Order.objects.filter(user=request.user).order_by('-ordered_date')
+    orders = _orders_with_items(request.user)
     return render(request, 'store/orders.html', {'orders': orders})
 
 
+def _facet_url(request, name, value):
+    """Shop URL with facet name set to value (or cleared when None)."""
+    params = request.GET.copy()
+    params.pop('after', None)
+    if value is None:
+        params.pop(name, None)
+    else:
+        params[name] = value
+    query = params.urlencode()
+    return f"{request.path}?{query}" if query else request.path
+
+
+def _shop_facets(request, selected, counts):
+    categories = cached_catalog(
+        'active-categories',
+        lambda: Category.objects.filter(is_active=True),
+    )
+    return {
+        'categories': [
+            {
+                'label': category.title,
+                'count': counts['categories'].get(category.id, 0),
+                'selected': selected['category'] == category.id,
+                'url': _facet_url(
+                    request, 'category',
+                    None if selected['category'] == category.id else category.id,
+                ),
+            }
+            for category in categories
+        ],
+        'price_bands': [
+            {
+                'label': label,
+                'count': counts['price_bands'].get(band, 0),
+                'selected': selected['price'] == band,
+                'url': _facet_url(
+                    request, 'price', None if selected['price'] == band else band,
+                ),
+            }
+            for band, (low, high, label) in enumerate(PRICE_BANDS)
+        ],
+        'featured': {
+            'count': counts['featured'],
+            'selected': selected['featured'],
+            'url': _facet_url(request, 'featured', None if selected['featured'] else '1'),
+        },
+    }
+
+
 def shop(request):
-    return render(request, 'store/shop.html')
+    query = request.GET.get('q', '').strip()
+    context = {'query': query}
+
+    if query:
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        products, total = search_products(query, page)
+        context.update({
+            'products': products,
+            'total': total,
+            'page': page,
+            'previous_page': page - 1 if page > 1 else None,
+            'next_page': page + 1 if page * SEARCH_PAGE_SIZE < total else None,
+        })
+    else:
+        after = request.GET.get('after', '')
+        if decode_cursor(after) is None:
+            after = ''
+        selected = parse_facets(request.GET)
+        listing = browse_products(selected, after)
+        context.update({
+            'products': listing['object_list'],
+            'next_url': (
+                _facet_url(request, 'after', listing['next_cursor'])
+                if listing['next_cursor'] else None
+            ),
+            'first_url': None if not after else _facet_url(request, 'after', None),
+            'total': listing['facets']['total'],
+            'facets': _shop_facets(request, selected, listing['facets']),
+        })
+
+    return render(request, 'store/shop.html', context)
 
 
 def test(request):
     return render(request, 'store/test.html')
 
-@login_required
+# For anonymous visitors cart_id is the product id of the cookie cart line.
+
 def remove_cart(request, cart_id):
+    if not request.user.is_authenticated:
+        session_cart = SessionCart(request)
+        session_cart.remove(cart_id)
+        messages.success(request, "Product removed from cart.")
+        return session_cart.save(redirect('store:cart'))
     cart_item = get_object_or_404(Cart, id=cart_id, user=request.user)
     cart_item.delete()
     messages.success(request, "Product removed from cart.")
     return redirect('store:cart')
 
-@login_required
 def plus_cart(request, cart_id):
+    if not request.user.is_authenticated:
+        session_cart = SessionCart(request)
+        if cart_id in session_cart.items:
+            session_cart.add(cart_id)
+        return session_cart.save(redirect('store:cart'))
     cart_item = get_object_or_404(Cart, id=cart_id, user=request.user)
     cart_item.quantity += 1
     cart_item.save()
     return redirect('store:cart')
 
-@login_required
 def minus_cart(request, cart_id):
+    if not request.user.is_authenticated:
+        session_cart = SessionCart(request)
+        if cart_id in session_cart.items:
+            session_cart.add(cart_id, -1)
+        return session_cart.save(redirect('store:cart'))
     cart_item = get_object_or_404(Cart, id=cart_id, user=request.user)
     if cart_item.quantity == 1:
         cart_item.delete()
@@ -264,22 +487,157 @@ def remove_address(request, id):
     return redirect('store:profile')
 @login_required
 def order_receipt(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)  # Added security check
-    
-    # Calculate the total for this order
-    total_price = order.quantity * order.product.price
-    
-    order_items = [{
-        'product': order.product,
-        'quantity': order.quantity,
-        'total_price': total_price  # Fixed calculation
-    }]
-    
-    # If Order model doesn't have total_amount field, calculate it
-    if not hasattr(order, 'total_amount'):
-        order.total_amount = total_price
-    
+    # the header and then all of its lines with their products
+    order = get_object_or_404(
+        Order.objects.select_related('user', 'address').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        ),
+        id=order_id,
+        user=request.user,  # Added security check
+    )
     return render(request, 'store/order_receipt.html', {
         'order': order,
-        'order_items': order_items
-    })
\ No newline at end of file
+        'order_items': order.items.all()
+    })
+
+
+# ---------- CART API ----------
+# Small JSON endpoints used by cart.html and detail.html (static/js/cart.js):
+# each call does one write and answers with the touched line and the new
+# totals instead of redirecting through the full cart page. Anonymous
+# visitors get the same API over their cookie cart (store.session_cart).
+
+def _read_int(request, name, default=None):
+    try:
+        return int(request.POST.get(name, default))
+    except (TypeError, ValueError):
+        return None
+
+
+def _totals_payload(summary):
+    return {
+        'count': summary.count,
+        'amount': str(summary.amount),
+        'shipping': str(summary.shipping),
+        'total': str(summary.total),
+    }
+
+
+def _cart_payload(user, cart_id=None):
+    """Totals in one aggregate query, plus the touched line if it still exists."""
+    totals = cart_totals(user)
+    set_cart_count(user, totals['count'])
+
+    line = None
+    if cart_id is not None:
+        line = cart_lines(user).filter(id=cart_id).values(
+            'id', 'product_id', 'quantity', 'line_total'
+        ).first()
+        if line is not None:
+            line['line_total'] = str(line['line_total'])
+
+    return JsonResponse({
+        'line': line,
+        'cart': _totals_payload(CartSummary(None, totals['count'], totals['amount'])),
+    })
+
+
+def _session_cart_payload(session_cart, product_id=None):
+    """Same shape as _cart_payload for the anonymous cookie cart."""
+    summary = session_cart_summary(session_cart)
+    line = next((line for line in summary.lines if line.id == product_id), None)
+    if line is not None:
+        line = {
+            'id': line.id,
+            'product_id': line.id,
+            'quantity': line.quantity,
+            'line_total': str(line.line_total),
+        }
+    response = JsonResponse({
+        'line': line,
+        'cart': _totals_payload(summary),
+    })
+    return session_cart.save(response)
+
+
+@require_GET
+def cart_api_summary(request):
+    if not request.user.is_authenticated:
+        return _session_cart_payload(SessionCart(request))
+    return _cart_payload(request.user)
+
+
+# Cached catalog pages are shared, so they neither hold a CSRF token nor set
+# the cookie; the cart script asks for one here before its first POST.
+@never_cache
+@require_GET
+def cart_api_token(request):
+    return JsonResponse({'token': get_token(request)})
+
+
+@require_POST
+def cart_api_add(request):
+    product_id = _read_int(request, 'product_id')
+    quantity = _read_int(request, 'quantity', 1)
+    if product_id is None or quantity is None or quantity < 1:
+        return JsonResponse({'error': 'Invalid product or quantity.'}, status=400)
+    if not Product.objects.filter(id=product_id, is_active=True).exists():
+        return JsonResponse({'error': 'Product not found.'}, status=404)
+
+    if not request.user.is_authenticated:
+        session_cart = SessionCart(request)
+        session_cart.add(product_id, quantity)
+        return _session_cart_payload(session_cart, product_id)
+
+    # get_or_create() retries the lookup when a concurrent add wins the
+    # unique (user, product) constraint, so both adds land on one line
+    line, created = Cart.objects.get_or_create(
+        user=request.user, product_id=product_id, defaults={'quantity': quantity},
+    )
+    if not created:
+        Cart.objects.filter(id=line.id).update(quantity=F('quantity') + quantity)
+    return _cart_payload(request.user, line.id)
+
+
+@require_POST
+def cart_api_quantity(request, cart_id):
+    """Set the quantity (?quantity=) or change it by ?delta=; 0 removes the line."""
+    if 'delta' in request.POST:
+        delta = _read_int(request, 'delta')
+        if delta is None:
+            return JsonResponse({'error': 'Invalid delta.'}, status=400)
+    else:
+        quantity = _read_int(request, 'quantity')
+        if quantity is None or quantity < 0:
+            return JsonResponse({'error': 'Invalid quantity.'}, status=400)
+
+    if not request.user.is_authenticated:
+        session_cart = SessionCart(request)
+        if cart_id in session_cart.items:
+            if 'delta' in request.POST:
+                session_cart.add(cart_id, delta)
+            else:
+                session_cart.set(cart_id, quantity)
+        return _session_cart_payload(session_cart, cart_id)
+
+    line = Cart.objects.filter(id=cart_id, user=request.user)
+    if 'delta' in request.POST:
+        # a single UPDATE, unless the line would drop to zero
+        if not line.filter(quantity__gt=-delta).update(quantity=F('quantity') + delta):
+            line.delete()
+    elif quantity == 0:
+        line.delete()
+    else:
+        line.update(quantity=quantity)
+    return _cart_payload(request.user, cart_id)
+
+
+@require_POST
+def cart_api_remove(request, cart_id):
+    if not request.user.is_authenticated:
+        session_cart = SessionCart(request)
+        session_cart.remove(cart_id)
+        return _session_cart_payload(session_cart)
+
+    Cart.objects.filter(id=cart_id, user=request.user).delete()
+    return _cart_payload(request.user)